@@ -1,4 +1,5 @@
 const express = require('express');
+const axios = require('axios');
 const Rating = require('../models/Rating');
 const Movie = require('../models/Movie');
 const Song = require('../models/Song');
@@ -8,6 +9,20 @@ const auth = require('../middleware/auth');
 
 const router = express.Router();
 
+const ML_API_URL = process.env.ML_API_URL || 'http://localhost:8000';
+
+// Push a rating change to the ML API's in-memory ratings matrix (fire and forget)
+function notifyMlApi(userId, contentType, contentId, rating) {
+  axios.post(`${ML_API_URL}/api/ratings/events`, {
+    userId: String(userId),
+    contentType,
+    contentId: String(contentId),
+    rating
+  }, { timeout: 2000 }).catch((error) => {
+    console.error('ML API rating event error:', error.message);
+  });
+}
+
 // Helper function to update content average rating
 async function updateContentRating(contentType, contentId) {
   const ratings = await Rating.find({ contentType, contentId });
@@ -77,6 +92,8 @@ router.post('/', auth, async (req, res) => {
     // Update content average rating
     await updateContentRating(contentType, contentId);
 
+    notifyMlApi(req.user._id, contentType, contentId, rating);
+
     res.json(userRating);
   } catch (error) {
     console.error('Create rating error:', error);
@@ -125,6 +142,8 @@ router.delete('/:contentType/:contentId', auth, async (req, res) => {
     // Update content average rating
     await updateContentRating(contentType, contentId);
 
+    notifyMlApi(req.user._id, contentType, contentId, null);
+
     res.json({ message: 'Rating deleted' });
   } catch (error) {
     console.error('Delete rating error:', error);
@@ -0,0 +1,243 @@
+"""
+ALS Factors
+Memory-mapped user and item factors exported by spark/recommendations.py, so a
+user's collaborative scores are one matrix-vector product over the item factors
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+import numpy as np
+
+from ann_index import ANN_FILTER_FRACTION, ANN_MIN_ITEMS, IVFIndex
+from ratings_matrix import item_key
+from scoring import top_k
+
+CURRENT_FILE = 'CURRENT'
+
+logger = logging.getLogger(__name__)
+
+
+class FactorExport:
+    """One exported version: item rows are grouped by content type, so each type is a contiguous slice"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.path = path
+        self.version = manifest['version']
+        self.rank = manifest['rank']
+        self.reg_param = manifest['regParam']
+        self.generated_at = manifest['generatedAt']
+        self.type_offsets = {ct: tuple(bounds) for ct, bounds in manifest['typeOffsets'].items()}
+
+        self.item_factors = np.load(os.path.join(path, 'item_factors.npy'), mmap_mode='r')
+        self.item_ids = np.load(os.path.join(path, 'item_ids.npy'), mmap_mode='r')
+        self.user_factors = np.load(os.path.join(path, 'user_factors.npy'), mmap_mode='r')
+        user_ids = np.load(os.path.join(path, 'user_ids.npy'), mmap_mode='r')
+
+        self.item_row: Dict[str, int] = {}
+        for content_type, (start, end) in self.type_offsets.items():
+            for row, item_id in enumerate(self.item_ids[start:end].tolist(), start):
+                self.item_row[item_key(content_type, item_id)] = row
+        self.user_row: Dict[str, int] = {user_id: row for row, user_id in enumerate(user_ids.tolist())}
+        self._indexes: Dict[str, Optional[IVFIndex]] = {}
+        self._index_lock = threading.Lock()
+        self._model_rows: Dict[str, tuple] = {}
+
+    def build_indexes(self):
+        """Build every content type's IVF index now, so no request pays for the k-means"""
+        for content_type in self.type_offsets:
+            self.candidate_index(content_type)
+
+    def candidate_index(self, content_type: str) -> Optional[IVFIndex]:
+        """IVF index over one content type's item factors, built on first use; None for small catalogs"""
+        if content_type not in self._indexes:
+            with self._index_lock:
+                if content_type not in self._indexes:
+                    start, end = self.type_offsets[content_type]
+                    self._indexes[content_type] = \
+                        IVFIndex(self.item_factors[start:end]) if end - start >= ANN_MIN_ITEMS else None
+        return self._indexes[content_type]
+
+    def allowed_rows(self, model, allowed: np.ndarray) -> np.ndarray:
+        """A content model row mask as a mask over its content type's factor rows
+
+        Items the content model doesn't know have no metadata and are left out.
+        The row alignment is computed once per model.
+        """
+        content_type = model.content_type
+        start, end = self.type_offsets.get(content_type, (0, 0))
+        cached = self._model_rows.get(content_type)
+        if cached is None or cached[0] is not model:
+            rows = np.fromiter((self.item_row.get(item_key(content_type, item_id), -1) for item_id in model.item_ids),
+                               dtype=np.int64, count=len(model.item_ids))
+            cached = self._model_rows[content_type] = (model, rows)
+        rows = cached[1]
+        mask = np.zeros(end - start, dtype=bool)
+        mask[rows[allowed & (rows >= 0)] - start] = True
+        return mask
+
+    def fold_in(self, ratings: Iterable[tuple]) -> Optional[np.ndarray]:
+        """Factor for a user from (contentType, contentId, rating) against the fixed item factors
+
+        Solves the same regularised least squares as one ALS user step.
+        """
+        rows, values = [], []
+        for content_type, content_id, rating in ratings:
+            row = self.item_row.get(item_key(content_type, content_id))
+            if row is not None:
+                rows.append(row)
+                values.append(rating)
+        if not rows:
+            return None
+        factors = np.asarray(self.item_factors[np.asarray(rows)], dtype=np.float64)
+        gram = factors.T @ factors + self.reg_param * len(rows) * np.eye(self.rank)
+        return np.linalg.solve(gram, factors.T @ np.asarray(values, dtype=np.float64)).astype(np.float32)
+
+
+class ALSFactors:
+    """Follows the exported factors in ALS_FACTORS_DIR (disabled when unset)
+
+    The Spark job writes each version to its own directory and then replaces
+    the CURRENT file, which is re-read at most every check_interval seconds.
+    A new version is loaded, IVF indexes included, on a background thread
+    while requests keep using the previous one; reload() loads inline.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: Optional[float] = None):
+        self.path = path if path is not None else os.getenv("ALS_FACTORS_DIR", "")
+        if check_interval is None:
+            check_interval = float(os.getenv("ALS_FACTORS_CHECK_SECONDS", 30))
+        self.check_interval = check_interval
+        self._export: Optional[FactorExport] = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+        self._loading = False
+        self._stats = {'loads': 0, 'storedVectors': 0, 'foldIns': 0, 'noFactors': 0, 'approximate': 0}
+
+    def current(self) -> Optional[FactorExport]:
+        """Latest loaded export, or None when none has been loaded yet"""
+        if not self.path or time.monotonic() - self._checked_at < self.check_interval:
+            return self._export
+        self._checked_at = time.monotonic()
+        if self._pending_version() is not None:
+            self._load_in_background()
+        return self._export
+
+    def reload(self) -> Optional[FactorExport]:
+        """Re-read the CURRENT pointer and load a new version now (startup and /api/models/refresh)"""
+        if not self.path:
+            return None
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version_dir = self._pending_version()
+            if version_dir is not None:
+                self._load(version_dir)
+        return self._export
+
+    def _pending_version(self) -> Optional[str]:
+        """The version directory CURRENT names, if it isn't the loaded one"""
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE), encoding='utf-8') as f:
+                version_dir = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if self._export is not None and os.path.basename(self._export.path) == version_dir:
+            return None
+        return version_dir
+
+    def _load(self, version_dir: str):
+        export = FactorExport(os.path.join(self.path, version_dir))
+        export.build_indexes()
+        self._export = export
+        self._stats['loads'] += 1
+
+    def _load_in_background(self):
+        if self._loading:
+            return
+        self._loading = True
+
+        def run():
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Loading ALS factors failed; serving the previous version")
+            finally:
+                self._loading = False
+
+        threading.Thread(target=run, name='als-factors-load', daemon=True).start()
+
+    def available(self) -> bool:
+        return self.current() is not None
+
+    def user_vector(self, user_id: str, ratings: Iterable[tuple], rated_since_export: bool) -> Optional[np.ndarray]:
+        """Stored factor for known users; fold-in for new users or users who rated since the export"""
+        export = self.current()
+        if export is None:
+            return None
+        row = export.user_row.get(str(user_id))
+        if row is not None and not rated_since_export:
+            self._stats['storedVectors'] += 1
+            return np.asarray(export.user_factors[row])
+        vector = export.fold_in(ratings)
+        self._stats['foldIns' if vector is not None else 'noFactors'] += 1
+        return vector
+
+    def collaborative_scores(self, user_id: str, content_type: str, ratings: Iterable[tuple],
+                             exclude_ids: Set[str], limit: int, rated_since_export: bool = False,
+                             allowed: Optional[np.ndarray] = None,
+                             vector: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """Predicted ratings of the best `limit` unrated items of one content type
+
+        allowed (see allowed_rows) restricts the items before top-k selection.
+        Callers scoring several content types pass the user's `vector` once.
+        """
+        export = self.current()
+        if export is None or content_type not in export.type_offsets:
+            return {}
+        if vector is None:
+            vector = self.user_vector(user_id, ratings, rated_since_export)
+        if vector is None:
+            return {}
+
+        start, end = export.type_offsets[content_type]
+        excluded = [export.item_row.get(item_key(content_type, item_id)) for item_id in exclude_ids]
+        excluded = set(row - start for row in excluded if row is not None)
+
+        # Large catalogs: exact scores for the IVF candidates only, unless a
+        # selective filter leaves fewer items than the candidates would be
+        index = export.candidate_index(content_type)
+        allowed_count = int(allowed.sum()) if allowed is not None else end - start
+        if index is not None and allowed_count > ANN_FILTER_FRACTION * (end - start):
+            self._stats['approximate'] += 1
+            rows, scores = index.search(export.item_factors[start:end], vector, limit + len(excluded),
+                                        allowed=allowed)
+            kept = [(i, score) for i, score in zip(rows.tolist(), scores.tolist()) if i not in excluded and score > 0]
+            return {str(export.item_ids[start + i]): float(score) for i, score in kept[:limit]}
+
+        exclude = np.zeros(end - start, dtype=bool)
+        exclude[list(excluded)] = True
+        if allowed is not None:
+            # Score only the allowed rows
+            rows = np.flatnonzero(allowed & ~exclude)
+            scores = np.asarray(export.item_factors[start + rows]) @ vector if len(rows) else np.zeros(0)
+            return {str(export.item_ids[start + rows[i]]): float(scores[i]) for i in top_k(scores, limit)}
+        scores = export.item_factors[start:end] @ vector
+        return {str(export.item_ids[start + i]): float(scores[i]) for i in top_k(scores, limit, exclude)}
+
+    def stats(self) -> dict:
+        export = self._export
+        return {
+            **self._stats,
+            'enabled': bool(self.path),
+            'version': export.version if export else None,
+            'generatedAt': export.generated_at if export else None,
+            'items': int(export.item_factors.shape[0]) if export else 0,
+            'users': len(export.user_row) if export else 0,
+            'rank': export.rank if export else None,
+        }
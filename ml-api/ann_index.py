@@ -0,0 +1,103 @@
+"""
+Approximate Candidate Index
+Inverted-file (IVF) index over item vectors for the first retrieval stage: a
+request scores a few hundred to a few thousand candidates exactly instead of
+the whole catalog
+"""
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Catalogs smaller than this are scored exactly; the full pass is already cheap
+ANN_MIN_ITEMS = int(os.getenv("ANN_MIN_ITEMS", 50000))
+ANN_PROBES = int(os.getenv("ANN_PROBES", 32))
+# Filters that leave at most this fraction of a catalog are scored exactly over what they leave
+ANN_FILTER_FRACTION = float(os.getenv("ANN_FILTER_FRACTION", 0.1))
+
+
+def augment(vectors: np.ndarray, max_norm: float) -> np.ndarray:
+    """Scale by the largest norm and add sqrt(1 - |x|^2), so all items have unit norm
+
+    A query padded with 0 then has the same dot product with every item as
+    before, and ranking by dot product becomes ranking by angle.
+    """
+    scaled = np.asarray(vectors, dtype=np.float32) / max_norm
+    extra = np.sqrt(np.maximum(0.0, 1.0 - np.einsum('ij,ij->i', scaled, scaled)))
+    return np.hstack([scaled, extra[:, None].astype(np.float32)])
+
+
+class IVFIndex:
+    """Spherical k-means lists for maximum inner product search
+
+    Every item belongs to the list of its nearest centroid (in the augmented
+    space); a query probes the lists whose centroids score best against it and
+    only their members are scored exactly. Members are stored grouped by list,
+    so a list is one contiguous slice of `members`.
+    """
+
+    def __init__(self, vectors: np.ndarray, n_lists: Optional[int] = None, iterations: int = 10,
+                 sample_per_list: int = 64, block_rows: int = 65536, seed: int = 0):
+        n_items = len(vectors)
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_items))
+        n_lists = max(1, min(n_lists, n_items))
+        norms = np.linalg.norm(np.asarray(vectors, dtype=np.float32), axis=1)
+        self.max_norm = float(norms.max()) if n_items and norms.max() > 0 else 1.0
+
+        # k-means on a sample, then one pass over every item to assign lists
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n_items, min(n_items, n_lists * sample_per_list), replace=False))
+        sample = augment(vectors[sample_rows], self.max_norm)
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty lists keep their old centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        assignment = np.empty(n_items, dtype=np.int32)
+        for start in range(0, n_items, block_rows):
+            block = augment(vectors[start:start + block_rows], self.max_norm)
+            assignment[start:start + block_rows] = np.argmax(block @ centroids.T, axis=1)
+
+        self.centroids = centroids[:, :-1]
+        self.members = np.argsort(assignment, kind='stable').astype(np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.centroids.nbytes + self.members.nbytes + self.offsets.nbytes
+
+    def candidates(self, query: np.ndarray, probes: int = ANN_PROBES) -> np.ndarray:
+        """Members of the `probes` lists whose centroids score best against the query"""
+        # The query's augmented coordinate is 0, so the centroids' last one drops out
+        scores = self.centroids @ np.asarray(query, dtype=np.float32)
+        probes = min(probes, self.n_lists)
+        lists = np.argpartition(scores, -probes)[-probes:]
+        return np.concatenate([self.members[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, limit: int, probes: int = ANN_PROBES,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Candidates re-scored exactly against `vectors`: the best `limit` (rows, scores), best first
+
+        Candidates outside the `allowed` row mask are dropped before scoring.
+        """
+        rows = np.sort(self.candidates(query, probes))
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        if len(rows) == 0:
+            return rows.astype(np.int64), np.zeros(0, dtype=np.float32)
+        scores = np.asarray(vectors[rows], dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+        if len(rows) > limit:
+            best = np.argpartition(scores, -limit)[-limit:]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return rows[order].astype(np.int64), scores[order]
@@ -0,0 +1,323 @@
+"""
+Shared Artifacts
+Content models (TF-IDF rows, neighbour, metadata and popularity indexes) and the ratings
+matrix built once by a builder process and written as .npy files that every API
+worker memory-maps read-only, so N workers share one copy through the page
+cache. A GENERATION file names the current build and is replaced atomically;
+workers re-read it and swap without a restart.
+
+    python artifacts.py            # build whenever ratings or a catalog change
+    python artifacts.py --once     # offline build, e.g. before a deploy
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Optional
+
+import numpy as np
+from scipy import sparse
+
+from content_model import COLLECTION_MAP, ContentModel, ContentModelCache
+from metadata_index import MetadataIndex
+from popularity import PopularityRanking
+from ratings_matrix import RatingsMatrix
+from similarity_index import TopKIndex
+
+logger = logging.getLogger(__name__)
+
+GENERATION_FILE = 'GENERATION'
+KEEP_GENERATIONS = 2
+
+
+def artifact_dir() -> str:
+    return os.getenv("ML_ARTIFACT_DIR", "artifacts")
+
+
+def save_csr(path: str, name: str, matrix):
+    """Write the three CSR/CSC arrays of a sparse matrix"""
+    np.save(os.path.join(path, f'{name}_data.npy'), matrix.data)
+    np.save(os.path.join(path, f'{name}_indices.npy'), matrix.indices)
+    np.save(os.path.join(path, f'{name}_indptr.npy'), matrix.indptr)
+
+
+def load_csr(path: str, name: str, shape: tuple, fmt=sparse.csr_matrix):
+    """Sparse matrix over memory-mapped arrays; nothing is copied into the process"""
+    arrays = (np.load(os.path.join(path, f'{name}_{part}.npy'), mmap_mode='r')
+              for part in ('data', 'indices', 'indptr'))
+    return fmt(tuple(arrays), shape=tuple(shape), copy=False)
+
+
+def write_meta(path: str, meta: dict):
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+
+def read_meta(path: str) -> dict:
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_metadata_index(path: str, index: MetadataIndex):
+    """Each field's postings as sorted terms, concatenated rows and offsets"""
+    np.save(os.path.join(path, 'years.npy'), index.years)
+    for field, postings in index.postings.items():
+        terms = sorted(postings)
+        lengths = [len(postings[term]) for term in terms]
+        np.save(os.path.join(path, f'{field}_terms.npy'), np.asarray(terms, dtype=str))
+        np.save(os.path.join(path, f'{field}_offsets.npy'), np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]))
+        np.save(os.path.join(path, f'{field}_rows.npy'),
+                np.concatenate([postings[term] for term in terms]) if terms else np.zeros(0, dtype=np.int32))
+
+
+def load_metadata_index(path: str, fields: list) -> MetadataIndex:
+    years = np.load(os.path.join(path, 'years.npy'), mmap_mode='r')
+    postings = {}
+    for field in fields:
+        terms = np.load(os.path.join(path, f'{field}_terms.npy')).tolist()
+        offsets = np.load(os.path.join(path, f'{field}_offsets.npy'))
+        rows = np.load(os.path.join(path, f'{field}_rows.npy'), mmap_mode='r')
+        postings[field] = {term: rows[offsets[i]:offsets[i + 1]] for i, term in enumerate(terms)}
+    return MetadataIndex(len(years), postings, years)
+
+
+def save_content_model(path: str, model: ContentModel):
+    os.makedirs(path)
+    np.save(os.path.join(path, 'item_ids.npy'), np.asarray(model.item_ids, dtype=str))
+    save_csr(path, 'neighbors', model.neighbors.matrix)
+    save_csr(path, 'tfidf', sparse.csr_matrix(model.tfidf_matrix, dtype=np.float32))
+    if model.metadata is not None:
+        save_metadata_index(path, model.metadata)
+    if model.popularity is not None:
+        np.save(os.path.join(path, 'popular_rows.npy'), model.popularity.rows)
+        np.save(os.path.join(path, 'popular_scores.npy'), model.popularity.scores)
+    write_meta(path, {
+        'metadataFields': list(model.metadata.postings) if model.metadata is not None else None,
+        'popularity': model.popularity is not None,
+        'contentType': model.content_type,
+        'k': model.neighbors.k,
+        'neighborsShape': model.neighbors.matrix.shape,
+        'tfidfShape': model.tfidf_matrix.shape,
+        'watermark': [model.watermark[0], str(model.watermark[1])],
+        'fingerprint': model.fingerprint,
+        'builtAt': model.built_at,
+    })
+
+
+def load_content_model(path: str) -> ContentModel:
+    """ContentModel over the mapped arrays; there is no vectorizer, workers never fit"""
+    meta = read_meta(path)
+    item_ids = np.load(os.path.join(path, 'item_ids.npy'), mmap_mode='r').tolist()
+    neighbors = TopKIndex(load_csr(path, 'neighbors', meta['neighborsShape']), meta['k'])
+    metadata = load_metadata_index(path, meta['metadataFields']) if meta.get('metadataFields') is not None else None
+    popularity = None
+    if meta.get('popularity'):
+        popularity = PopularityRanking(np.load(os.path.join(path, 'popular_rows.npy'), mmap_mode='r'),
+                                       np.load(os.path.join(path, 'popular_scores.npy'), mmap_mode='r'))
+    model = ContentModel(meta['contentType'], item_ids, None, load_csr(path, 'tfidf', meta['tfidfShape']),
+                         neighbors, tuple(meta['watermark']), metadata, popularity, meta.get('fingerprint'))
+    model.built_at = meta['builtAt']
+    return model
+
+
+def save_ratings_matrix(path: str, ratings_matrix: RatingsMatrix, loaded_at: float):
+    os.makedirs(path)
+    np.save(os.path.join(path, 'user_ids.npy'), np.asarray(ratings_matrix.user_ids, dtype=str))
+    np.save(os.path.join(path, 'item_ids.npy'), np.asarray(ratings_matrix.item_ids, dtype=str))
+    np.save(os.path.join(path, 'item_types.npy'), ratings_matrix.item_types)
+    save_csr(path, 'csr', ratings_matrix._csr)
+    save_csr(path, 'csc', ratings_matrix._csc)
+    write_meta(path, {'shape': ratings_matrix._csr.shape, 'loadedAt': loaded_at})
+
+
+def load_ratings_arrays(path: str) -> dict:
+    """Id lists and mapped base matrices for RatingsMatrix.attach"""
+    meta = read_meta(path)
+    return {
+        'user_ids': np.load(os.path.join(path, 'user_ids.npy'), mmap_mode='r').tolist(),
+        'item_ids': np.load(os.path.join(path, 'item_ids.npy'), mmap_mode='r').tolist(),
+        'item_types': np.load(os.path.join(path, 'item_types.npy'), mmap_mode='r'),
+        'csr': load_csr(path, 'csr', meta['shape']),
+        'csc': load_csr(path, 'csc', meta['shape'], sparse.csc_matrix),
+        'loaded_at': meta['loadedAt'],
+    }
+
+
+def read_generation(root: str) -> Optional[int]:
+    try:
+        with open(os.path.join(root, GENERATION_FILE), encoding='utf-8') as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def generation_path(root: str, generation: int) -> str:
+    return os.path.join(root, f'gen-{generation}')
+
+
+class ArtifactBuilder:
+    """Builds content models and the ratings matrix and publishes them as generations
+
+    Runs in one process (see serve.py); catalogs whose fitted fields didn't change
+    reuse the fitted model, the ratings matrix is reloaded when db.ratings changed.
+    """
+
+    def __init__(self, db, root: Optional[str] = None):
+        self.db = db
+        self.root = root or artifact_dir()
+        self.content_models = ContentModelCache(db, check_interval=0)
+        self.ratings_matrix = RatingsMatrix(db)
+        self._watermark = None
+
+    def watermark(self) -> tuple:
+        """Ratings count and latest updatedAt plus every content model's fingerprint
+
+        Checking the models refits the ones whose fitted fields changed; the
+        catalogs' updatedAt alone moves with every rating.
+        """
+        latest = list(self.db.ratings.find({}, {'updatedAt': 1}).sort('updatedAt', -1).limit(1))
+        ratings = (self.db.ratings.estimated_document_count(), latest[0].get('updatedAt') if latest else None)
+        models = [self.content_models.check(ct) for ct in COLLECTION_MAP]
+        return (ratings,) + tuple(model.fingerprint if model is not None else None for model in models)
+
+    def build(self) -> int:
+        """Write a new generation, then point GENERATION at it"""
+        started = time.perf_counter()
+        watermark = self.watermark()
+        generation = (read_generation(self.root) or 0) + 1
+        path = generation_path(self.root, generation)
+        staging = path + '.tmp'
+        for stale in (path, staging):
+            shutil.rmtree(stale, ignore_errors=True)
+        os.makedirs(staging)
+
+        for content_type in COLLECTION_MAP:
+            model = self.content_models.check(content_type)
+            if model is not None:
+                save_content_model(os.path.join(staging, f'content-{content_type}'), model)
+        loaded_at = time.time()
+        self.ratings_matrix.load()
+        save_ratings_matrix(os.path.join(staging, 'ratings'), self.ratings_matrix, loaded_at)
+
+        os.rename(staging, path)
+        pointer = os.path.join(self.root, GENERATION_FILE + '.tmp')
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(str(generation))
+        os.replace(pointer, os.path.join(self.root, GENERATION_FILE))
+        self._watermark = watermark
+        self.prune(generation)
+        logger.info("Published artifact generation %d in %.2fs", generation, time.perf_counter() - started)
+        return generation
+
+    def prune(self, generation: int):
+        """Keep the last KEEP_GENERATIONS; workers still mapping an older one keep their open files"""
+        for name in os.listdir(self.root):
+            if name.startswith('gen-') and not name.endswith('.tmp'):
+                number = int(name[len('gen-'):])
+                if number <= generation - KEEP_GENERATIONS:
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def run(self, interval: float, stop=None):
+        """Publish a generation whenever the watermark moves, checking every `interval` seconds"""
+        os.makedirs(self.root, exist_ok=True)
+        while stop is None or not stop.is_set():
+            try:
+                if self._watermark is None or self.watermark() != self._watermark:
+                    self.build()
+            except Exception:
+                logger.exception("Artifact build failed")
+            time.sleep(interval)
+
+
+class SharedArtifacts:
+    """Worker-side view of the builder's output in ML_ARTIFACT_DIR (default ./artifacts)
+
+    GENERATION is re-read at most every check_interval seconds; a new number
+    drops the mapped models so the next lookup maps the new generation.
+    """
+
+    def __init__(self, root: Optional[str] = None, check_interval: Optional[float] = None):
+        self.root = root or artifact_dir()
+        if check_interval is None:
+            check_interval = float(os.getenv("ML_GENERATION_CHECK_SECONDS", 2))
+        self.check_interval = check_interval
+        self._generation: Optional[int] = None
+        self._checked_at = float('-inf')
+        self._models: Dict[str, Optional[ContentModel]] = {}
+        self._stats = {'swaps': 0}
+
+    def generation(self) -> Optional[int]:
+        """Current generation number, None until the builder published one"""
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return self._generation
+        self._checked_at = time.monotonic()
+        generation = read_generation(self.root)
+        if generation != self._generation:
+            self._models = {}
+            self._generation = generation
+            self._stats['swaps'] += 1
+        return self._generation
+
+    def reload(self) -> Optional[int]:
+        """Re-read GENERATION now instead of waiting for the next check"""
+        self._checked_at = float('-inf')
+        return self.generation()
+
+    def content_model(self, content_type: str) -> Optional[ContentModel]:
+        generation = self.generation()
+        if generation is None:
+            return None
+        models = self._models
+        if content_type not in models:
+            path = os.path.join(generation_path(self.root, generation), f'content-{content_type}')
+            models[content_type] = load_content_model(path) if os.path.isdir(path) else None
+        return models[content_type]
+
+    def ratings_arrays(self) -> Optional[dict]:
+        generation = self.generation()
+        if generation is None:
+            return None
+        arrays = load_ratings_arrays(os.path.join(generation_path(self.root, generation), 'ratings'))
+        arrays['generation'] = generation
+        return arrays
+
+    def wait(self, timeout: float) -> bool:
+        """Block until the builder has published a generation"""
+        deadline = time.monotonic() + timeout
+        while self.reload() is None:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.5)
+        return True
+
+    def stats(self) -> dict:
+        return {**self._stats, 'root': self.root, 'generation': self._generation}
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--artifact-dir', default=artifact_dir())
+    parser.add_argument('--interval', type=float, default=float(os.getenv("ML_BUILD_INTERVAL_SECONDS", 30)),
+                        help='seconds between change checks')
+    parser.add_argument('--once', action='store_true', help='publish one generation and exit')
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/recohub")).recohub
+    builder = ArtifactBuilder(db, args.artifact_dir)
+    if args.once:
+        os.makedirs(args.artifact_dir, exist_ok=True)
+        print(f"generation {builder.build()}")
+    else:
+        builder.run(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Two-stage Retrieval Benchmark
+Recall@k and latency of IVF candidate generation plus re-ranking against exact
+scoring over the whole catalog, for the ALS stage alone and the full hybrid
+
+Usage:
+    python benchmarks/bench_ann.py --items 20000 100000 1000000 --queries 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import ANN_PROBES, IVFIndex  # noqa: E402
+from bench_content_scoring import BenchModel  # noqa: E402
+from scoring import content_candidates, content_scores, merge_hybrid, rated_rows, rerank_candidates, top_k  # noqa: E402
+from similarity_index import DEFAULT_TOP_K, TopKIndex  # noqa: E402
+
+
+def synthetic_factors(n_items: int, n_users: int, rank: int = 16, seed: int = 0):
+    """ALS-like factors: a shared positive direction plus noise, popular items with larger norms"""
+    rng = np.random.default_rng(seed)
+    bias = np.full(rank, 1.0 / np.sqrt(rank), dtype=np.float32)
+    items = (bias + rng.normal(0, 0.5, (n_items, rank))).astype(np.float32)
+    items *= rng.lognormal(0, 0.3, (n_items, 1)).astype(np.float32)
+    users = (bias + rng.normal(0, 0.5, (n_users, rank))).astype(np.float32)
+    return items, users
+
+
+def synthetic_neighbors(n_items: int, k: int = DEFAULT_TOP_K, seed: int = 0) -> TopKIndex:
+    """Random top-k neighbour lists; building the real index is O(N^2) and only its shape matters here"""
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, n_items, (n_items, k)).astype(np.int32)
+    scores = rng.random((n_items, k)).astype(np.float32)
+    matrix = sparse.csr_matrix((scores.ravel(), indices.ravel(), np.arange(0, n_items * k + 1, k)),
+                               shape=(n_items, n_items))
+    matrix.sum_duplicates()
+    return TopKIndex(matrix, k)
+
+
+def recall(approximate, exact) -> float:
+    return len(set(approximate) & set(exact)) / len(exact) if len(exact) else 1.0
+
+
+def bench_als(items: np.ndarray, users: np.ndarray, ks, lists: int, probes: int) -> dict:
+    """ALS stage alone: IVF candidates re-scored exactly vs a full matrix-vector product"""
+    started = time.perf_counter()
+    index = IVFIndex(items, n_lists=lists)
+    build_seconds = time.perf_counter() - started
+
+    limit = max(ks)
+    recalls = {k: [] for k in ks}
+    exact_seconds = approx_seconds = 0.0
+    candidates = 0
+    for user in users:
+        started = time.perf_counter()
+        exact = top_k(items @ user, limit)
+        exact_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        rows, _ = index.search(items, user, limit, probes)
+        approx_seconds += time.perf_counter() - started
+        candidates += len(index.candidates(user, probes))
+        for k in ks:
+            recalls[k].append(recall(rows[:k].tolist(), exact[:k].tolist()))
+
+    return {
+        'buildSeconds': build_seconds,
+        'indexMb': index.nbytes / 1e6,
+        'lists': index.n_lists,
+        'candidates': candidates / len(users),
+        'exactMs': exact_seconds / len(users) * 1000,
+        'approxMs': approx_seconds / len(users) * 1000,
+        **{f'recall@{k}': float(np.mean(values)) for k, values in recalls.items()},
+    }
+
+
+def bench_hybrid(items: np.ndarray, users: np.ndarray, k: int, lists: int, probes: int,
+                 rated_per_user: int, seed: int = 0) -> dict:
+    """Full pipeline: hybrid top-k of both stages + re-rank vs merge_hybrid over every item"""
+    n_items = len(items)
+    rng = np.random.default_rng(seed)
+    item_ids = [f'item{i}' for i in range(n_items)]
+    model = BenchModel(item_ids, None, synthetic_neighbors(n_items, seed=seed))
+    index = IVFIndex(items, n_lists=lists)
+    collab_limit = max(k * 5, 100)
+
+    recalls = []
+    exact_seconds = approx_seconds = 0.0
+    for user in users:
+        rated = rng.choice(n_items, rated_per_user, replace=False)
+        rows, weights = rated_rows(model, [item_ids[i] for i in rated], rng.integers(1, 6, rated_per_user))
+        excluded = set(rows.tolist())
+
+        started = time.perf_counter()
+        scores = items @ user
+        exclude = np.zeros(n_items, dtype=bool)
+        exclude[rows] = True
+        collab = {item_ids[i]: float(scores[i]) for i in top_k(scores, collab_limit, exclude)}
+        exact = merge_hybrid(content_scores(model, rows, weights), collab, model, rows, k)
+        exact_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        candidate_rows, candidate_scores = index.search(items, user, collab_limit + len(excluded), probes)
+        collab = {
+            item_ids[i]: float(score) for i, score in zip(candidate_rows.tolist(), candidate_scores.tolist())
+            if i not in excluded and score > 0
+        }
+        content_idx, content_vals = content_candidates(model, rows, weights)
+        approximate = rerank_candidates(content_idx, content_vals, collab, model, rows, k)
+        approx_seconds += time.perf_counter() - started
+
+        recalls.append(recall([i for i, _ in approximate], [i for i, _ in exact]))
+
+    return {
+        'exactMs': exact_seconds / len(users) * 1000,
+        'approxMs': approx_seconds / len(users) * 1000,
+        f'recall@{k}': float(np.mean(recalls)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, nargs='+', default=[20000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--rank', type=int, default=16)
+    parser.add_argument('--ks', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--lists', type=int, help='IVF lists (default sqrt(items))')
+    parser.add_argument('--probes', type=int, default=ANN_PROBES)
+    parser.add_argument('--rated', type=int, default=20, help='ratings per user in the hybrid run')
+    parser.add_argument('--skip-hybrid', action='store_true')
+    args = parser.parse_args()
+
+    for n_items in args.items:
+        items, users = synthetic_factors(n_items, args.queries, args.rank)
+        als = bench_als(items, users, args.ks, args.lists, args.probes)
+        recalls = '  '.join(f"recall@{k} {als[f'recall@{k}']:.3f}" for k in args.ks)
+        print(f"{n_items:>9} items  ALS    exact {als['exactMs']:7.2f} ms  two-stage {als['approxMs']:7.2f} ms  "
+              f"{recalls}  ({als['candidates']:.0f} candidates, {als['lists']} lists, "
+              f"index {als['indexMb']:.1f} MB built in {als['buildSeconds']:.2f} s)")
+        if not args.skip_hybrid:
+            k = min(args.ks)
+            hybrid = bench_hybrid(items, users, k, args.lists, args.probes, args.rated)
+            print(f"{n_items:>9} items  hybrid exact {hybrid['exactMs']:7.2f} ms  two-stage "
+                  f"{hybrid['approxMs']:7.2f} ms  recall@{k} {hybrid[f'recall@{k}']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Concurrency Load Test
+Fires /api/trending calls while a cold /api/recommendations call (content model
+build + scoring) is in flight, and reports how long trending calls waited
+
+Usage:
+    python benchmarks/bench_concurrency.py --items 5000 --trending-clients 2
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+from fake_db import attach, seed_database
+
+
+async def trending_client(client, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get('/api/trending/movie', params={'limit': 10})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    db, user_ids, _ = seed_database(items_per_type=args.items, users=args.users, ratings=args.ratings)
+    main = attach(db)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        # Idle trending latency for comparison (mongomock itself is slow)
+        idle = []
+        for _ in range(5):
+            started = time.perf_counter()
+            (await client.get('/api/trending/movie', params={'limit': 10})).raise_for_status()
+            idle.append(time.perf_counter() - started)
+
+        stop = asyncio.Event()
+        latencies = []
+        clients = [asyncio.create_task(trending_client(client, stop, latencies))
+                   for _ in range(args.trending_clients)]
+
+        started = time.perf_counter()
+        response = await client.post('/api/recommendations', json={
+            'userId': user_ids[0], 'contentType': 'movie', 'limit': 10
+        })
+        response.raise_for_status()
+        recommendation_seconds = time.perf_counter() - started
+
+        stop.set()
+        await asyncio.gather(*clients)
+
+    latencies_ms = np.asarray(latencies) * 1000
+    print(f"idle /api/trending p50: {np.percentile(np.asarray(idle) * 1000, 50):.1f} ms")
+    print(f"cold /api/recommendations: {recommendation_seconds * 1000:.0f} ms")
+    if len(latencies_ms) == 0:
+        print("no /api/trending call completed while it ran: the event loop was blocked")
+        return
+    print(f"/api/trending calls completed meanwhile: {len(latencies_ms)}")
+    print(f"/api/trending p50 {np.percentile(latencies_ms, 50):.1f} ms, "
+          f"p99 {np.percentile(latencies_ms, 99):.1f} ms, max {latencies_ms.max():.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000, help='catalog size per content type')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--ratings', type=int, default=20000)
+    parser.add_argument('--trending-clients', type=int, default=2)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
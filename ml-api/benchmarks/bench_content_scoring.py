@@ -0,0 +1,95 @@
+"""
+Content Scoring Micro-benchmark
+Original per-item Python loop vs the batched sparse product for users with
+10, 100 and 1000 ratings
+
+Usage:
+    python benchmarks/bench_content_scoring.py --items 20000 --ratings 10 100 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_similarity_index import synthetic_tfidf  # noqa: E402
+from scoring import content_scores, exclusion_mask, rated_rows, top_k  # noqa: E402
+from similarity_index import build_topk_index  # noqa: E402
+
+
+class BenchModel:
+    """Minimal stand-in for ContentModel"""
+
+    def __init__(self, item_ids, tfidf_matrix, neighbors):
+        self.item_ids = item_ids
+        self.id_to_index = {item_id: i for i, item_id in enumerate(item_ids)}
+        self.tfidf_matrix = tfidf_matrix
+        self.neighbors = neighbors
+
+
+def legacy_scores(model, rated, max_rows):
+    """The original loop: list.index, list membership and a pass over every item per rating
+
+    Dense similarity rows are computed on demand so the benchmark doesn't need
+    the N x N matrix; only the first max_rows ratings are timed.
+    """
+    item_ids = model.item_ids
+    rated_item_ids = [item_id for item_id, _ in rated]
+    content = {}
+    for rated_id, rating in rated[:max_rows]:
+        if rated_id in item_ids:
+            idx = item_ids.index(rated_id)
+            similarity_scores = (model.tfidf_matrix[idx] @ model.tfidf_matrix.T).toarray().ravel()
+            for i, item_id in enumerate(item_ids):
+                if item_id not in rated_item_ids:
+                    if item_id not in content:
+                        content[item_id] = 0
+                    content[item_id] += similarity_scores[i] * rating
+    return sorted(content.items(), key=lambda x: x[1], reverse=True)[:10]
+
+
+def vectorized_scores(model, rated):
+    """The batched path used by /api/recommendations"""
+    rows, weights = rated_rows(model, [r[0] for r in rated], [r[1] for r in rated])
+    scores = content_scores(model, rows, weights)
+    return top_k(scores, 10, exclusion_mask(len(model.item_ids), rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--ratings', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--legacy-rows', type=int, default=3,
+                        help='ratings timed for the legacy loop; the rest is extrapolated')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    X = synthetic_tfidf(args.items)
+    item_ids = [f"{i:024x}" for i in range(args.items)]
+    model = BenchModel(item_ids, X, build_topk_index(X))
+    rng = np.random.default_rng(0)
+
+    print(f"{'ratings':>8} {'legacy ms':>12} {'vectorized ms':>14} {'speedup':>9}")
+    for n_ratings in args.ratings:
+        picks = rng.choice(args.items, size=n_ratings, replace=False)
+        rated = [(item_ids[i], float(rng.integers(1, 6))) for i in picks]
+
+        timed_rows = min(args.legacy_rows, n_ratings)
+        started = time.perf_counter()
+        legacy_scores(model, rated, timed_rows)
+        legacy_ms = (time.perf_counter() - started) * 1000 * n_ratings / timed_rows
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            vectorized_scores(model, rated)
+        vectorized_ms = (time.perf_counter() - started) * 1000 / args.repeat
+
+        print(f"{n_ratings:>8} {legacy_ms:>12.1f} {vectorized_ms:>14.3f} {legacy_ms / vectorized_ms:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
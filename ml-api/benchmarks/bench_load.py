@@ -0,0 +1,212 @@
+"""
+Load Benchmark
+Drives every ml-api endpoint at fixed concurrency against a seeded mongomock
+database and reports throughput, p50/p95/p99 latency and peak RSS. Results can
+be saved as a JSON baseline and later runs compared against it.
+
+Usage:
+    python benchmarks/bench_load.py --ratings 100000 --save baselines/100k.json
+    python benchmarks/bench_load.py --ratings 100000 --compare baselines/100k.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from fake_db import attach, seed_database
+
+# Dataset presets: ratings -> (items per type, users)
+SIZES = {
+    1000: (200, 100),
+    10000: (1000, 1000),
+    100000: (5000, 10000),
+    1000000: (20000, 50000),
+}
+
+
+def dataset_size(ratings: int):
+    """(items per type, users) of the preset for `ratings`, else of the nearest smaller preset"""
+    smaller = [preset for preset in SIZES if preset <= ratings]
+    return SIZES[max(smaller) if smaller else min(SIZES)]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def workloads(rnd: random.Random, user_ids: list, item_ids: dict):
+    """Endpoint name -> function returning the next (method, path, json body)"""
+    content_types = list(item_ids)
+
+    def recommendation():
+        return {'userId': rnd.choice(user_ids), 'contentType': rnd.choice(content_types), 'limit': 10}
+
+    def similar():
+        content_type = rnd.choice(content_types)
+        return ('POST', '/api/similar', {
+            'contentId': rnd.choice(item_ids[content_type]), 'contentType': content_type, 'limit': 10
+        })
+
+    def rating_event():
+        content_type = rnd.choice(content_types)
+        return ('POST', '/api/ratings/events', {
+            'userId': rnd.choice(user_ids), 'contentType': content_type,
+            'contentId': rnd.choice(item_ids[content_type]), 'rating': rnd.randint(1, 5)
+        })
+
+    return {
+        'root': lambda: ('GET', '/', None),
+        'recommendations': lambda: ('POST', '/api/recommendations', recommendation()),
+        'batch': lambda: ('POST', '/api/recommendations/batch', {
+            'requests': [recommendation() for _ in range(8)]
+        }),
+        'multiType': lambda: ('POST', '/api/recommendations/types', {
+            'userId': rnd.choice(user_ids), 'contentTypes': content_types, 'limit': 10
+        }),
+        'similar': similar,
+        'trending': lambda: ('GET', f"/api/trending/{rnd.choice(content_types)}?limit=10", None),
+        'ratingEvents': rating_event,
+        'ready': lambda: ('GET', '/api/ready', None),
+        'metrics': lambda: ('GET', '/api/metrics', None),
+        'prometheus': lambda: ('GET', '/metrics', None),
+    }
+
+
+async def send(client, request) -> float:
+    method, path, body = request
+    started = time.perf_counter()
+    response = await client.request(method, path, json=body)
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run_endpoint(client, next_request, requests: int, concurrency: int) -> dict:
+    """Issue `requests` calls with `concurrency` in flight and summarise the latencies"""
+    cold_ms = await send(client, next_request()) * 1000
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            latencies.append(await send(client, next_request()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'requests': requests,
+        'throughput': round(requests / elapsed, 2),
+        'p50': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95': round(float(np.percentile(latencies_ms, 95)), 3),
+        'p99': round(float(np.percentile(latencies_ms, 99)), 3),
+        'coldMs': round(cold_ms, 3),
+        'peakRssMb': round(peak_rss_mb(), 1),
+    }
+
+
+async def run(args) -> dict:
+    items, users = dataset_size(args.ratings)
+    items, users = args.items or items, args.users or users
+    started = time.perf_counter()
+    db, user_ids, item_ids = seed_database(items_per_type=items, users=users, ratings=args.ratings, seed=args.seed)
+    seed_seconds = time.perf_counter() - started
+
+    main = attach(db)
+    if not args.cache:
+        # Measure the work itself, not cache hits on repeated parameters
+        from result_cache import LRUBackend, ResultCache
+        main.result_cache = ResultCache(LRUBackend(), ttls={name: 0 for name in ('recommendations', 'similar', 'trending')})
+
+    rnd = random.Random(args.seed)
+    endpoints = workloads(rnd, user_ids, item_ids)
+    selected = args.endpoints or list(endpoints)
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        for name in selected:
+            if name == 'ready' and not main.readiness['ready']:
+                # ASGITransport doesn't run the lifespan, so run its warm-up before probing readiness
+                await main.warm_up()
+            results[name] = await run_endpoint(client, endpoints[name], args.requests, args.concurrency)
+            print(format_row(name, results[name]), flush=True)
+
+    return {
+        'config': {
+            'ratings': args.ratings, 'itemsPerType': items, 'users': users, 'seed': args.seed,
+            'requests': args.requests, 'concurrency': args.concurrency, 'cache': args.cache,
+        },
+        'environment': {'python': platform.python_version(), 'machine': platform.machine()},
+        'seedSeconds': round(seed_seconds, 2),
+        'peakRssMb': round(peak_rss_mb(), 1),
+        'endpoints': results,
+    }
+
+
+def format_row(name: str, r: dict) -> str:
+    return (f"{name:<16} {r['throughput']:>9.1f} req/s  p50 {r['p50']:>8.2f} ms  p95 {r['p95']:>8.2f} ms  "
+            f"p99 {r['p99']:>8.2f} ms  cold {r['coldMs']:>8.1f} ms  rss {r['peakRssMb']:>7.1f} MB")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> bool:
+    """Print per-endpoint changes against a baseline; False if any p99 or throughput regressed"""
+    if baseline.get('config') != report['config']:
+        print("warning: baseline was recorded with a different configuration")
+    ok = True
+    print(f"\n{'endpoint':<16} {'p99 change':>11} {'throughput change':>18}")
+    for name, result in report['endpoints'].items():
+        old = baseline.get('endpoints', {}).get(name)
+        if old is None:
+            print(f"{name:<16} {'(new)':>11}")
+            continue
+        p99_change = (result['p99'] - old['p99']) / old['p99'] if old['p99'] else 0.0
+        throughput_change = (result['throughput'] - old['throughput']) / old['throughput'] if old['throughput'] else 0.0
+        regressed = p99_change > tolerance or throughput_change < -tolerance
+        ok &= not regressed
+        print(f"{name:<16} {p99_change:>+10.1%} {throughput_change:>+17.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ratings', type=int, default=10000, help=f"ratings to seed; presets: {sorted(SIZES)} (other counts use the nearest smaller preset's sizes)")
+    parser.add_argument('--items', type=int, help='catalog size per content type (overrides the preset)')
+    parser.add_argument('--users', type=int, help='number of users (overrides the preset)')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoints', nargs='+', help='subset of endpoints to drive')
+    parser.add_argument('--cache', action='store_true', help='keep the result cache enabled')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative p99/throughput regression')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(f"peak RSS {report['peakRssMb']:.1f} MB (seeding took {report['seedSeconds']} s)")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Multi-type Recommendation Benchmark
+One /api/recommendations/types call against four sequential /api/recommendations
+calls (one per content type) for the same users, with the result cache bypassed
+
+Usage:
+    python benchmarks/bench_multi_type.py --items 5000 --users 2000 --ratings 50000 --requests 50
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+import numpy as np
+
+from fake_db import attach, seed_database
+
+
+async def timed_post(client, path: str, body: dict):
+    started = time.perf_counter()
+    response = await client.post(path, json=body)
+    response.raise_for_status()
+    return time.perf_counter() - started, response.json()
+
+
+async def sequential(client, user_id: str, content_types: list, limit: int):
+    """What the homepage does today: one call per content type, one after another"""
+    started = time.perf_counter()
+    results = {}
+    for content_type in content_types:
+        _, body = await timed_post(client, '/api/recommendations',
+                                   {'userId': user_id, 'contentType': content_type, 'limit': limit})
+        results[content_type] = [item['_id'] for item in body['recommendations']]
+    return time.perf_counter() - started, results
+
+
+async def multi_type(client, user_id: str, content_types: list, limit: int):
+    seconds, body = await timed_post(client, '/api/recommendations/types',
+                                     {'userId': user_id, 'contentTypes': content_types, 'limit': limit})
+    return seconds, {
+        content_type: [item['_id'] for item in result['recommendations']]
+        for content_type, result in body['results'].items()
+    }
+
+
+def summary(name: str, seconds: list) -> str:
+    ms = np.asarray(seconds) * 1000
+    return (f"{name:<28} p50 {np.percentile(ms, 50):8.1f} ms  p95 {np.percentile(ms, 95):8.1f} ms  "
+            f"mean {ms.mean():8.1f} ms")
+
+
+async def run(args):
+    db, user_ids, _ = seed_database(items_per_type=args.items, users=args.users, ratings=args.ratings)
+    main = attach(db)
+    # Measure the work itself, not cache hits on repeated parameters
+    from content_model import COLLECTION_MAP
+    from result_cache import LRUBackend, ResultCache
+    from workers import MODEL_WORKERS
+    main.result_cache = ResultCache(LRUBackend(), ttls={name: 0 for name in ('recommendations', 'similar', 'trending')})
+    content_types = list(COLLECTION_MAP)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        # Build every content model and the ratings matrix before timing
+        await multi_type(client, str(user_ids[0]), content_types, args.limit)
+
+        users = random.Random(args.seed).sample([str(u) for u in user_ids], min(args.requests, len(user_ids)))
+        sequential_seconds, multi_seconds = [], []
+        mismatches = 0
+        for user_id in users:
+            seconds, expected = await sequential(client, user_id, content_types, args.limit)
+            sequential_seconds.append(seconds)
+            seconds, results = await multi_type(client, user_id, content_types, args.limit)
+            multi_seconds.append(seconds)
+            mismatches += results != expected
+
+    print(f"{len(users)} users x {len(content_types)} content types, {args.items} items per type, "
+          f"{args.ratings} ratings, ML_MODEL_WORKERS={MODEL_WORKERS}")
+    print(summary(f"{len(content_types)} sequential calls", sequential_seconds))
+    print(summary("one multi-type call", multi_seconds))
+    print(f"speedup (mean): {np.mean(sequential_seconds) / np.mean(multi_seconds):.2f}x, "
+          f"users with different results: {mismatches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000, help='catalog size per content type')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--ratings', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=50, help='users to time')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
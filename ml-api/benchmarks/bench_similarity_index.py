@@ -0,0 +1,99 @@
+"""
+Similarity Index Benchmark
+Memory and latency of the blocked top-k neighbour index vs the dense N x N matrix
+
+Usage:
+    python benchmarks/bench_similarity_index.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity_index import build_topk_index, block_rows_for_budget  # noqa: E402
+
+
+def synthetic_tfidf(n_items: int, n_features: int = 100, terms_per_item: int = 8, seed: int = 0):
+    """Random L2-normalised sparse matrix shaped like the API's TF-IDF output"""
+    rng = np.random.default_rng(seed)
+    rows = np.repeat(np.arange(n_items), terms_per_item)
+    # Zipf-like term popularity, as in real catalogs
+    cols = np.minimum(rng.zipf(1.3, size=n_items * terms_per_item) - 1, n_features - 1)
+    vals = rng.random(n_items * terms_per_item).astype(np.float32)
+    matrix = sparse.csr_matrix((vals, (rows, cols)), shape=(n_items, n_features), dtype=np.float32)
+    matrix.sum_duplicates()
+    return normalize(matrix)
+
+
+def bench_size(n_items: int, k: int, block_mb: int, full_build_limit: int, queries: int) -> dict:
+    """Build (or sample-build) the index for one catalog size and time lookups"""
+    X = synthetic_tfidf(n_items)
+    block_rows = block_rows_for_budget(n_items, block_mb)
+    full_build = n_items <= full_build_limit
+    row_limit = None if full_build else block_rows * 2
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = build_topk_index(X, k=k, block_mb=block_mb, row_limit=row_limit)
+    build_seconds = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if not full_build:
+        # Extrapolate build time from the sampled blocks and size the full index
+        build_seconds = build_seconds * n_items / index.size
+        nnz_per_row = index.matrix.nnz / max(index.size, 1)
+        index_bytes = int(n_items * nnz_per_row * 8 + (n_items + 1) * 8)
+        lookup_rows = index.size
+    else:
+        index_bytes = index.nbytes
+        lookup_rows = n_items
+
+    rng = np.random.default_rng(1)
+    ids = rng.integers(0, lookup_rows, size=queries)
+    started = time.perf_counter()
+    for idx in ids:
+        index.neighbors(int(idx), 10)
+    query_us = (time.perf_counter() - started) / queries * 1e6
+
+    return {
+        'items': n_items,
+        'k': k,
+        'blockRows': block_rows,
+        'fullBuild': full_build,
+        'buildSeconds': round(build_seconds, 2),
+        'peakBuildMB': round(peak_bytes / 1024 / 1024, 1),
+        'indexMB': round(index_bytes / 1024 / 1024, 1),
+        'denseMatrixMB': round(n_items * n_items * 8 / 1024 / 1024, 1),
+        'queryMicros': round(query_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--block-mb', type=int, default=64)
+    parser.add_argument('--full-build-limit', type=int, default=100000,
+                        help='larger catalogs time two blocks and extrapolate the build')
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'items':>9} {'build s':>9} {'peak MB':>8} {'index MB':>9} {'dense MB':>10} {'query us':>9}")
+    for n_items in args.sizes:
+        result = bench_size(n_items, args.k, args.block_mb, args.full_build_limit, args.queries)
+        marker = '' if result['fullBuild'] else ' (extrapolated)'
+        print(f"{result['items']:>9} {result['buildSeconds']:>9} {result['peakBuildMB']:>8} "
+              f"{result['indexMB']:>9} {result['denseMatrixMB']:>10} {result['queryMicros']:>9}{marker}")
+
+
+if __name__ == "__main__":
+    main()
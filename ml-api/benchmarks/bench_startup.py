@@ -0,0 +1,129 @@
+"""
+Startup Benchmark
+Import time of main.py and time until /api/ready, in fresh interpreters, for a
+worker that fits its own models (build) and one that maps prebuilt artifacts
+(attach), plus the first request after ready
+
+Usage:
+    python benchmarks/bench_startup.py --items 5000 --runs 3
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.dirname(BENCH_DIR)
+
+
+def child(mode: str, items: int, users: int, ratings: int):
+    """One cold start; prints a JSON line"""
+    started = time.perf_counter()
+    sys.path.insert(0, API_DIR)
+    import main
+    import_seconds = time.perf_counter() - started
+    sklearn_at_import = 'sklearn' in sys.modules
+
+    sys.path.insert(0, BENCH_DIR)
+    from fake_db import attach, seed_database
+    from fastapi.testclient import TestClient
+
+    db, user_ids, item_ids = seed_database(items_per_type=items, users=users, ratings=ratings)
+    attach(db)
+    if mode == 'attach':
+        # The offline build step of a deploy, not part of startup
+        from artifacts import ArtifactBuilder
+        ArtifactBuilder(db, main.shared_artifacts.root).build()
+
+    started = time.perf_counter()
+    with TestClient(main.app) as client:
+        while client.get('/api/ready').status_code != 200:
+            if main.readiness['error']:
+                raise RuntimeError(main.readiness['error'])
+            time.sleep(0.01)
+        ready_seconds = time.perf_counter() - started
+
+        first = {}
+        for name, path, body in (
+            ('recommendations', '/api/recommendations', {'userId': str(user_ids[0]), 'contentType': 'movie'}),
+            ('similar', '/api/similar', {'contentId': item_ids['book'][0], 'contentType': 'book'}),
+        ):
+            started = time.perf_counter()
+            client.post(path, json=body).raise_for_status()
+            first[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    print(json.dumps({
+        'importSeconds': round(import_seconds, 3),
+        'readySeconds': round(ready_seconds, 3),
+        'firstRequestMs': first,
+        'sklearnAtImport': sklearn_at_import,
+    }))
+
+
+def import_breakdown(top: int) -> list:
+    """Slowest modules imported directly by main.py, from python -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=API_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)', line)
+        # Two spaces of indentation: imported by main itself
+        if match and len(match.group(2)) == 2:
+            rows.append((int(match.group(1)) / 1e6, match.group(3)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run_child(mode: str, args, artifact_dir: str) -> dict:
+    env = dict(os.environ, ML_ARTIFACT_MODE=mode, ML_ARTIFACT_DIR=artifact_dir, ML_CREATE_INDEXES='0')
+    result = subprocess.run(
+        [sys.executable, __file__, '--child', mode, '--items', str(args.items),
+         '--users', str(args.users), '--ratings', str(args.ratings)],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000, help='catalog size per content type')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--ratings', type=int, default=50000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', default=['build', 'attach'])
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.items, args.users, args.ratings)
+        return
+
+    print("slowest imports of main.py:")
+    breakdown = import_breakdown(8)
+    for seconds, module in breakdown:
+        print(f"  {module:<24} {seconds * 1000:8.1f} ms")
+
+    results = {}
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as artifact_dir:
+                runs.append(run_child(mode, args, artifact_dir))
+        results[mode] = runs
+        best = min(runs, key=lambda r: r['importSeconds'] + r['readySeconds'])
+        print(f"{mode:<7} import {best['importSeconds']:6.2f} s  ready {best['readySeconds']:6.2f} s  "
+              f"first recommendation {best['firstRequestMs']['recommendations']:7.1f} ms  "
+              f"first similar {best['firstRequestMs']['similar']:7.1f} ms  sklearn at import: {best['sklearnAtImport']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'imports': breakdown, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
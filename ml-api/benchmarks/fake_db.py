@@ -0,0 +1,83 @@
+"""
+Benchmark Database
+Seeds an in-process mongomock database with synthetic catalogs and ratings
+and points the ml-api module at it (benchmarks only; needs `pip install mongomock`)
+"""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mongomock  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+CATALOGS = {'movie': 'movies', 'song': 'songs', 'book': 'books', 'series': 'series'}
+GENRES = ['action', 'drama', 'comedy', 'horror', 'romance', 'sci-fi', 'thriller', 'fantasy',
+          'jazz', 'rock', 'pop', 'classical', 'mystery', 'biography', 'history', 'animation']
+WORDS = ['space', 'love', 'war', 'family', 'music', 'crime', 'mystery', 'robot', 'ocean', 'city',
+         'journey', 'secret', 'kingdom', 'detective', 'summer', 'island', 'future', 'ghost',
+         'friendship', 'revenge', 'dream', 'empire', 'storm', 'heart', 'night', 'river']
+
+
+def seed_database(items_per_type: int = 1000, users: int = 500, ratings: int = 10000, seed: int = 0):
+    """Return (db, user_ids, item_ids_by_type) for a freshly seeded mongomock database"""
+    rnd = random.Random(seed)
+    db = mongomock.MongoClient().recohub
+    now = datetime.utcnow()
+
+    item_ids = {}
+    for content_type, collection in CATALOGS.items():
+        docs = []
+        for i in range(items_per_type):
+            docs.append({
+                '_id': ObjectId(),
+                'title': f"{content_type} {i}",
+                'description': ' '.join(rnd.sample(WORDS, 6)),
+                'genres': rnd.sample(GENRES, 2),
+                'artist': f"artist {i % 97}",
+                'album': f"album {i % 211}",
+                'author': f"author {i % 131}",
+                'releaseYear': 1970 + i % 55,
+                'averageRating': round(rnd.uniform(1, 5), 1),
+                'ratingCount': rnd.randint(0, 5000),
+                'updatedAt': now,
+            })
+        db[collection].insert_many(docs)
+        item_ids[content_type] = [doc['_id'] for doc in docs]
+
+    user_ids = [ObjectId() for _ in range(users)]
+    seen = set()
+    docs = []
+    for _ in range(ratings):
+        user_id = rnd.choice(user_ids)
+        content_type = rnd.choice(list(CATALOGS))
+        # Skewed item popularity so users overlap like real traffic
+        content_id = item_ids[content_type][int(rnd.paretovariate(1.2)) % items_per_type]
+        if (user_id, content_id) in seen:
+            continue
+        seen.add((user_id, content_id))
+        created = now - timedelta(hours=rnd.randint(0, 24 * 90))
+        docs.append({
+            'userId': user_id,
+            'contentType': content_type,
+            'contentId': content_id,
+            'rating': rnd.randint(1, 5),
+            'createdAt': created,
+            'updatedAt': created,
+        })
+    if docs:
+        db.ratings.insert_many(docs)
+    return db, [str(u) for u in user_ids], {ct: [str(i) for i in ids] for ct, ids in item_ids.items()}
+
+
+def attach(db):
+    """Import ml-api's main module and rebind it and its shared state to db"""
+    import main
+
+    main.db = db
+    for state in (main.content_models, main.ratings_matrix, main.precomputed, main.trending):
+        state.db = db
+    return main
@@ -0,0 +1,254 @@
+"""
+Content Model Cache
+Keeps one fitted TF-IDF model per content type in memory and refits it only
+when the fields it reads change; rating traffic only re-ranks popularity
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from metadata_index import MetadataIndex, build_metadata_index
+from popularity import PopularityRanking, build_popularity
+from similarity_index import TopKIndex, build_topk_index
+
+COLLECTION_MAP = {
+    'movie': 'movies',
+    'song': 'songs',
+    'book': 'books',
+    'series': 'series'
+}
+
+# Fields the frontend's content cards render; everything else stays in Mongo
+CARD_FIELDS = {
+    'title': 1, 'genres': 1, 'averageRating': 1, 'ratingCount': 1, 'releaseYear': 1,
+    'artist': 1, 'album': 1, 'author': 1, 'posterUrl': 1, 'imageUrl': 1, 'coverUrl': 1
+}
+
+# Fields needed to build the feature text, the metadata index and the popularity
+# ranking, so catalog scans skip everything else
+CONTENT_FIELDS = {
+    'title': 1, 'description': 1, 'genres': 1, 'artist': 1, 'album': 1, 'author': 1,
+    'releaseYear': 1, 'publishYear': 1, 'averageRating': 1
+}
+
+# Written by the backend on every rating; a change only re-ranks popularity
+RANKING_FIELDS = ('averageRating',)
+
+logger = logging.getLogger(__name__)
+
+
+def build_item_text(item: dict, content_type: str) -> str:
+    """Combine genres, description and type-specific fields into one document"""
+    genres = ' '.join(item.get('genres', []) or [])
+    description = item.get('description', '') or item.get('title', '')
+
+    if content_type == 'song':
+        # For songs, also include artist and album
+        artist = item.get('artist', '')
+        album = item.get('album', '')
+        return f"{genres} {description} {artist} {album}"
+    if content_type == 'book':
+        # For books, include author
+        author = item.get('author', '')
+        return f"{genres} {description} {author}"
+    return f"{genres} {description}"
+
+
+def catalog_fingerprint(items: List[dict]) -> str:
+    """Hash of every field the TF-IDF and metadata indexes read, in catalog order"""
+    digest = hashlib.blake2b(digest_size=16)
+    for item in items:
+        fields = sorted((field, value) for field, value in item.items() if field not in RANKING_FIELDS)
+        digest.update(repr(fields).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ContentModel:
+    """Fitted TF-IDF model, top-k neighbour index, metadata index and popularity ranking for one content type"""
+
+    def __init__(self, content_type: str, item_ids: List[str], vectorizer, tfidf_matrix,
+                 neighbors: TopKIndex, watermark: tuple, metadata: Optional[MetadataIndex] = None,
+                 popularity: Optional[PopularityRanking] = None, fingerprint: Optional[str] = None):
+        self.content_type = content_type
+        self.item_ids = item_ids
+        self.id_to_index = {item_id: i for i, item_id in enumerate(item_ids)}
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.neighbors = neighbors
+        self.metadata = metadata
+        self.popularity = popularity
+        self.watermark = watermark
+        self.fingerprint = fingerprint
+        self.built_at = time.time()
+
+
+class ContentModelCache:
+    """Per content type model cache with watermark-based invalidation
+
+    The cheap watermark (count / latest updatedAt) only says that something
+    may have changed. The backend bumps updatedAt on every rating, so a moved
+    watermark re-reads the catalog and compares the fingerprint of the fitted
+    fields: a match re-ranks popularity, anything else refits. Checks run in
+    a background thread while requests keep using the current model.
+
+    With `artifacts` (a SharedArtifacts, see artifacts.py) models are mapped from
+    the builder's current generation instead of being fitted in this process.
+    """
+
+    def __init__(self, db, check_interval: Optional[float] = None, artifacts=None):
+        self.db = db
+        self.artifacts = artifacts
+        if check_interval is None:
+            check_interval = float(os.getenv("CONTENT_MODEL_CHECK_SECONDS", 30))
+        self.check_interval = check_interval
+        self._models: Dict[str, ContentModel] = {}
+        self._last_checked: Dict[str, float] = {}
+        self._locks = {content_type: threading.Lock() for content_type in COLLECTION_MAP}
+        self._checking = set()
+        self._stats = {'hits': 0, 'misses': 0, 'rebuilds': 0, 'rebuildSeconds': 0.0, 'rankingRefreshes': 0}
+
+    def catalog_watermark(self, content_type: str) -> tuple:
+        """Cheap fingerprint of a catalog: document count plus latest updatedAt"""
+        collection = self.db[COLLECTION_MAP[content_type]]
+        count = collection.estimated_document_count()
+        latest = list(collection.find({}, {'updatedAt': 1}).sort('updatedAt', -1).limit(1))
+        updated_at = latest[0].get('updatedAt') if latest else None
+        return count, updated_at
+
+    def get(self, content_type: str) -> Optional[ContentModel]:
+        """Return the cached model; a due check runs in the background"""
+        if content_type not in COLLECTION_MAP:
+            return None
+        if self.artifacts is not None:
+            return self._attached(content_type)
+
+        model = self._models.get(content_type)
+        due = time.time() - self._last_checked.get(content_type, 0) >= self.check_interval
+        if model is None:
+            # Nothing to serve yet: the first build runs inline
+            self._stats['misses'] += 1
+            return self.check(content_type) if due else None
+        self._stats['hits'] += 1
+        if due:
+            self._check_in_background(content_type)
+        return model
+
+    def check(self, content_type: str) -> Optional[ContentModel]:
+        """Compare the catalog with the current model and refresh it now if it changed"""
+        with self._locks[content_type]:
+            self._last_checked[content_type] = time.time()
+            model = self._models.get(content_type)
+            watermark = self.catalog_watermark(content_type)
+            if model is not None and model.watermark == watermark:
+                return model
+
+            items = self._read_catalog(content_type)
+            fingerprint = catalog_fingerprint(items)
+            if model is not None and model.fingerprint == fingerprint:
+                # Only ratings moved: same rows, new averageRating order
+                model.popularity = build_popularity(items)
+                model.watermark = watermark
+                self._stats['rankingRefreshes'] += 1
+                return model
+            return self._rebuild(content_type, watermark, items, fingerprint)
+
+    def _check_in_background(self, content_type: str):
+        if content_type in self._checking:
+            return
+        self._checking.add(content_type)
+        self._last_checked[content_type] = time.time()
+
+        def run():
+            try:
+                self.check(content_type)
+            except Exception:
+                logger.exception("Content model check failed for %s; serving the previous model", content_type)
+            finally:
+                self._checking.discard(content_type)
+
+        threading.Thread(target=run, name=f'content-model-{content_type}', daemon=True).start()
+
+    def refresh(self, content_type: Optional[str] = None) -> List[str]:
+        """Force a rebuild of one or all content types"""
+        content_types = [content_type] if content_type else list(COLLECTION_MAP)
+        if self.artifacts is not None:
+            # Workers can't build; pick up the builder's latest generation instead
+            self.artifacts.reload()
+            return [ct for ct in content_types if self._attached(ct) is not None]
+        rebuilt = []
+        for ct in content_types:
+            with self._locks[ct]:
+                if self._rebuild(ct, self.catalog_watermark(ct)) is not None:
+                    rebuilt.append(ct)
+                self._last_checked[ct] = time.time()
+        return rebuilt
+
+    def _attached(self, content_type: str) -> Optional[ContentModel]:
+        model = self.artifacts.content_model(content_type)
+        if model is None:
+            self._models.pop(content_type, None)
+            self._stats['misses'] += 1
+        else:
+            self._models[content_type] = model
+            self._stats['hits'] += 1
+        return model
+
+    def _read_catalog(self, content_type: str) -> List[dict]:
+        return list(self.db[COLLECTION_MAP[content_type]].find({}, CONTENT_FIELDS))
+
+    def _rebuild(self, content_type: str, watermark: tuple, items: Optional[List[dict]] = None,
+                 fingerprint: Optional[str] = None) -> Optional[ContentModel]:
+        """Fit TF-IDF over the whole catalog, index neighbours and swap the new model in"""
+        # Imported here: sklearn is the slowest import and only needed to fit
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        started = time.perf_counter()
+        if items is None:
+            items = self._read_catalog(content_type)
+            fingerprint = catalog_fingerprint(items)
+        item_ids = [str(item['_id']) for item in items]
+        texts = [build_item_text(item, content_type) for item in items]
+
+        if not texts:
+            self._models.pop(content_type, None)
+            return None
+
+        vectorizer = TfidfVectorizer(max_features=100, stop_words='english')
+        try:
+            tfidf_matrix = vectorizer.fit_transform(texts)
+        except ValueError:
+            # Empty vocabulary (e.g. only stop words)
+            self._models.pop(content_type, None)
+            return None
+
+        neighbors = build_topk_index(tfidf_matrix)
+        model = ContentModel(content_type, item_ids, vectorizer, tfidf_matrix,
+                             neighbors, watermark, build_metadata_index(items), build_popularity(items),
+                             fingerprint)
+        self._models[content_type] = model
+        self._stats['rebuilds'] += 1
+        self._stats['rebuildSeconds'] += time.perf_counter() - started
+        return model
+
+    def stats(self) -> dict:
+        """Hit/miss/rebuild counters and per content type model info"""
+        lookups = self._stats['hits'] + self._stats['misses']
+        return {
+            **self._stats,
+            'hitRatio': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+            'models': {
+                content_type: {
+                    'items': len(model.item_ids),
+                    'indexBytes': model.neighbors.nbytes,
+                    'metadataBytes': model.metadata.nbytes if model.metadata is not None else 0,
+                    'popularityBytes': model.popularity.nbytes if model.popularity is not None else 0,
+                    'builtAt': model.built_at,
+                    'watermarkCount': model.watermark[0],
+                }
+                for content_type, model in self._models.items()
+            }
+        }
@@ -0,0 +1,178 @@
+"""
+Mongo Indexes
+The indexes ml-api's queries depend on, verified (and created) at startup, and
+an explain() diagnostics command over every query shape:
+
+    python indexes.py --explain
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import Dict, List, Optional
+
+from content_model import COLLECTION_MAP
+
+logger = logging.getLogger(__name__)
+
+CATALOGS = list(COLLECTION_MAP.values())
+
+# (collection, key spec, purpose)
+REQUIRED_INDEXES = [
+    # Covers the per-user rating reads: filter on userId (+ contentType), return contentId and rating
+    ('ratings', [('userId', 1), ('contentType', 1), ('contentId', 1), ('rating', 1)], 'user ratings (covered)'),
+    ('ratings', [('updatedAt', -1)], 'artifact builder watermark'),
+] + [
+    index
+    for collection in CATALOGS
+    for index in (
+        (collection, [('updatedAt', -1)], 'content model watermark'),
+        (collection, [('ratingCount', -1), ('averageRating', -1)], 'trending evergreen list'),
+        (collection, [('averageRating', -1)], 'popular fallback'),
+    )
+]
+
+# Projections for the per-user rating reads; without _id they are answered from the index alone
+USER_RATING_FIELDS = {'_id': 0, 'contentId': 1, 'rating': 1}
+BATCH_RATING_FIELDS = {'_id': 0, 'userId': 1, 'contentType': 1, 'contentId': 1, 'rating': 1}
+
+
+def index_exists(collection, keys: list) -> bool:
+    """True if an index with exactly this key spec exists"""
+    def normalized(spec):
+        return [(field, direction if isinstance(direction, str) else int(direction)) for field, direction in spec]
+
+    wanted = normalized(keys)
+    return any(normalized(info['key']) == wanted for info in collection.index_information().values())
+
+
+def ensure_indexes(db, create: Optional[bool] = None, extra: Optional[list] = None) -> Dict[str, List[str]]:
+    """Check every required index; create the missing ones unless ML_CREATE_INDEXES=0
+
+    Returns {'present': [...], 'created': [...], 'missing': [...]} with
+    'collection: keys' labels, and logs a warning for anything still missing.
+    """
+    if create is None:
+        create = os.getenv("ML_CREATE_INDEXES", "1") == '1'
+    report = {'present': [], 'created': [], 'missing': []}
+    for collection_name, keys, purpose in REQUIRED_INDEXES + (extra or []):
+        label = f"{collection_name}: {', '.join(f'{f} {d}' for f, d in keys)}"
+        collection = db[collection_name]
+        if index_exists(collection, keys):
+            report['present'].append(label)
+            continue
+        if create:
+            try:
+                collection.create_index(keys)
+                report['created'].append(label)
+                continue
+            except Exception as e:
+                logger.warning("Could not create index %s (%s): %s", label, purpose, e)
+        report['missing'].append(label)
+    if report['missing']:
+        logger.warning("Missing Mongo indexes, queries will scan: %s", report['missing'])
+    return report
+
+
+def query_shapes(db, sample: dict) -> list:
+    """(name, collection, explain spec, scan expected) for every query ml-api issues
+
+    Full-collection reads (model builds, ratings matrix load, trending
+    recompute) are expected to scan; everything else should use an index.
+    """
+    user_id, content_type = sample.get('userId'), sample.get('contentType', 'movie')
+    shapes = [
+        ('user ratings', 'ratings',
+         {'filter': {'userId': user_id, 'contentType': content_type}, 'projection': USER_RATING_FIELDS}, False),
+        ('batch user ratings', 'ratings',
+         {'filter': {'userId': {'$in': [user_id]}}, 'projection': BATCH_RATING_FIELDS}, False),
+        ('ratings matrix load', 'ratings', {'filter': {}}, True),
+        ('trending recompute', 'ratings', {'filter': {}}, True),
+    ]
+    for collection in CATALOGS:
+        item_ids = [item['_id'] for item in db[collection].find({}, {'_id': 1}).limit(10)]
+        shapes += [
+            (f'{collection} watermark', collection,
+             {'filter': {}, 'projection': {'updatedAt': 1}, 'sort': {'updatedAt': -1}, 'limit': 1}, False),
+            (f'{collection} evergreen', collection,
+             {'filter': {}, 'sort': {'ratingCount': -1, 'averageRating': -1}, 'limit': 200}, False),
+            (f'{collection} popular fallback', collection,
+             {'filter': {'_id': {'$nin': item_ids[:3]}}, 'projection': {'averageRating': 1},
+              'sort': {'averageRating': -1}, 'limit': 10}, False),
+            (f'{collection} hydrate', collection, {'filter': {'_id': {'$in': item_ids}}}, False),
+            (f'{collection} model build', collection, {'filter': {}}, True),
+        ]
+    return shapes
+
+
+def plan_stages(plan: dict) -> List[str]:
+    """Stage names of a winning plan, outermost first"""
+    stages = []
+    while plan:
+        stages.append(plan.get('stage', '?'))
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return stages
+
+
+def explain_shape(db, collection: str, spec: dict) -> dict:
+    """Run explain (executionStats) for one find shape"""
+    command = {'find': collection, 'filter': spec['filter']}
+    for field in ('projection', 'sort', 'limit'):
+        if field in spec:
+            command[field] = spec[field]
+    result = db.command({'explain': command, 'verbosity': 'executionStats'})
+    winning = result['queryPlanner']['winningPlan']
+    # Slot-based engine plans nest the classic plan under queryPlan
+    stages = plan_stages(winning.get('queryPlan', winning))
+    stats = result.get('executionStats', {})
+    return {
+        'stages': stages,
+        'collectionScan': 'COLLSCAN' in stages,
+        'covered': 'FETCH' not in stages and 'COLLSCAN' not in stages,
+        'docsExamined': stats.get('totalDocsExamined'),
+        'keysExamined': stats.get('totalKeysExamined'),
+        'returned': stats.get('nReturned'),
+    }
+
+
+def run_diagnostics(db) -> bool:
+    """Print the plan of every query shape; False if an indexed shape scans the collection"""
+    sample = db.ratings.find_one({}, {'userId': 1, 'contentType': 1}) or {}
+    ok = True
+    print(f"{'query':<28} {'plan':<36} {'covered':>7} {'docs':>8} {'keys':>8}")
+    for name, collection, spec, scan_expected in query_shapes(db, sample):
+        result = explain_shape(db, collection, spec)
+        flag = ''
+        if result['collectionScan'] and not scan_expected:
+            flag = '  <- COLLECTION SCAN'
+            ok = False
+        print(f"{name:<28} {' > '.join(result['stages']):<36} {str(result['covered']):>7} "
+              f"{str(result['docsExamined']):>8} {str(result['keysExamined']):>8}{flag}")
+    return ok
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--explain', action='store_true', help='explain every query shape')
+    parser.add_argument('--create', action='store_true', help='create missing indexes first')
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/recohub")).recohub
+    report = ensure_indexes(db, create=args.create)
+    for status in ('present', 'created', 'missing'):
+        for label in report[status]:
+            print(f"{status:<8} {label}")
+    ok = not report['missing']
+    if args.explain:
+        print()
+        ok = run_diagnostics(db) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
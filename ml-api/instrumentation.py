@@ -0,0 +1,241 @@
+"""
+Instrumentation
+Per-request traces (stage timings, Mongo command counts), latency histograms
+rendered in the Prometheus text format, and an opt-in per-request profiler
+"""
+
+import contextvars
+import io
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+# Upper bounds in seconds, Prometheus' default latency buckets plus finer ones at the bottom
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds for histograms of counts (e.g. Mongo commands per request)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_DIR = os.getenv("ML_PROFILE_DIR", "profiles")
+
+
+class Histogram:
+    """Cumulative-bucket histogram, latency buckets unless given others"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by (metric name, sorted label pairs)"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str, buckets: Optional[tuple] = None):
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._buckets.get(name, BUCKETS))
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def summary(self, name: str) -> dict:
+        """count / mean seconds per label set of one histogram, for /api/metrics"""
+        with self._lock:
+            return {
+                ','.join(f"{k}={v}" for k, v in labels): {
+                    'count': h.count, 'meanMs': round(h.sum / h.count * 1000, 3) if h.count else 0.0
+                }
+                for (metric, labels), h in self._histograms.items() if metric == name
+            }
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text exposition format"""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for _, v in pairs)
+            return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+        lines = []
+        with self._lock:
+            for name in sorted(set(n for n, _ in self._histograms)):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), h in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(h.buckets, h.counts):
+                        lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {h.count}")
+                    lines.append(f"{name}_sum{label_text(labels)} {h.sum}")
+                    lines.append(f"{name}_count{label_text(labels)} {h.count}")
+            for name in sorted(set(n for n, _ in self._counters)):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{label_text(labels)} {value}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+metrics.describe('ml_api_request_seconds', 'Request latency by endpoint and status')
+metrics.describe('ml_api_stage_seconds', 'Time spent in each hot-path stage')
+metrics.describe('ml_api_mongo_command_seconds', 'MongoDB command latency by command')
+metrics.describe('ml_api_mongo_commands_per_request', 'MongoDB commands issued by one request',
+                 buckets=COUNT_BUCKETS)
+metrics.describe('ml_api_errors_total', 'Errors by exception type and response status')
+
+
+class RequestTrace:
+    """What one request spent its time on"""
+
+    def __init__(self, endpoint: str, profile: bool = False):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.profile = profile
+        self.stages: Dict[str, float] = {}
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_mongo(self, seconds: float):
+        with self._lock:
+            self.mongo_commands += 1
+            self.mongo_seconds += seconds
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (durations in ms)"""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"mongo;dur={self.mongo_seconds * 1000:.2f};desc=\"{self.mongo_commands} commands\"")
+        return ', '.join(parts)
+
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('current_trace', default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a hot-path stage into the stage histogram and the current request's trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe('ml_api_stage_seconds', elapsed, stage=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, elapsed)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Counts and times every Mongo command, attributed to the request that issued it
+
+    Command events fire on the thread that runs the command, which carries the
+    request's context (see workers.run_model_work / run_io).
+    """
+
+    def __init__(self):
+        self._traces: Dict[int, Optional[RequestTrace]] = {}
+
+    def started(self, event):
+        self._traces[event.request_id] = current_trace.get()
+
+    def _finished(self, event):
+        trace = self._traces.pop(event.request_id, None)
+        seconds = event.duration_micros / 1e6
+        metrics.observe('ml_api_mongo_command_seconds', seconds, command=event.command_name)
+        if trace is not None:
+            trace.add_mongo(seconds)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+mongo_listener = MongoCommandListener()
+
+
+def profiling_enabled() -> bool:
+    """Per-request profiling must be switched on for the process with ML_PROFILING=1"""
+    return os.getenv("ML_PROFILING", "0") == '1'
+
+
+def call_profiled(trace: RequestTrace, fn, *args, **kwargs):
+    """Run fn under a sampling profiler (pyinstrument) or cProfile when it isn't installed"""
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler(interval=0.001)
+        profiler.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.stop()
+            trace.profiles.append(profiler.output_text(unicode=True))
+
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(40)
+        trace.profiles.append(out.getvalue())
+
+
+def save_profiles(trace: RequestTrace) -> Optional[str]:
+    """Write a request's profiles to ML_PROFILE_DIR and return the file path"""
+    if not trace.profiles:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{trace.endpoint.strip('/').replace('/', '_') or 'root'}-{trace.request_id}.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(trace.profiles))
+    return path
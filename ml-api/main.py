@@ -1,18 +1,62 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pymongo import MongoClient
+from bson import ObjectId
+import asyncio
 import os
+import threading
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import logging
+import time
 from typing import List, Optional
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-from pydantic import BaseModel
-import httpx
+from pydantic import BaseModel, Field
+from als_factors import ALSFactors
+from ann_index import ANN_MIN_ITEMS
+from artifacts import SharedArtifacts
+from content_model import ContentModelCache, CARD_FIELDS, COLLECTION_MAP
+from indexes import BATCH_RATING_FIELDS, USER_RATING_FIELDS, ensure_indexes
+from instrumentation import (
+    PROFILE_HEADER, RequestTrace, current_trace, metrics, mongo_listener, profiling_enabled, save_profiles, stage
+)
+from metadata_index import mongo_filter
+from precomputed import PrecomputedRecommendations
+from rating_stream import RatingStreamConsumer, source_from_env
+from ratings_matrix import RatingsMatrix
+from result_cache import cache_from_env
+from trending import TrendingEngine
+from scoring import (
+    COLLAB_WEIGHT, content_candidates, content_scores, merge_hybrid, popular_fill, rated_rows, rerank_candidates,
+    top_k
+)
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, PyMongoError
+from workers import mongo_client_options, run_io, run_model_work
 
 load_dotenv()
 
-app = FastAPI(title="RecoHub ML API")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown hooks"""
+    global index_report
+    try:
+        # Resolving the precomputed collection reads the als_state pointer from Mongo
+        extra = [(await run_io(precomputed.collection), [('userId', 1)], 'precomputed lookup')] \
+            if RECOMMENDATION_MODE == 'precomputed' else []
+        index_report = await run_io(ensure_indexes, db, None, extra)
+    except PyMongoError as e:
+        logger.warning("Could not verify Mongo indexes: %s", e)
+    if rating_stream is not None:
+        rating_stream.start()
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    if rating_stream is not None:
+        rating_stream.stop()
+
+app = FastAPI(title="RecoHub ML API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -23,346 +67,685 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB connection
-mongo_client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/recohub"))
+# MongoDB connection, opened by the first query rather than at import
+mongo_client = MongoClient(
+    os.getenv("MONGODB_URI", "mongodb://localhost:27017/recohub"),
+    connect=False,
+    event_listeners=[mongo_listener],
+    **mongo_client_options()
+)
 db = mongo_client.recohub
 
+# Result of the startup index check (see indexes.py)
+index_report = None
+
+# Startup warm-up progress, served by /api/ready
+readiness = {'ready': False, 'startedAt': time.time(), 'readySeconds': None, 'loaded': [], 'attempts': 0, 'error': None}
+
+# 'attach' workers (serve.py) map the builder's artifacts instead of building their own
+shared_artifacts = SharedArtifacts() if os.getenv("ML_ARTIFACT_MODE", "build") == 'attach' else None
+
+# Fitted content models, rebuilt only when a catalog changes
+content_models = ContentModelCache(db, artifacts=shared_artifacts)
+
+# User x item ratings matrix shared by all collaborative filtering requests
+ratings_matrix = RatingsMatrix(db, artifacts=shared_artifacts)
+
+# 'online' always scores per request; 'precomputed' serves the Spark ALS output first
+RECOMMENDATION_MODE = os.getenv("RECOMMENDATION_MODE", "online")
+precomputed = PrecomputedRecommendations(db, ratings_matrix)
+
+# Optional consumer of the Kafka user-ratings topic (RATING_STREAM=kafka or file:<path>)
+rating_stream_source = source_from_env()
+rating_stream = RatingStreamConsumer(rating_stream_source, ratings_matrix) if rating_stream_source else None
+
+# Memory-mapped ALS factors exported by spark/recommendations.py (ALS_FACTORS_DIR)
+als_factors = ALSFactors()
+
+# Time-decayed trending scores, updated from rating events
+trending = TrendingEngine(db)
+
+# Response cache keyed on endpoint and parameters; a user's entries go when they rate
+result_cache = cache_from_env()
+
+if rating_stream is not None:
+    rating_stream.listeners.append(trending.record_ratings)
+    rating_stream.listeners.append(result_cache.invalidate_ratings)
+
+def error_response(exc: Exception, trace: RequestTrace) -> JSONResponse:
+    """Map an unhandled exception to a status code instead of a bare 500"""
+    if isinstance(exc, ExecutionTimeout):
+        status, detail = 504, "Database query timed out"
+    elif isinstance(exc, ConnectionFailure):
+        status, detail = 503, "Database unavailable"
+    elif isinstance(exc, PyMongoError):
+        status, detail = 502, "Database error"
+    else:
+        status, detail = 500, "Internal server error"
+    metrics.inc('ml_api_errors_total', type=type(exc).__name__, status=status)
+    logger.exception("Request %s to %s failed", trace.request_id, trace.endpoint)
+    return JSONResponse(status_code=status, content={
+        "detail": detail, "errorType": type(exc).__name__, "requestId": trace.request_id
+    })
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Trace every request: latency histogram, stage timings, Mongo commands, optional profile"""
+    trace = RequestTrace(
+        request.url.path,
+        profile=profiling_enabled() and request.headers.get(PROFILE_HEADER) == '1'
+    )
+    token = current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception as exc:
+        response = error_response(exc, trace)
+    finally:
+        current_trace.reset(token)
+    elapsed = time.perf_counter() - started
+    
+    # Route templates keep label cardinality bounded (/api/trending/{content_type})
+    route = request.scope.get('route')
+    endpoint = getattr(route, 'path', None) or 'unmatched'
+    metrics.observe('ml_api_request_seconds', elapsed, endpoint=endpoint, status=response.status_code)
+    metrics.observe('ml_api_mongo_commands_per_request', trace.mongo_commands, endpoint=endpoint)
+    
+    response.headers['X-Request-Id'] = trace.request_id
+    response.headers['Server-Timing'] = trace.server_timing()
+    if trace.profile:
+        profile_path = await run_io(save_profiles, trace)
+        if profile_path:
+            response.headers['X-Profile-File'] = profile_path
+    return response
+
 # Pydantic models
+# Largest page any endpoint returns; bounds top-k selection and hydration
+MAX_LIMIT = 100
+
+class ContentFilters(BaseModel):
+    genres: Optional[List[str]] = None
+    authors: Optional[List[str]] = None
+    artists: Optional[List[str]] = None
+    albums: Optional[List[str]] = None
+    yearFrom: Optional[int] = None
+    yearTo: Optional[int] = None
+
 class RecommendationRequest(BaseModel):
     userId: str
     contentType: str
-    limit: int = 10
+    limit: int = Field(10, ge=1, le=MAX_LIMIT)
+    filters: Optional[ContentFilters] = None
 
 class SimilarItemsRequest(BaseModel):
     contentId: str
     contentType: str
-    limit: int = 10
+    limit: int = Field(10, ge=1, le=MAX_LIMIT)
+    filters: Optional[ContentFilters] = None
+
+class BatchRecommendationRequest(BaseModel):
+    requests: List[RecommendationRequest]
+
+class MultiTypeRecommendationRequest(BaseModel):
+    userId: str
+    contentTypes: Optional[List[str]] = None  # None means every content type
+    limit: int = Field(10, ge=1, le=MAX_LIMIT)
+    filters: Optional[ContentFilters] = None
+
+class RatingEvent(BaseModel):
+    userId: str
+    contentType: str
+    contentId: str
+    rating: Optional[float] = None  # None means the rating was deleted
+
+def filter_dict(filters: Optional[ContentFilters]) -> Optional[dict]:
+    """Request filters as a plain dict, None when none are set"""
+    return (filters.model_dump(exclude_none=True) or None) if filters is not None else None
+
+def cache_key(params: dict, filters: Optional[dict]) -> dict:
+    """Result cache params; unfiltered requests keep their existing keys"""
+    return dict(params, filters=filters) if filters else params
+
+def to_object_id(value: str):
+    """Convert a string id to ObjectId, leaving non-ObjectId ids untouched"""
+    try:
+        return ObjectId(value)
+    except Exception:
+        return value
 
 # Content-based similarity computation
 def compute_content_similarity(content_type: str):
-    """Compute content-based similarity matrix"""
-    collection_map = {
-        'movie': 'movies',
-        'song': 'songs',
-        'book': 'books',
-        'series': 'series'
-    }
+    """Return the cached content model (top-k neighbour index and item ids)"""
+    return content_models.get(content_type)
+
+# Collaborative filtering (user-based, over the shared ratings matrix)
+def find_similar_users(user_id: str, min_common_items: int = 2):
+    """Find users with similar rating patterns"""
+    return ratings_matrix.find_similar_users(user_id, min_common_items)
+
+class UserSignals:
+    """Per-user scoring inputs that don't depend on the content type, computed on first use
+
+    A multi-type request shares one instance across its content types, so the
+    similar-users scan and the ALS user vector run once instead of once per type.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self._similar_users = None
+        self._export = None
+        self._vector = None
+
+    def similar_users(self) -> list:
+        with self._lock:
+            if self._similar_users is None:
+                with stage('similar_users'):
+                    self._similar_users = find_similar_users(self.user_id)
+            return self._similar_users
+
+    def als_vector(self, export):
+        """The user's stored or folded-in factor vector for this export, None without factors"""
+        with self._lock:
+            if self._export is not export:
+                with stage('als_user_vector'):
+                    self._vector = als_factors.user_vector(
+                        self.user_id, ratings_matrix.user_ratings(self.user_id),
+                        ratings_matrix.user_updated_at(self.user_id) > export.generated_at
+                    )
+                self._export = export
+            return self._vector
+
+def hybrid_recommendations(user_id: str, content_type: str, limit: int, user_ratings: Optional[list] = None,
+                           filters: Optional[dict] = None, signals: Optional[UserSignals] = None):
+    """Score items for one user with the 60/40 content/collaborative hybrid"""
+    if signals is None:
+        signals = UserSignals(user_id)
+    collection = db[COLLECTION_MAP[content_type]]
     
-    collection_name = collection_map.get(content_type)
-    if not collection_name:
-        return None, None
+    # Get user's ratings (batch callers pass them in)
+    if user_ratings is None:
+        with stage('user_ratings'):
+            user_ratings = list(db.ratings.find({
+                'userId': to_object_id(user_id),
+                'contentType': content_type
+            }, USER_RATING_FIELDS))
     
-    collection = db[collection_name]
-    items = list(collection.find({}))
+    rated_item_ids = set(str(r['contentId']) for r in user_ratings)
     
-    if not items:
-        return None, None
+    # Content-based recommendations: one sparse product over the rated rows
+    with stage('content_model'):
+        model = compute_content_similarity(content_type)
+    # Large catalogs: both stages produce candidates and only those are re-ranked
+    approximate = model is not None and len(model.item_ids) >= ANN_MIN_ITEMS
+    # Request filters: one row mask, applied before every top-k below
+    allowed = model.metadata.mask(filters) if model is not None and model.metadata is not None else None
+    if model is not None:
+        with stage('content_scores'):
+            rows, weights = rated_rows(
+                model,
+                [str(r['contentId']) for r in user_ratings],
+                [r['rating'] for r in user_ratings]
+            )
+            if approximate:
+                content_idx, content_vals = content_candidates(model, rows, weights)
+            else:
+                content = content_scores(model, rows, weights)
     
-    # Create feature vectors from genres and description
-    texts = []
-    item_ids = []
+    # Collaborative filtering: ALS factors when exported, similar users otherwise
+    export = als_factors.current()
+    if export is not None:
+        vector = signals.als_vector(export)
+        with stage('als_scores'):
+            collab_scores = als_factors.collaborative_scores(
+                user_id, content_type, (), rated_item_ids, max(limit * 5, 100),
+                allowed=export.allowed_rows(model, allowed) if allowed is not None else None,
+                vector=vector
+            ) if vector is not None else {}
+    else:
+        similar_users = signals.similar_users()
+        with stage('collaborative_scores'):
+            collab_scores = {
+                item_id: score
+                for item_id, score in ratings_matrix.collaborative_scores(similar_users, content_type).items()
+                if item_id not in rated_item_ids
+            }
     
-    for item in items:
-        item_id = str(item['_id'])
-        item_ids.append(item_id)
-        
-        # Combine genres and description
-        genres = ' '.join(item.get('genres', []))
-        description = item.get('description', '') or item.get('title', '')
-        
-        if content_type == 'song':
-            # For songs, also include artist and album
-            artist = item.get('artist', '')
-            album = item.get('album', '')
-            text = f"{genres} {description} {artist} {album}"
-        elif content_type == 'book':
-            # For books, include author
-            author = item.get('author', '')
-            text = f"{genres} {description} {author}"
+    # Hybrid: 60% content, 40% collaborative, already-rated items masked out
+    with stage('merge'):
+        if approximate:
+            sorted_items = rerank_candidates(content_idx, content_vals, collab_scores, model, rows, limit, allowed)
+        elif model is not None:
+            sorted_items = merge_hybrid(content, collab_scores, model, rows, limit, allowed)
+        elif filters:
+            # No metadata to check collaborative items against; the catalog query below filters
+            sorted_items = []
         else:
-            text = f"{genres} {description}"
-        
-        texts.append(text)
+            max_collab = max(collab_scores.values()) if collab_scores else 1
+            sorted_items = sorted(
+                ((item_id, score / max_collab * COLLAB_WEIGHT) for item_id, score in collab_scores.items()),
+                key=lambda x: x[1], reverse=True
+            )[:limit]
     
-    # Use TF-IDF vectorization
-    if len(texts) == 0:
-        return None, None
+    # If not enough recommendations, add popular items: from the model's ranking
+    # with rated, listed and filtered-out rows masked, or from Mongo without a model
+    if len(sorted_items) < limit and model is not None and model.popularity is not None:
+        with stage('popular_fallback'):
+            sorted_items = popular_fill(model, sorted_items, rows, limit, allowed)
+    elif len(sorted_items) < limit:
+        with stage('popular_fallback'):
+            popular_items = list(collection.find({
+                '_id': {'$nin': [r['contentId'] for r in user_ratings]},
+                **mongo_filter(filters)
+            }, {'averageRating': 1}).sort('averageRating', -1).limit(limit))
+        
+        listed = set(item_id for item_id, _ in sorted_items)
+        for item in popular_items:
+            item_id = str(item['_id'])
+            if item_id not in listed and len(sorted_items) < limit:
+                sorted_items.append((item_id, item.get('averageRating', 0)))
+                listed.add(item_id)
     
-    vectorizer = TfidfVectorizer(max_features=100, stop_words='english')
-    try:
-        tfidf_matrix = vectorizer.fit_transform(texts)
-        similarity_matrix = cosine_similarity(tfidf_matrix)
-        return similarity_matrix, item_ids
-    except:
-        return None, None
-
-# Collaborative filtering (simplified user-based)
-def get_user_ratings(user_id: str):
-    """Get all ratings by a user"""
-    from bson import ObjectId
-    try:
-        user_object_id = ObjectId(user_id)
-    except:
-        user_object_id = user_id
-    ratings = list(db.ratings.find({'userId': user_object_id}))
-    return {f"{r['contentType']}_{str(r['contentId'])}": r['rating'] for r in ratings}
+    return sorted_items[:limit]
 
-def find_similar_users(user_id: str, min_common_items: int = 2):
-    """Find users with similar rating patterns"""
-    user_ratings = get_user_ratings(user_id)
-    if not user_ratings:
+def recommend_for_user(user_id: str, content_type: str, limit: int, user_ratings: Optional[list] = None,
+                       filters: Optional[dict] = None, signals: Optional[UserSignals] = None):
+    """Pick the serving path and return (scored items, source, fallback reason)"""
+    # Precomputed ALS results first; online hybrid for cold or stale users
+    # and for filtered requests, which the stored lists can't serve
+    fallback_reason = None
+    if RECOMMENDATION_MODE == 'precomputed' and filters:
+        fallback_reason = 'filtered'
+    elif RECOMMENDATION_MODE == 'precomputed':
+        with stage('precomputed_lookup'):
+            sorted_items, source = precomputed.lookup(user_id, content_type, limit)
+        if sorted_items is not None:
+            return sorted_items, source, None
+        fallback_reason = source
+    sorted_items = hybrid_recommendations(user_id, content_type, limit, user_ratings, filters, signals)
+    return sorted_items, 'online', fallback_reason
+
+def hydrate_items(collection, scored_items: list, score_field: str) -> list:
+    """Fetch card fields for scored items with one $in query, keeping score order"""
+    if not scored_items:
         return []
+    with stage('hydrate'):
+        docs = {
+            str(item['_id']): item
+            for item in collection.find(
+                {'_id': {'$in': [to_object_id(item_id) for item_id, _ in scored_items]}},
+                CARD_FIELDS
+            )
+        }
+    hydrated = []
+    for item_id, score in scored_items:
+        item = docs.get(item_id)
+        if item:
+            item = dict(item, _id=item_id)
+            item[score_field] = round(float(score), 3)
+            hydrated.append(item)
+    return hydrated
+
+def batch_recommendations(requests: List[RecommendationRequest]) -> list:
+    """Score and hydrate a batch of (userId, contentType) requests"""
+    # One ratings query for every user in the batch
+    user_ids = list(dict.fromkeys(r.userId for r in requests))
+    ratings_by_user = {}
+    with stage('user_ratings'):
+        for rating in db.ratings.find(
+            {'userId': {'$in': [to_object_id(user_id) for user_id in user_ids]}},
+            BATCH_RATING_FIELDS
+        ):
+            key = (str(rating['userId']), rating['contentType'])
+            ratings_by_user.setdefault(key, []).append(rating)
     
-    all_ratings = list(db.ratings.find({}))
-    user_ratings_map = {}
+    # Users asked for in several content types get their similar users / ALS vector once
+    signals = {user_id: UserSignals(user_id) for user_id in user_ids}
+    scored = []
+    for r in requests:
+        user_ratings = ratings_by_user.get((r.userId, r.contentType), [])
+        scored.append(recommend_for_user(r.userId, r.contentType, r.limit, user_ratings, filter_dict(r.filters),
+                                         signals[r.userId]))
     
-    for rating in all_ratings:
-        uid = str(rating['userId'])
-        if uid not in user_ratings_map:
-            user_ratings_map[uid] = {}
-        key = f"{rating['contentType']}_{str(rating['contentId'])}"
-        user_ratings_map[uid][key] = rating['rating']
+    # One $in hydration query per content type
+    hydrated = {}
+    for content_type in set(r.contentType for r in requests):
+        ids = {
+            item_id: score
+            for r, (sorted_items, _, _) in zip(requests, scored)
+            if r.contentType == content_type
+            for item_id, score in sorted_items
+        }
+        items = hydrate_items(db[COLLECTION_MAP[content_type]], list(ids.items()), 'recommendationScore')
+        hydrated[content_type] = {item['_id']: item for item in items}
     
-    similar_users = []
-    for other_user_id, other_ratings in user_ratings_map.items():
-        if other_user_id == user_id:
-            continue
-        
-        # Find common items
-        common_items = set(user_ratings.keys()) & set(other_ratings.keys())
-        if len(common_items) < min_common_items:
-            continue
-        
-        # Calculate cosine similarity
-        user_vec = [user_ratings[item] for item in common_items]
-        other_vec = [other_ratings[item] for item in common_items]
-        
-        try:
-            similarity = np.dot(user_vec, other_vec) / (
-                np.linalg.norm(user_vec) * np.linalg.norm(other_vec) + 1e-10
-            )
-            if similarity > 0:
-                similar_users.append((other_user_id, similarity))
-        except:
-            continue
+    results = []
+    for r, (sorted_items, source, fallback_reason) in zip(requests, scored):
+        docs = hydrated[r.contentType]
+        recommendations = [
+            dict(docs[item_id], recommendationScore=round(float(score), 3))
+            for item_id, score in sorted_items[:r.limit]
+            if item_id in docs
+        ]
+        result = {
+            "userId": r.userId,
+            "contentType": r.contentType,
+            "recommendations": recommendations,
+            "source": source
+        }
+        if fallback_reason:
+            result["fallbackReason"] = fallback_reason
+        results.append(result)
     
-    # Sort by similarity
-    similar_users.sort(key=lambda x: x[1], reverse=True)
-    return similar_users[:10]
+    return results
+
+def user_ratings_by_type(user_id: str, content_types: List[str]) -> dict:
+    """One ratings read for several content types, grouped by type"""
+    ratings_by_type = {content_type: [] for content_type in content_types}
+    with stage('user_ratings'):
+        for rating in db.ratings.find(
+            {'userId': to_object_id(user_id), 'contentType': {'$in': content_types}},
+            BATCH_RATING_FIELDS
+        ):
+            ratings_by_type[rating['contentType']].append(rating)
+    return ratings_by_type
+
+def similar_items(content_type: str, content_id: str, limit: int, filters: Optional[dict] = None) -> Optional[list]:
+    """Top neighbours of one item, or None when the model doesn't know it"""
+    with stage('content_model'):
+        model = compute_content_similarity(content_type)
+    if model is None or content_id not in model.id_to_index:
+        return None
+    
+    # Top similar items from the neighbour index (the item itself is never included)
+    idx = model.id_to_index[content_id]
+    allowed = model.metadata.mask(filters) if model.metadata is not None else None
+    if allowed is None:
+        similar_indices, similarity_scores = model.neighbors.neighbors(idx, limit)
+    else:
+        similar_indices, similarity_scores = model.neighbors.neighbors(idx, None)
+        keep = allowed[similar_indices]
+        similar_indices, similarity_scores = similar_indices[keep][:limit], similarity_scores[keep][:limit]
+        if len(similar_indices) < limit:
+            # The stored neighbours ran out: score this item against every allowed item
+            with stage('filtered_similarity'):
+                scores = (model.tfidf_matrix[idx] @ model.tfidf_matrix.T).toarray().ravel()
+                exclude = ~allowed
+                exclude[idx] = True
+                similar_indices = top_k(scores, limit, exclude)
+                similarity_scores = scores[similar_indices]
+    return [(model.item_ids[i], score) for i, score in zip(similar_indices, similarity_scores)]
+
+def load_models():
+    """Load every content model, the ratings matrix (mapped from artifacts in attach mode) and the ALS factors"""
+    if shared_artifacts is not None and not shared_artifacts.wait(float(os.getenv("ML_READY_TIMEOUT_SECONDS", 600))):
+        raise RuntimeError(f"no artifact generation in {shared_artifacts.root}")
+    readiness['loaded'].clear()
+    for content_type in COLLECTION_MAP:
+        # check() builds now instead of waiting out the check interval after a failed attempt
+        model = content_models.get(content_type) if shared_artifacts is not None else content_models.check(content_type)
+        if model is not None:
+            readiness['loaded'].append(content_type)
+    ratings_matrix.ensure_loaded()
+    readiness['loaded'].append('ratings')
+    if als_factors.reload() is not None:
+        readiness['loaded'].append('alsFactors')
+    trending.recompute()
+    readiness['loaded'].append('trending')
+
+async def warm_up():
+    """Load the models before the first request needs them, then report ready
+
+    Failures (e.g. Mongo not reachable yet at boot) are retried with
+    exponential backoff, so the probe turns ready once a load succeeds.
+    """
+    delay = float(os.getenv("ML_READY_RETRY_SECONDS", 1))
+    max_delay = float(os.getenv("ML_READY_RETRY_MAX_SECONDS", 30))
+    while True:
+        readiness['attempts'] += 1
+        try:
+            await run_model_work(load_models)
+            break
+        except Exception as e:
+            logger.exception("Startup warm-up attempt %d failed; retrying in %.0fs", readiness['attempts'], delay)
+            readiness['error'] = f"{type(e).__name__}: {e}"
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
+    readiness['error'] = None
+    readiness['ready'] = True
+    readiness['readySeconds'] = round(time.time() - readiness['startedAt'], 3)
+    logger.info("Ready after %.2fs: %s", readiness['readySeconds'], readiness['loaded'])
 
 @app.get("/")
 async def root():
     return {"message": "RecoHub ML API is running"}
 
+@app.get("/api/ready")
+async def ready():
+    """Readiness probe: 200 once startup has loaded the models, 503 until then"""
+    return JSONResponse(status_code=200 if readiness['ready'] else 503, content={
+        **readiness,
+        "mode": "attach" if shared_artifacts is not None else "build",
+        "generation": shared_artifacts.stats()['generation'] if shared_artifacts is not None else None,
+    })
+
 @app.post("/api/recommendations")
 async def get_recommendations(request: RecommendationRequest):
     """Get personalized recommendations using hybrid approach"""
-    try:
-        from bson import ObjectId
-        user_id = request.userId
-        content_type = request.contentType
-        limit = request.limit
-        
-        collection_map = {
-            'movie': 'movies',
-            'song': 'songs',
-            'book': 'books',
-            'series': 'series'
-        }
-        
-        collection_name = collection_map.get(content_type)
-        if not collection_name:
-            raise HTTPException(status_code=400, detail="Invalid content type")
-        
-        collection = db[collection_name]
-        
-        # Get user's ratings
-        try:
-            user_object_id = ObjectId(user_id)
-        except:
-            user_object_id = user_id
-        
-        user_ratings = list(db.ratings.find({
-            'userId': user_object_id,
-            'contentType': content_type
-        }))
-        
-        rated_item_ids = [str(r['contentId']) for r in user_ratings]
-        
-        # Content-based recommendations
-        similarity_matrix, item_ids = compute_content_similarity(content_type)
-        content_scores = {}
-        
-        if similarity_matrix is not None and rated_item_ids:
-            for rating in user_ratings:
-                rated_id = str(rating['contentId'])
-                if rated_id in item_ids:
-                    idx = item_ids.index(rated_id)
-                    similarity_scores = similarity_matrix[idx]
-                    
-                    for i, item_id in enumerate(item_ids):
-                        if item_id not in rated_item_ids:
-                            if item_id not in content_scores:
-                                content_scores[item_id] = 0
-                            # Weight by user's rating
-                            content_scores[item_id] += similarity_scores[i] * rating['rating']
-        
-        # Collaborative filtering recommendations
-        similar_users = find_similar_users(user_id)
-        collab_scores = {}
-        
-        for other_user_id, similarity in similar_users:
-            try:
-                other_user_object_id = ObjectId(other_user_id)
-            except:
-                other_user_object_id = other_user_id
-            other_ratings = list(db.ratings.find({
-                'userId': other_user_object_id,
-                'contentType': content_type
-            }))
-            
-            for rating in other_ratings:
-                item_id = str(rating['contentId'])
-                if item_id not in rated_item_ids:
-                    if item_id not in collab_scores:
-                        collab_scores[item_id] = 0
-                    collab_scores[item_id] += rating['rating'] * similarity
-        
-        # Hybrid: combine both approaches
-        final_scores = {}
-        
-        # Normalize content scores
-        max_content = max(content_scores.values()) if content_scores else 1
-        for item_id, score in content_scores.items():
-            normalized_score = score / max_content if max_content > 0 else score
-            final_scores[item_id] = normalized_score * 0.6  # 60% weight
-        
-        # Normalize collaborative scores
-        max_collab = max(collab_scores.values()) if collab_scores else 1
-        for item_id, score in collab_scores.items():
-            normalized_score = score / max_collab if max_collab > 0 else score
-            final_scores[item_id] = final_scores.get(item_id, 0) + normalized_score * 0.4  # 40% weight
-        
-        # Sort by score and get top items
-        sorted_items = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)[:limit]
-        
-        # If not enough recommendations, add popular items
-        if len(sorted_items) < limit:
-            popular_items = list(collection.find({
-                '_id': {'$nin': [r['contentId'] for r in user_ratings]}
-            }).sort('averageRating', -1).limit(limit - len(sorted_items)))
-            
-            for item in popular_items:
-                item_id = str(item['_id'])
-                if item_id not in [x[0] for x in sorted_items]:
-                    sorted_items.append((item_id, item.get('averageRating', 0)))
-        
-        # Get full item details
-        recommended_items = []
-        for item_id, score in sorted_items[:limit]:
-            try:
-                item_object_id = ObjectId(item_id)
-            except:
-                item_object_id = item_id
-            item = collection.find_one({'_id': item_object_id})
-            if item:
-                item['_id'] = str(item['_id'])
-                item['recommendationScore'] = round(score, 3)
-                recommended_items.append(item)
-        
-        return {"recommendations": recommended_items}
+    user_id = request.userId
+    content_type = request.contentType
+    limit = request.limit
+    
+    collection_name = COLLECTION_MAP.get(content_type)
+    if not collection_name:
+        raise HTTPException(status_code=400, detail="Invalid content type")
+    
+    collection = db[collection_name]
+    
+    filters = filter_dict(request.filters)
+    cache_params = cache_key({'userId': user_id, 'contentType': content_type, 'limit': limit}, filters)
+    cached = await run_io(result_cache.get, 'recommendations', cache_params)
+    if cached is not None:
+        return cached
+    
+    sorted_items, source, fallback_reason = await run_model_work(
+        recommend_for_user, user_id, content_type, limit, None, filters
+    )
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Get full item details
+    recommended_items = await run_io(hydrate_items, collection, sorted_items[:limit], 'recommendationScore')
+    
+    response = {"recommendations": recommended_items, "source": source}
+    if fallback_reason:
+        response["fallbackReason"] = fallback_reason
+    await run_io(result_cache.set, 'recommendations', cache_params, response, user_id)
+    return response
 
 @app.get("/api/trending/{content_type}")
-async def get_trending(content_type: str, limit: int = 10):
-    """Get trending items based on ratings and popularity"""
-    try:
-        collection_map = {
-            'movie': 'movies',
-            'song': 'songs',
-            'book': 'books',
-            'series': 'series'
-        }
-        
-        collection_name = collection_map.get(content_type)
-        if not collection_name:
-            raise HTTPException(status_code=400, detail="Invalid content type")
-        
-        collection = db[collection_name]
-        
-        # Get items sorted by combination of rating and rating count
-        items = list(collection.find({}).sort([
-            ('ratingCount', -1),
-            ('averageRating', -1)
-        ]).limit(limit))
-        
-        # Convert ObjectId to string
-        for item in items:
-            item['_id'] = str(item['_id'])
-        
-        return {"trending": items}
+async def get_trending(content_type: str, limit: int = Query(10, ge=1, le=MAX_LIMIT)):
+    """Get trending items by time-decayed rating activity"""
+    if content_type not in COLLECTION_MAP:
+        raise HTTPException(status_code=400, detail="Invalid content type")
+    
+    cache_params = {'contentType': content_type, 'limit': limit}
+    cached = await run_io(result_cache.get, 'trending', cache_params)
+    if cached is not None:
+        return cached
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    response = {"trending": await run_io(trending.top, content_type, limit)}
+    await run_io(result_cache.set, 'trending', cache_params, response)
+    return response
 
 @app.post("/api/similar")
 async def get_similar_items(request: SimilarItemsRequest):
     """Get similar items based on content similarity"""
-    try:
-        from bson import ObjectId
-        content_id = request.contentId
-        content_type = request.contentType
-        limit = request.limit
-        
-        similarity_matrix, item_ids = compute_content_similarity(content_type)
-        
-        if similarity_matrix is None or content_id not in item_ids:
-            # Fallback to random items
-            collection_map = {
-                'movie': 'movies',
-                'song': 'songs',
-                'book': 'books',
-                'series': 'series'
-            }
-            collection = db[collection_map.get(content_type)]
-            items = list(collection.find({'_id': {'$ne': content_id}}).limit(limit))
-            for item in items:
-                item['_id'] = str(item['_id'])
-            return {"similar": items}
-        
-        idx = item_ids.index(content_id)
-        similarity_scores = similarity_matrix[idx]
-        
-        # Get top similar items (excluding the item itself)
-        similar_indices = np.argsort(similarity_scores)[::-1][1:limit+1]
-        
-        collection_map = {
-            'movie': 'movies',
-            'song': 'songs',
-            'book': 'books',
-            'series': 'series'
-        }
-        collection = db[collection_map.get(content_type)]
-        
-        similar_items = []
-        for i in similar_indices:
-            item_id = item_ids[i]
-            try:
-                item_object_id = ObjectId(item_id)
-            except:
-                item_object_id = item_id
-            item = collection.find_one({'_id': item_object_id})
-            if item:
-                item['_id'] = str(item['_id'])
-                item['similarity'] = round(float(similarity_scores[i]), 3)
-                similar_items.append(item)
-        
-        return {"similar": similar_items}
+    content_id = request.contentId
+    content_type = request.contentType
+    limit = request.limit
+    
+    collection_name = COLLECTION_MAP.get(content_type)
+    if not collection_name:
+        raise HTTPException(status_code=400, detail="Invalid content type")
+    
+    collection = db[collection_name]
+    
+    filters = filter_dict(request.filters)
+    cache_params = cache_key({'contentId': content_id, 'contentType': content_type, 'limit': limit}, filters)
+    cached = await run_io(result_cache.get, 'similar', cache_params)
+    if cached is not None:
+        return cached
+    
+    scored_items = await run_model_work(similar_items, content_type, content_id, limit, filters)
+    
+    if scored_items is None:
+        # Fallback to random items
+        items = await run_io(lambda: list(
+            collection.find({'_id': {'$ne': to_object_id(content_id)}, **mongo_filter(filters)}, CARD_FIELDS).limit(limit)
+        ))
+        for item in items:
+            item['_id'] = str(item['_id'])
+        return {"similar": items}
+    
+    response = {"similar": await run_io(hydrate_items, collection, scored_items, 'similarity')}
+    await run_io(result_cache.set, 'similar', cache_params, response)
+    return response
+
+@app.post("/api/recommendations/batch")
+async def get_batch_recommendations(request: BatchRecommendationRequest):
+    """Recommendations for many (userId, contentType) pairs in one call"""
+    if any(r.contentType not in COLLECTION_MAP for r in request.requests):
+        raise HTTPException(status_code=400, detail="Invalid content type")
+    
+    # Serve what the cache has and score only the misses, sharing single-request entries
+    keys = [
+        cache_key({'userId': r.userId, 'contentType': r.contentType, 'limit': r.limit}, filter_dict(r.filters))
+        for r in request.requests
+    ]
+    cached = [await run_io(result_cache.get, 'recommendations', key) for key in keys]
+    misses = [r for r, hit in zip(request.requests, cached) if hit is None]
+    computed = iter(await run_model_work(batch_recommendations, misses) if misses else [])
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    results = []
+    for r, key, hit in zip(request.requests, keys, cached):
+        if hit is not None:
+            results.append(dict(hit, userId=r.userId, contentType=r.contentType))
+            continue
+        result = next(computed)
+        response = {k: v for k, v in result.items() if k not in ('userId', 'contentType')}
+        await run_io(result_cache.set, 'recommendations', key, response, r.userId)
+        results.append(result)
+    
+    return {"results": results}
+
+@app.post("/api/recommendations/types")
+async def get_multi_type_recommendations(request: MultiTypeRecommendationRequest):
+    """Recommendations for several content types of one user, grouped by content type"""
+    content_types = list(dict.fromkeys(request.contentTypes or COLLECTION_MAP))
+    if any(content_type not in COLLECTION_MAP for content_type in content_types):
+        raise HTTPException(status_code=400, detail="Invalid content type")
+    
+    # Each type shares its cache entry with the single-type endpoint
+    filters = filter_dict(request.filters)
+    keys = {
+        content_type: cache_key({'userId': request.userId, 'contentType': content_type, 'limit': request.limit}, filters)
+        for content_type in content_types
+    }
+    results = {}
+    for content_type in content_types:
+        cached = await run_io(result_cache.get, 'recommendations', keys[content_type])
+        if cached is not None:
+            results[content_type] = cached
+    misses = [content_type for content_type in content_types if content_type not in results]
+    
+    if misses:
+        # One ratings read and one set of user signals, then every type scored concurrently
+        ratings_by_type = await run_io(user_ratings_by_type, request.userId, misses)
+        signals = UserSignals(request.userId)
+        scored = await asyncio.gather(*(
+            run_model_work(recommend_for_user, request.userId, content_type, request.limit,
+                           ratings_by_type[content_type], filters, signals)
+            for content_type in misses
+        ))
+        hydrated = await run_io(lambda: [
+            hydrate_items(db[COLLECTION_MAP[content_type]], sorted_items[:request.limit], 'recommendationScore')
+            for content_type, (sorted_items, _, _) in zip(misses, scored)
+        ])
+        for content_type, (_, source, fallback_reason), items in zip(misses, scored, hydrated):
+            response = {"recommendations": items, "source": source}
+            if fallback_reason:
+                response["fallbackReason"] = fallback_reason
+            await run_io(result_cache.set, 'recommendations', keys[content_type], response, request.userId)
+            results[content_type] = response
+    
+    return {"userId": request.userId, "results": {content_type: results[content_type] for content_type in content_types}}
+
+@app.post("/api/ratings/events")
+async def apply_rating_event(event: RatingEvent):
+    """Apply a created, updated or deleted rating to the in-memory ratings matrix"""
+    if event.contentType not in COLLECTION_MAP:
+        raise HTTPException(status_code=400, detail="Invalid content type")
+    ratings = [(event.userId, event.contentType, event.contentId, event.rating)]
+    await run_model_work(ratings_matrix.apply_ratings, ratings)
+    trending.record_ratings(ratings)
+    await run_io(result_cache.invalidate_user, event.userId)
+    return {"applied": True}
+
+@app.post("/api/models/refresh")
+async def refresh_models(contentType: Optional[str] = None):
+    """Force a rebuild of the cached content models"""
+    if contentType is not None and contentType not in COLLECTION_MAP:
+        raise HTTPException(status_code=400, detail="Invalid content type")
+    rebuilt = await run_model_work(content_models.refresh, contentType)
+    await run_model_work(ratings_matrix.load)
+    await run_io(als_factors.reload)
+    await run_io(result_cache.clear)
+    return {"rebuilt": rebuilt}
+
+def gauges() -> dict:
+    """Cache and model statistics as flat Prometheus gauges"""
+    cache_stats = result_cache.stats()
+    matrix_stats = ratings_matrix.stats()
+    model_stats = content_models.stats()
+    values = {
+        'ml_api_result_cache_hits': cache_stats['hits'],
+        'ml_api_result_cache_misses': cache_stats['misses'],
+        'ml_api_result_cache_evictions': cache_stats['evictions'],
+        'ml_api_result_cache_entries': cache_stats['entries'],
+        'ml_api_ratings_matrix_users': matrix_stats['users'],
+        'ml_api_ratings_matrix_items': matrix_stats['items'],
+        'ml_api_ratings_matrix_ratings': matrix_stats['ratings'],
+        'ml_api_ratings_matrix_pending': matrix_stats['pending'],
+        'ml_api_content_model_hits': model_stats['hits'],
+        'ml_api_content_model_misses': model_stats['misses'],
+        'ml_api_content_model_rebuilds': model_stats['rebuilds'],
+    }
+    if shared_artifacts is not None:
+        values['ml_api_artifact_generation'] = shared_artifacts.stats()['generation'] or 0
+    for content_type, model in model_stats['models'].items():
+        values[f'ml_api_content_model_items_{content_type}'] = model['items']
+        values[f'ml_api_content_model_index_bytes_{content_type}'] = model['indexBytes']
+    return values
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: latency histograms, error counters, cache and model gauges"""
+    return metrics.render(await run_io(gauges))
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Cache and model statistics"""
+    return {
+        "stages": metrics.summary('ml_api_stage_seconds'),
+        "indexes": index_report,
+        "contentModels": content_models.stats(),
+        "ratingsMatrix": ratings_matrix.stats(),
+        "artifacts": shared_artifacts.stats() if shared_artifacts else None,
+        "precomputed": precomputed.stats(),
+        "ratingStream": rating_stream.stats() if rating_stream else None,
+        "trending": trending.stats(),
+        "alsFactors": als_factors.stats(),
+        "resultCache": result_cache.stats()
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,106 @@
+"""
+Metadata Index
+Inverted index from genre / author / artist / album values to sorted item rows
+of a content model, plus a year column, so request filters become one boolean
+mask that is applied before top-k selection
+"""
+
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Request filter field -> catalog document field; values match case-insensitively
+TERM_FIELDS = {'genres': 'genres', 'authors': 'author', 'artists': 'artist', 'albums': 'album'}
+
+# Books store their year as publishYear, every other catalog as releaseYear
+YEAR_FIELDS = ('releaseYear', 'publishYear')
+NO_YEAR = -1
+
+
+def normalize_term(value) -> str:
+    return str(value).strip().lower()
+
+
+def item_year(item: dict) -> int:
+    for field in YEAR_FIELDS:
+        value = item.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+    return NO_YEAR
+
+
+class MetadataIndex:
+    """Postings per field: value -> sorted int32 rows, and every item's year"""
+
+    def __init__(self, n_items: int, postings: Dict[str, Dict[str, np.ndarray]], years: np.ndarray):
+        self.n_items = n_items
+        self.postings = postings
+        self.years = years
+
+    @property
+    def nbytes(self) -> int:
+        return self.years.nbytes + sum(rows.nbytes for field in self.postings.values() for rows in field.values())
+
+    def mask(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """Rows matching every given filter (any value within one field), or None without filters
+
+        filters: {'genres': [...], 'authors': [...], 'artists': [...], 'albums': [...],
+                  'yearFrom': int, 'yearTo': int}
+        """
+        if not filters:
+            return None
+        allowed = np.ones(self.n_items, dtype=bool)
+        for name, field in TERM_FIELDS.items():
+            values = filters.get(name)
+            if not values:
+                continue
+            matching = np.zeros(self.n_items, dtype=bool)
+            for value in values:
+                rows = self.postings.get(field, {}).get(normalize_term(value))
+                if rows is not None:
+                    matching[rows] = True
+            allowed &= matching
+        year_from, year_to = filters.get('yearFrom'), filters.get('yearTo')
+        if year_from is not None:
+            allowed &= self.years >= year_from
+        if year_to is not None:
+            allowed &= (self.years <= year_to) & (self.years != NO_YEAR)
+        return allowed
+
+
+def build_metadata_index(items: List[dict]) -> MetadataIndex:
+    """Index the catalog documents in model row order"""
+    postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in TERM_FIELDS.values()}
+    for row, item in enumerate(items):
+        for field, terms in postings.items():
+            values = item.get(field)
+            if not values:
+                continue
+            for value in (values if isinstance(values, list) else [values]):
+                terms.setdefault(normalize_term(value), []).append(row)
+    return MetadataIndex(
+        len(items),
+        {field: {term: np.asarray(rows, dtype=np.int32) for term, rows in terms.items()}
+         for field, terms in postings.items()},
+        np.fromiter((item_year(item) for item in items), dtype=np.int32, count=len(items)),
+    )
+
+
+def mongo_filter(filters: Optional[dict]) -> dict:
+    """The same filters as a Mongo query, for fallbacks that read the catalog directly"""
+    query = {}
+    for name, field in TERM_FIELDS.items():
+        values = (filters or {}).get(name)
+        if values:
+            # Exact values, anchored and case-insensitive like the index
+            patterns = [re.compile(f'^{re.escape(str(value).strip())}$', re.IGNORECASE) for value in values]
+            query[field] = {'$in': patterns}
+    year = {}
+    if (filters or {}).get('yearFrom') is not None:
+        year['$gte'] = filters['yearFrom']
+    if (filters or {}).get('yearTo') is not None:
+        year['$lte'] = filters['yearTo']
+    if year:
+        query['$or'] = [{field: year} for field in YEAR_FIELDS]
+    return query
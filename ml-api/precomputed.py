@@ -0,0 +1,84 @@
+"""
+Precomputed Recommendations
+Serves the ALS output written by spark/recommendations.py with one indexed
+lookup per request, and tells the caller when to fall back to online scoring
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+# Collection used before spark/recommendations.py started publishing versions
+RECOMMENDATIONS_COLLECTION = 'recommendations'
+STATE_COLLECTION = 'als_state'
+
+
+class PrecomputedRecommendations:
+    """Reader for the published recommendations version
+
+    The Spark job writes recommendations_v<N> and then points als_state.current
+    at it; the pointer is re-read at most every check_interval seconds.
+    """
+
+    def __init__(self, db, ratings_matrix=None, max_age_seconds: Optional[float] = None,
+                 check_interval: Optional[float] = None):
+        self.db = db
+        self.ratings_matrix = ratings_matrix
+        if max_age_seconds is None:
+            max_age_seconds = float(os.getenv("PRECOMPUTED_MAX_AGE_SECONDS", 24 * 3600))
+        self.max_age_seconds = max_age_seconds
+        if check_interval is None:
+            check_interval = float(os.getenv("PRECOMPUTED_POINTER_CHECK_SECONDS", 30))
+        self.check_interval = check_interval
+        self._collection = RECOMMENDATIONS_COLLECTION
+        self._version = None
+        self._checked_at = 0.0
+        self._stats = {'served': 0, 'cold': 0, 'stale': 0, 'insufficient': 0}
+
+    def collection(self) -> str:
+        """Name of the live recommendations collection"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            state = self.db[STATE_COLLECTION].find_one({'_id': 'current'}, {'collection': 1, 'version': 1})
+            if state is not None:
+                self._collection, self._version = state['collection'], state.get('version')
+        return self._collection
+
+    def lookup(self, user_id: str, content_type: str, limit: int) -> Tuple[Optional[List[tuple]], str]:
+        """Return (scored items, 'precomputed') or (None, reason to fall back)"""
+        doc = self.db[self.collection()].find_one(
+            {'userId': user_id},
+            {'_id': 0, 'generatedAt': 1, 'items': 1}
+        )
+        if doc is None:
+            self._stats['cold'] += 1
+            return None, 'cold'
+
+        generated_at = doc.get('generatedAt')
+        if generated_at is not None:
+            if generated_at.tzinfo is None:
+                generated_at = generated_at.replace(tzinfo=timezone.utc)
+            generated_ts = generated_at.timestamp()
+            age = datetime.now(timezone.utc).timestamp() - generated_ts
+            rated_since = (self.ratings_matrix is not None
+                           and self.ratings_matrix.user_updated_at(user_id) > generated_ts)
+            if age > self.max_age_seconds or rated_since:
+                self._stats['stale'] += 1
+                return None, 'stale'
+
+        items = [
+            (item['contentId'], float(item['score']))
+            for item in doc.get('items', [])
+            if item.get('contentType') == content_type
+        ][:limit]
+        if len(items) < limit:
+            self._stats['insufficient'] += 1
+            return None, 'insufficient'
+
+        self._stats['served'] += 1
+        return items, 'precomputed'
+
+    def stats(self) -> dict:
+        return {**self._stats, 'collection': self._collection, 'version': self._version}
@@ -0,0 +1,217 @@
+"""
+Rating Stream Consumer
+Applies rating events from the Kafka user-ratings topic (published by
+kafka/producer.js) to the in-memory ratings matrix in bounded-latency micro-batches
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from result_cache import server_workers
+
+logger = logging.getLogger(__name__)
+
+RATING_TOPIC = 'user-ratings'
+
+
+class FileEventSource:
+    """File-backed event log (one JSON event per line), a stand-in for the Kafka topic"""
+
+    def __init__(self, path: str, start_at: str = 'end'):
+        self.path = path
+        self._file = open(path, 'a+', encoding='utf-8')
+        self._file.seek(0, os.SEEK_END if start_at == 'end' else os.SEEK_SET)
+        self._position = self._file.tell()
+        self._committed = self._position
+
+    def poll(self, max_records: int, timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        events = []
+        while len(events) < max_records:
+            self._file.seek(self._position)
+            line = self._file.readline()
+            if not line.endswith('\n'):
+                # Nothing new, or the writer is mid-line
+                if events or time.monotonic() >= deadline:
+                    break
+                time.sleep(0.01)
+                continue
+            self._position = self._file.tell()
+            if line.strip():
+                events.append(json.loads(line))
+        return events
+
+    def commit(self):
+        self._committed = self._position
+
+    def lag(self) -> int:
+        """Unconsumed bytes in the log"""
+        return os.path.getsize(self.path) - self._committed
+
+    def close(self):
+        self._file.close()
+
+
+class KafkaEventSource:
+    """Kafka consumer on the user-ratings topic (needs `pip install kafka-python`)"""
+
+    def __init__(self, brokers: str, topic: str = RATING_TOPIC, group_id: str = 'recohub-ml-api'):
+        try:
+            from kafka import KafkaConsumer
+        except ImportError as e:
+            raise RuntimeError("RATING_STREAM=kafka requires the kafka-python package") from e
+        self._consumer = KafkaConsumer(
+            topic,
+            bootstrap_servers=brokers.split(','),
+            group_id=group_id,
+            enable_auto_commit=False,
+            auto_offset_reset='latest',
+            value_deserializer=lambda value: json.loads(value.decode('utf-8'))
+        )
+
+    def poll(self, max_records: int, timeout: float) -> list:
+        batches = self._consumer.poll(timeout_ms=int(timeout * 1000), max_records=max_records)
+        return [record.value for records in batches.values() for record in records]
+
+    def commit(self):
+        self._consumer.commit()
+
+    def lag(self) -> int:
+        """Messages between the committed position and the end of each partition"""
+        partitions = self._consumer.assignment()
+        if not partitions:
+            return 0
+        end_offsets = self._consumer.end_offsets(list(partitions))
+        return sum(end_offsets[tp] - self._consumer.position(tp) for tp in partitions)
+
+    def close(self):
+        self._consumer.close()
+
+
+def consumer_group() -> str:
+    """KAFKA_GROUP_ID, suffixed with the pid when several workers serve the API
+
+    Every worker keeps its own ratings overlay, trending scores and result
+    cache, so each one has to see every event rather than a share of the
+    partitions.
+    """
+    group_id = os.getenv("KAFKA_GROUP_ID", "recohub-ml-api")
+    if server_workers() > 1:
+        return f"{group_id}-{os.getpid()}"
+    return group_id
+
+
+def source_from_env() -> Optional[object]:
+    """RATING_STREAM=kafka or RATING_STREAM=file:/path/to/events.jsonl"""
+    setting = os.getenv("RATING_STREAM", "")
+    if setting == 'kafka':
+        return KafkaEventSource(os.getenv("KAFKA_BROKERS", "localhost:9092"), group_id=consumer_group())
+    if setting.startswith('file:'):
+        return FileEventSource(setting[len('file:'):])
+    return None
+
+
+def event_time(event: dict) -> Optional[float]:
+    timestamp = event.get('timestamp')
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class RatingStreamConsumer:
+    """Background thread that micro-batches rating events into the ratings matrix
+
+    A batch is applied as soon as max_batch events are buffered or max_latency
+    seconds have passed since its first event. Listeners are called with the
+    applied (userId, contentType, contentId, rating) tuples, so trending scores
+    and cached results can follow. The source is only touched from the
+    consumer thread: its lag is sampled there every lag_interval seconds and
+    stats() returns the cached value.
+    """
+
+    def __init__(self, source, ratings_matrix, max_batch: int = 500, max_latency: float = 0.2,
+                 lag_interval: float = 5.0):
+        self.source = source
+        self.ratings_matrix = ratings_matrix
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.lag_interval = lag_interval
+        self._lag_checked = 0.0
+        self.listeners: List[Callable[[list], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            'events': 0, 'batches': 0, 'errors': 0,
+            'lastBatchSize': 0, 'lastApplySeconds': 0.0, 'eventsPerSecond': 0.0,
+            'eventTimeLagSeconds': 0.0, 'lag': None,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='rating-stream', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.source.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.process_batch()
+                self.sample_lag()
+            except Exception:
+                self._stats['errors'] += 1
+                logger.exception("Rating stream batch failed")
+                time.sleep(1)
+
+    def sample_lag(self, force: bool = False):
+        """Refresh the cached source lag; call from the consumer thread only"""
+        now = time.monotonic()
+        if not force and now - self._lag_checked < self.lag_interval:
+            return
+        self._lag_checked = now
+        try:
+            self._stats['lag'] = self.source.lag()
+        except Exception:
+            self._stats['lag'] = None
+
+    def process_batch(self) -> int:
+        """Poll one micro-batch, apply it and commit; returns the number of events"""
+        events = self.source.poll(self.max_batch, self.max_latency)
+        if not events:
+            return 0
+
+        started = time.perf_counter()
+        ratings = [
+            (e['userId'], e['contentType'], e['contentId'], e.get('rating'))
+            for e in events
+            if e.get('userId') and e.get('contentType') and e.get('contentId')
+        ]
+        self.ratings_matrix.apply_ratings(ratings)
+        for listener in self.listeners:
+            listener(ratings)
+        self.source.commit()
+        elapsed = time.perf_counter() - started
+
+        self._stats['events'] += len(events)
+        self._stats['batches'] += 1
+        self._stats['lastBatchSize'] = len(events)
+        self._stats['lastApplySeconds'] = elapsed
+        self._stats['eventsPerSecond'] = len(events) / elapsed if elapsed > 0 else 0.0
+        newest = max((t for t in map(event_time, events) if t is not None), default=None)
+        if newest is not None:
+            self._stats['eventTimeLagSeconds'] = max(0.0, time.time() - newest)
+        return len(events)
+
+    def stats(self) -> dict:
+        return {**self._stats, 'running': bool(self._thread and self._thread.is_alive())}
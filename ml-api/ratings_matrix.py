@@ -0,0 +1,326 @@
+"""
+Ratings Matrix
+Shared sparse user x item ratings matrix for collaborative filtering, loaded
+once from MongoDB and kept current with incremental rating updates
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+CONTENT_TYPES = ['movie', 'song', 'book', 'series']
+TYPE_CODES = {content_type: code for code, content_type in enumerate(CONTENT_TYPES)}
+
+RATING_FIELDS = {'_id': 0, 'userId': 1, 'contentType': 1, 'contentId': 1, 'rating': 1}
+
+
+def item_key(content_type: str, content_id: str) -> str:
+    """Item key shared by every content type, e.g. movie_<contentId>"""
+    return f"{content_type}_{content_id}"
+
+
+class RatingsMatrix:
+    """CSR/CSC user x item matrix with integer id maps and a pending-update buffer
+
+    Updates land in a small pending dict and are merged into the base matrices
+    on the next read once RATINGS_COMPACT_SECONDS have passed or the buffer is large, so
+    reads never pay for a rebuild per write. A user's own pending ratings are
+    always visible to that user's queries.
+
+    With `artifacts` (a SharedArtifacts, see artifacts.py) the base matrices are
+    the builder's memory-mapped ones and are never compacted in this process;
+    pending updates stay an overlay until a generation that includes them.
+    """
+
+    def __init__(self, db, compact_seconds: Optional[float] = None, compact_threshold: int = 10000,
+                 artifacts=None):
+        self.db = db
+        self.artifacts = artifacts
+        self._generation = None
+        if compact_seconds is None:
+            compact_seconds = float(os.getenv("RATINGS_COMPACT_SECONDS", 1))
+        self.compact_seconds = compact_seconds
+        self.compact_threshold = compact_threshold
+
+        self.user_index: Dict[str, int] = {}
+        self.user_ids: List[str] = []
+        self.item_index: Dict[str, int] = {}
+        self.item_ids: List[str] = []
+        self.item_types = np.zeros(0, dtype=np.int8)
+        self._new_item_types: List[int] = []
+
+        self._csr = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._csc = sparse.csc_matrix((0, 0), dtype=np.float32)
+        # (user_idx, item_idx) -> rating, or None for a deleted rating
+        self._pending: Dict[Tuple[int, int], Optional[float]] = {}
+        self._pending_by_user: Dict[int, Dict[int, Optional[float]]] = {}
+        self._user_updated_at: Dict[str, float] = {}
+        self._last_compact = 0.0
+        self._loaded = False
+        self._lock = threading.RLock()
+        self._stats = {'loads': 0, 'updates': 0, 'compactions': 0}
+
+    def _user_idx(self, user_id: str) -> int:
+        idx = self.user_index.get(user_id)
+        if idx is None:
+            idx = len(self.user_ids)
+            self.user_index[user_id] = idx
+            self.user_ids.append(user_id)
+        return idx
+
+    def _item_idx(self, content_type: str, content_id: str) -> int:
+        key = item_key(content_type, content_id)
+        idx = self.item_index.get(key)
+        if idx is None:
+            idx = len(self.item_ids)
+            self.item_index[key] = idx
+            self.item_ids.append(content_id)
+            self._new_item_types.append(TYPE_CODES.get(content_type, -1))
+        return idx
+
+    def load(self):
+        """Build the matrix from a single projected scan of db.ratings"""
+        if self.artifacts is not None:
+            self.attach()
+            return
+        with self._lock:
+            self.user_index, self.user_ids = {}, []
+            self.item_index, self.item_ids = {}, []
+            self._new_item_types = []
+            rows, cols, vals = [], [], []
+            for rating in self.db.ratings.find({}, RATING_FIELDS):
+                rows.append(self._user_idx(str(rating['userId'])))
+                cols.append(self._item_idx(rating['contentType'], str(rating['contentId'])))
+                vals.append(rating['rating'])
+
+            self.item_types = np.asarray(self._new_item_types, dtype=np.int8)
+            self._new_item_types = []
+            self._set_base(
+                np.asarray(rows, dtype=np.int32),
+                np.asarray(cols, dtype=np.int32),
+                np.asarray(vals, dtype=np.float32)
+            )
+            self._pending.clear()
+            self._pending_by_user.clear()
+            self._loaded = True
+            self._stats['loads'] += 1
+
+    def attach(self):
+        """Switch to the artifacts' current generation, keeping newer pending updates
+
+        Updates applied after the builder read db.ratings are re-applied on top of
+        the new base; older ones are already part of it.
+        """
+        with self._lock:
+            arrays = self.artifacts.ratings_arrays()
+            if arrays is None:
+                # Nothing published yet: serve an empty matrix until the builder is done
+                self._generation = None
+                self._loaded = True
+                return
+            carried = [
+                (self.user_ids[u], CONTENT_TYPES[self.item_types[i]], self.item_ids[i], value)
+                for (u, i), value in self._pending.items()
+                if self._user_updated_at.get(self.user_ids[u], 0.0) > arrays['loaded_at']
+                and self.item_types[i] >= 0
+            ]
+            self.user_ids, self.item_ids = arrays['user_ids'], arrays['item_ids']
+            self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+            self.item_index = {
+                item_key(CONTENT_TYPES[code], item_id): i
+                for i, (code, item_id) in enumerate(zip(arrays['item_types'].tolist(), self.item_ids))
+                if code >= 0
+            }
+            self.item_types = arrays['item_types']
+            self._csr, self._csc = arrays['csr'], arrays['csc']
+            self._pending.clear()
+            self._pending_by_user.clear()
+            self._generation = arrays['generation']
+            self._loaded = True
+            self._stats['loads'] += 1
+
+            self._new_item_types = []
+            for user_id, content_type, content_id, value in carried:
+                u = self._user_idx(user_id)
+                i = self._item_idx(content_type, content_id)
+                self._pending[(u, i)] = value
+                self._pending_by_user.setdefault(u, {})[i] = value
+            if self._new_item_types:
+                self.item_types = np.concatenate(
+                    [self.item_types, np.asarray(self._new_item_types, dtype=np.int8)]
+                )
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+        elif self.artifacts is not None and self.artifacts.generation() != self._generation:
+            self.attach()
+
+    def apply_rating(self, user_id: str, content_type: str, content_id: str, rating: Optional[float]):
+        """Record a new, changed (rating) or deleted (None) rating"""
+        self.apply_ratings([(user_id, content_type, content_id, rating)])
+
+    def apply_ratings(self, ratings: List[tuple]):
+        """Apply (userId, contentType, contentId, rating) updates under one lock"""
+        self.ensure_loaded()
+        now = time.time()
+        with self._lock:
+            self._new_item_types = []
+            for user_id, content_type, content_id, rating in ratings:
+                u = self._user_idx(str(user_id))
+                i = self._item_idx(content_type, str(content_id))
+                value = None if rating is None else float(rating)
+                self._pending[(u, i)] = value
+                self._pending_by_user.setdefault(u, {})[i] = value
+                self._user_updated_at[str(user_id)] = now
+            if self._new_item_types:
+                self.item_types = np.concatenate(
+                    [self.item_types, np.asarray(self._new_item_types, dtype=np.int8)]
+                )
+            self._stats['updates'] += len(ratings)
+
+    def user_updated_at(self, user_id: str) -> float:
+        """Time of the last rating event applied for a user (0 if none)"""
+        return self._user_updated_at.get(str(user_id), 0.0)
+
+    def _set_base(self, rows: np.ndarray, cols: np.ndarray, vals: np.ndarray):
+        shape = (len(self.user_ids), len(self.item_ids))
+        coo = sparse.coo_matrix((vals, (rows, cols)), shape=shape, dtype=np.float32)
+        self._csr = coo.tocsr()
+        self._csr.eliminate_zeros()
+        self._csc = self._csr.tocsc()
+        self._last_compact = time.time()
+
+    def _compact(self):
+        """Merge pending updates into the base matrices"""
+        base = self._csr.tocoo()
+        n_items = max(len(self.item_ids), 1)
+        base_keys = base.row.astype(np.int64) * n_items + base.col
+        pending_keys = np.fromiter(
+            (u * n_items + i for u, i in self._pending), dtype=np.int64, count=len(self._pending)
+        )
+        keep = ~np.isin(base_keys, pending_keys)
+
+        new_rows, new_cols, new_vals = [], [], []
+        for (u, i), value in self._pending.items():
+            if value is not None:
+                new_rows.append(u)
+                new_cols.append(i)
+                new_vals.append(value)
+
+        self._set_base(
+            np.concatenate([base.row[keep], np.asarray(new_rows, dtype=np.int32)]),
+            np.concatenate([base.col[keep], np.asarray(new_cols, dtype=np.int32)]),
+            np.concatenate([base.data[keep], np.asarray(new_vals, dtype=np.float32)])
+        )
+        self._pending.clear()
+        self._pending_by_user.clear()
+        self._stats['compactions'] += 1
+
+    def _maybe_compact(self):
+        if not self._pending or self.artifacts is not None:
+            return
+        if (len(self._pending) >= self.compact_threshold
+                or time.time() - self._last_compact >= self.compact_seconds):
+            self._compact()
+
+    def user_vector(self, u: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Item indices and ratings of one user, including pending updates"""
+        ratings = {}
+        if u < self._csr.shape[0]:
+            start, end = self._csr.indptr[u], self._csr.indptr[u + 1]
+            ratings = dict(zip(self._csr.indices[start:end].tolist(), self._csr.data[start:end].tolist()))
+        for i, value in self._pending_by_user.get(u, {}).items():
+            if value is None:
+                ratings.pop(i, None)
+            else:
+                ratings[i] = value
+        items = np.fromiter(ratings.keys(), dtype=np.int64, count=len(ratings))
+        values = np.fromiter(ratings.values(), dtype=np.float32, count=len(ratings))
+        return items, values
+
+    def user_ratings(self, user_id: str) -> List[Tuple[str, str, float]]:
+        """(contentType, contentId, rating) of every item a user rated"""
+        self.ensure_loaded()
+        with self._lock:
+            u = self.user_index.get(str(user_id))
+            if u is None:
+                return []
+            items, values = self.user_vector(u)
+            return [
+                (CONTENT_TYPES[self.item_types[i]], self.item_ids[i], float(value))
+                for i, value in zip(items.tolist(), values.tolist())
+                if self.item_types[i] >= 0
+            ]
+
+    def find_similar_users(self, user_id: str, min_common_items: int = 2,
+                           top_n: int = 10) -> List[Tuple[str, float]]:
+        """Cosine similarity over co-rated items against every user at once
+
+        Same definition as the original per-user loop: the dot product and both
+        norms only use items the two users have in common.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            self._maybe_compact()
+            u = self.user_index.get(str(user_id))
+            if u is None:
+                return []
+            items, values = self.user_vector(u)
+            items_in_base = items < self._csc.shape[1]
+            items, values = items[items_in_base], values[items_in_base]
+            if len(items) == 0:
+                return []
+
+            # Columns of the items this user rated: (users x rated items)
+            sub = self._csc[:, items].tocsr()
+            present = sub.copy()
+            present.data = np.ones_like(present.data)
+            squares = sub.multiply(sub)
+
+            dot = sub @ values
+            common, self_norm_sq = (present @ np.column_stack([np.ones_like(values), values ** 2])).T
+            other_norm_sq = squares @ np.ones_like(values)
+
+        similarity = dot / (np.sqrt(self_norm_sq) * np.sqrt(other_norm_sq) + 1e-10)
+        candidates = (common >= min_common_items) & (similarity > 0)
+        if u < len(candidates):
+            candidates[u] = False
+        candidate_idx = np.flatnonzero(candidates)
+        if len(candidate_idx) > top_n:
+            candidate_idx = candidate_idx[np.argpartition(similarity[candidate_idx], -top_n)[-top_n:]]
+        order = np.argsort(-similarity[candidate_idx], kind='stable')
+        return [(self.user_ids[i], float(similarity[i])) for i in candidate_idx[order]]
+
+    def collaborative_scores(self, similar_users: List[Tuple[str, float]], content_type: str) -> Dict[str, float]:
+        """Similarity-weighted ratings of the similar users for one content type"""
+        self.ensure_loaded()
+        with self._lock:
+            users = [self.user_index[uid] for uid, _ in similar_users if uid in self.user_index]
+            weights = np.asarray([sim for uid, sim in similar_users if uid in self.user_index], dtype=np.float32)
+            users_in_base = np.asarray(users, dtype=np.int64) < self._csr.shape[0]
+            if not users_in_base.any():
+                return {}
+            rows = self._csr[np.asarray(users, dtype=np.int64)[users_in_base]]
+            scores = np.asarray(weights[users_in_base] @ rows).ravel()
+            item_types = self.item_types[:len(scores)]
+
+        type_code = TYPE_CODES.get(content_type, -1)
+        hits = np.flatnonzero((scores != 0) & (item_types == type_code))
+        return {self.item_ids[i]: float(scores[i]) for i in hits}
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            'users': len(self.user_ids),
+            'items': len(self.item_ids),
+            'ratings': int(self._csr.nnz),
+            'pending': len(self._pending),
+            'generation': self._generation,
+            'matrixBytes': int(self._csr.data.nbytes + self._csr.indices.nbytes + self._csr.indptr.nbytes
+                               + self._csc.data.nbytes + self._csc.indices.nbytes + self._csc.indptr.nbytes),
+        }
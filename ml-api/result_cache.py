@@ -0,0 +1,207 @@
+"""
+Result Cache
+Response-level cache for ml-api endpoints with per-endpoint TTLs, size-bounded
+eviction and per-user invalidation; in-process LRU or shared Redis backend
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTLS = {
+    'recommendations': float(os.getenv("CACHE_TTL_RECOMMENDATIONS", 300)),
+    'similar': float(os.getenv("CACHE_TTL_SIMILAR", 3600)),
+    'trending': float(os.getenv("CACHE_TTL_TRENDING", 60)),
+}
+
+
+class LRUBackend:
+    """In-process LRU with expiry; evicts least recently used entries past max_entries"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, user_id = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float, user_id: Optional[str] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value, user_id)
+            self._entries.move_to_end(key)
+            if user_id is not None:
+                self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        user_id = entry[2]
+        if user_id is not None:
+            keys = self._user_keys.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_keys[user_id]
+        return True
+
+    def invalidate_user(self, user_id: str) -> int:
+        with self._lock:
+            keys = list(self._user_keys.get(user_id, ()))
+            return sum(1 for key in keys if self._remove(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared cache in Redis; size is bounded by the server's maxmemory-policy (e.g. allkeys-lru)
+
+    Pass any redis-py compatible client (fakeredis works as a local stand-in).
+    """
+
+    def __init__(self, client, prefix: str = 'recohub:ml:'):
+        self.client = client
+        self.prefix = prefix
+
+    @property
+    def evictions(self) -> int:
+        """Server-wide evicted_keys counter"""
+        try:
+            return int(self.client.info('stats').get('evicted_keys', 0))
+        except Exception:
+            return 0
+
+    @classmethod
+    def from_url(cls, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESULT_CACHE=redis requires the redis package") from e
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: float, user_id: Optional[str] = None):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+        if user_id is not None:
+            user_key = f"{self.prefix}user:{user_id}"
+            pipe.sadd(user_key, key)
+            pipe.expire(user_key, max(1, int(ttl)))
+        pipe.execute()
+
+    def invalidate_user(self, user_id: str) -> int:
+        user_key = f"{self.prefix}user:{user_id}"
+        keys = [k.decode() if isinstance(k, bytes) else k for k in self.client.smembers(user_key)]
+        removed = self.client.delete(*[self.prefix + k for k in keys]) if keys else 0
+        self.client.delete(user_key)
+        return removed
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self) -> int:
+        user_prefix = (self.prefix + 'user:').encode()
+        return sum(1 for key in self.client.scan_iter(self.prefix + '*')
+                   if not (key if isinstance(key, bytes) else key.encode()).startswith(user_prefix))
+
+
+class ResultCache:
+    """Endpoint + parameters -> response cache with hit/miss/eviction counters"""
+
+    def __init__(self, backend, ttls: Optional[dict] = None):
+        self.backend = backend
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0}
+
+    @staticmethod
+    def key(endpoint: str, params: dict) -> str:
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return f"{endpoint}:{digest}"
+
+    def get(self, endpoint: str, params: dict):
+        value = self.backend.get(self.key(endpoint, params))
+        self._stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set(self, endpoint: str, params: dict, value, user_id: Optional[str] = None):
+        ttl = self.ttls.get(endpoint, 60)
+        if ttl <= 0:
+            return
+        self.backend.set(self.key(endpoint, params), value, ttl, user_id)
+        self._stats['sets'] += 1
+
+    def invalidate_user(self, user_id: str):
+        self._stats['invalidations'] += self.backend.invalidate_user(str(user_id))
+
+    def invalidate_ratings(self, ratings: list):
+        """Rating stream listener: drop cached results of every user in the batch"""
+        for user_id in set(str(r[0]) for r in ratings):
+            self.invalidate_user(user_id)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self._stats['hits'] + self._stats['misses']
+        return {
+            **self._stats,
+            'evictions': self.backend.evictions,
+            'hitRatio': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+            'entries': self.backend.size(),
+            'backend': type(self.backend).__name__,
+        }
+
+
+def server_workers() -> int:
+    """Worker processes serving the API: serve.py's ML_WORKERS or uvicorn's WEB_CONCURRENCY"""
+    return int(os.getenv("ML_WORKERS") or os.getenv("WEB_CONCURRENCY") or 1)
+
+
+def cache_from_env() -> ResultCache:
+    """RESULT_CACHE=lru (default) or RESULT_CACHE=redis with REDIS_URL
+
+    An LRU only invalidates in the worker that received the rating event, so
+    with several workers recommendations (the per-user entries) aren't cached.
+    """
+    if os.getenv("RESULT_CACHE", "lru") == 'redis':
+        return ResultCache(RedisBackend.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    backend = LRUBackend(int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000)))
+    workers = server_workers()
+    if workers > 1:
+        logger.warning("RESULT_CACHE=lru with %d workers: rating invalidation would only reach one worker, "
+                       "so recommendations are not cached. Set RESULT_CACHE=redis to share the cache.", workers)
+        return ResultCache(backend, ttls={'recommendations': 0})
+    return ResultCache(backend)
@@ -0,0 +1,174 @@
+"""
+Vectorized Scoring
+Batched content-based scoring and top-k selection over a content model
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+CONTENT_WEIGHT = 0.6
+COLLAB_WEIGHT = 0.4
+
+
+def rated_rows(model, rated_ids: Sequence[str], ratings: Sequence[float]):
+    """Map rated item ids to model rows, dropping items the model doesn't know"""
+    rows = []
+    weights = []
+    for item_id, rating in zip(rated_ids, ratings):
+        idx = model.id_to_index.get(item_id)
+        if idx is not None:
+            rows.append(idx)
+            weights.append(rating)
+    return np.asarray(rows, dtype=np.int64), np.asarray(weights, dtype=np.float32)
+
+
+def content_scores(model, rows: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Rating-weighted sum of the rated items' neighbour rows, as one sparse product"""
+    n_items = len(model.item_ids)
+    if len(rows) == 0:
+        return np.zeros(n_items, dtype=np.float32)
+    weight_vector = sparse.csr_matrix(
+        (weights, (np.zeros(len(rows), dtype=np.int64), rows)),
+        shape=(1, model.neighbors.size),
+    )
+    return np.asarray((weight_vector @ model.neighbors.matrix).todense()).ravel()
+
+
+def content_candidates(model, rows: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """First stage for content: the unrated items with a positive score, as (sorted indices, scores)
+
+    Same sums as content_scores, over at most rated items x SIMILARITY_TOP_K
+    neighbours instead of a dense catalog array.
+    """
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    # Gather the rated rows' neighbour lists directly; scipy's sparse product
+    # would allocate a catalog-sized work array
+    matrix = model.neighbors.matrix
+    starts, lengths = matrix.indptr[rows], matrix.indptr[rows + 1] - matrix.indptr[rows]
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    indices, inverse = np.unique(matrix.indices[positions], return_inverse=True)
+    scores = np.bincount(inverse, matrix.data[positions] * np.repeat(weights, lengths)).astype(np.float32)
+    keep = (scores > 0) & ~np.isin(indices, rows)
+    return indices[keep].astype(np.int64), scores[keep]
+
+
+def exclusion_mask(n_items: int, rows: np.ndarray) -> np.ndarray:
+    """Boolean mask that is True for items the user already rated"""
+    mask = np.zeros(n_items, dtype=bool)
+    mask[rows] = True
+    return mask
+
+
+def top_k(scores: np.ndarray, k: int, exclude: np.ndarray = None) -> np.ndarray:
+    """Indices of the k best positive scores, best first, skipping excluded items"""
+    candidates = scores > 0
+    if exclude is not None:
+        candidates &= ~exclude
+    candidate_idx = np.flatnonzero(candidates)
+    if len(candidate_idx) > k:
+        best = np.argpartition(scores[candidate_idx], -k)[-k:]
+        candidate_idx = candidate_idx[best]
+    order = np.argsort(-scores[candidate_idx], kind='stable')
+    return candidate_idx[order]
+
+
+def normalize_max(scores: np.ndarray) -> np.ndarray:
+    """Scale scores so the best one is 1"""
+    best = scores.max() if len(scores) else 0
+    return scores / best if best > 0 else scores
+
+
+def allowed_collab(collab: dict, model, allowed: np.ndarray) -> dict:
+    """Collaborative scores of allowed items; items the model doesn't know have no metadata"""
+    return {
+        item_id: score for item_id, score in collab.items()
+        if item_id in model.id_to_index and allowed[model.id_to_index[item_id]]
+    }
+
+
+def merge_hybrid(content: np.ndarray, collab: dict, model, rows: np.ndarray, limit: int,
+                 allowed: np.ndarray = None) -> List[tuple]:
+    """Blend normalized content and collaborative scores and pick the top items
+
+    Collaborative scores for items the content model doesn't index yet (added
+    after the last rebuild) are ranked alongside the indexed ones. Items outside
+    the `allowed` mask (request filters) are excluded before top-k selection.
+    """
+    rated = exclusion_mask(len(model.item_ids), rows)
+    if allowed is not None:
+        rated |= ~allowed
+        collab = allowed_collab(collab, model, allowed)
+    final = normalize_max(np.where(rated, 0, content)) * CONTENT_WEIGHT
+
+    max_collab = max(collab.values()) if collab else 1
+    extras = []
+    for item_id, score in collab.items():
+        normalized_score = score / max_collab if max_collab > 0 else score
+        idx = model.id_to_index.get(item_id)
+        if idx is None:
+            extras.append((item_id, normalized_score * COLLAB_WEIGHT))
+        else:
+            final[idx] += normalized_score * COLLAB_WEIGHT
+
+    ranked = [(model.item_ids[i], float(final[i])) for i in top_k(final, limit, rated)]
+    if extras:
+        ranked = sorted(ranked + extras, key=lambda x: x[1], reverse=True)[:limit]
+    return ranked
+
+
+def popular_fill(model, sorted_items: List[tuple], rows: np.ndarray, limit: int,
+                 allowed: np.ndarray = None) -> List[tuple]:
+    """Pad scored items up to `limit` from the popularity ranking, skipping rated and already listed items"""
+    exclude = exclusion_mask(len(model.item_ids), rows)
+    if allowed is not None:
+        exclude |= ~allowed
+    exclude[[model.id_to_index[item_id] for item_id, _ in sorted_items if item_id in model.id_to_index]] = True
+    popular_rows, scores = model.popularity.top(limit - len(sorted_items), exclude)
+    return sorted_items + [(model.item_ids[i], float(score)) for i, score in zip(popular_rows.tolist(), scores.tolist())]
+
+
+def rerank_candidates(content_idx: np.ndarray, content_vals: np.ndarray, collab: dict, model,
+                      rows: np.ndarray, limit: int, allowed: np.ndarray = None) -> List[tuple]:
+    """Second stage: merge_hybrid's 60/40 blend over the candidates only
+
+    An item without a collaborative score can only make the list on content,
+    so the best `limit` content items plus the collaborative candidates give
+    the same top `limit` as blending every item.
+    """
+    if allowed is not None:
+        keep = allowed[content_idx]
+        content_idx, content_vals = content_idx[keep], content_vals[keep]
+        collab = allowed_collab(collab, model, allowed)
+    max_content = content_vals.max() if len(content_vals) else 0
+    content = content_vals / max_content * CONTENT_WEIGHT if max_content > 0 else content_vals * CONTENT_WEIGHT
+
+    max_collab = max(collab.values()) if collab else 1
+    collab_idx, collab_vals, extras = [], [], []
+    for item_id, score in collab.items():
+        normalized_score = (score / max_collab if max_collab > 0 else score) * COLLAB_WEIGHT
+        idx = model.id_to_index.get(item_id)
+        if idx is None:
+            extras.append((item_id, normalized_score))
+        else:
+            collab_idx.append(idx)
+            collab_vals.append(normalized_score)
+    collab_idx = np.asarray(collab_idx, dtype=np.int64)
+
+    best_content = content_idx[top_k(content, limit)]
+    candidates = np.union1d(best_content, collab_idx[~np.isin(collab_idx, rows)])
+    final = np.zeros(len(candidates), dtype=np.float32)
+    # content_idx is sorted, so each candidate's content score is one searchsorted away
+    pos = np.minimum(np.searchsorted(content_idx, candidates), max(len(content_idx) - 1, 0))
+    if len(content_idx):
+        final += np.where(content_idx[pos] == candidates, content[pos], 0)
+    np.add.at(final, np.searchsorted(candidates, collab_idx[np.isin(collab_idx, candidates)]),
+              np.asarray(collab_vals, dtype=np.float32)[np.isin(collab_idx, candidates)])
+
+    ranked = [(model.item_ids[candidates[i]], float(final[i])) for i in top_k(final, limit)]
+    if extras:
+        ranked = sorted(ranked + extras, key=lambda x: x[1], reverse=True)[:limit]
+    return ranked
@@ -0,0 +1,73 @@
+"""
+Multi-process Serving
+Runs the artifact builder (artifacts.py) in its own process and N uvicorn
+workers that attach to its output read-only, so CPU-bound scoring uses every
+core while the models exist once in memory:
+
+    python serve.py --workers 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+def run_builder(root: str, interval: float):
+    """Builder process entry point"""
+    from pymongo import MongoClient
+    from artifacts import ArtifactBuilder
+
+    logging.basicConfig(level=logging.INFO)
+    db = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/recohub")).recohub
+    ArtifactBuilder(db, root).run(interval)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=int(os.getenv("ML_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument('--artifact-dir', default=os.getenv("ML_ARTIFACT_DIR", "artifacts"))
+    parser.add_argument('--build-interval', type=float, default=float(os.getenv("ML_BUILD_INTERVAL_SECONDS", 30)),
+                        help='seconds between the builder\'s change checks')
+    parser.add_argument('--startup-timeout', type=float, default=600,
+                        help='seconds to wait for the first generation')
+    args = parser.parse_args()
+
+    # Inherited by the uvicorn worker processes
+    root = os.path.abspath(args.artifact_dir)
+    os.environ['ML_ARTIFACT_MODE'] = 'attach'
+    os.environ['ML_ARTIFACT_DIR'] = root
+    os.environ['ML_WORKERS'] = str(args.workers)
+    if args.workers > 1 and os.getenv("RESULT_CACHE", "lru") != 'redis':
+        logger.warning("The in-process result cache can't be invalidated across %d workers; recommendations "
+                       "will not be cached. Set RESULT_CACHE=redis to cache them.", args.workers)
+
+    builder = multiprocessing.Process(target=run_builder, args=(root, args.build_interval),
+                                      name='ml-artifact-builder', daemon=True)
+    builder.start()
+    try:
+        from artifacts import SharedArtifacts
+
+        logger.info("Waiting for the first artifact generation in %s", root)
+        if not SharedArtifacts(root).wait(args.startup_timeout):
+            logger.error("No artifacts after %.0fs, giving up", args.startup_timeout)
+            sys.exit(1)
+
+        import uvicorn
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        builder.terminate()
+        builder.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Trending Engine
+Time-decayed popularity per content type, kept in a bounded top-N list so
+/api/trending answers from memory in O(limit)
+"""
+
+import bisect
+import heapq
+import math
+import os
+import threading
+import time
+from datetime import timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from content_model import CARD_FIELDS, COLLECTION_MAP
+
+
+class TrendingEngine:
+    """Exponentially decayed rating scores with incremental updates
+
+    Scores are stored relative to a fixed anchor time: a rating of weight w at
+    time t adds w * exp(decay * (t - anchor)). Older scores never need to be
+    decayed in place, since every item shares the same anchor factor.
+
+    Each (user, item) pair contributes once: an updated rating replaces the
+    pair's previous weight (as activity at the update time) and a deleted one
+    removes it. Weights from the last recompute are kept as sorted 64-bit pair
+    hashes, 16 bytes per rating, with a dict for pairs seen since. A score that
+    drops can leave an item in the top-N list that an untracked item now beats;
+    the periodic full recompute from db.ratings fixes that, moves the anchor
+    forward and removes any other drift.
+    """
+
+    def __init__(self, db, half_life_hours: Optional[float] = None, top_n: Optional[int] = None,
+                 recompute_seconds: Optional[float] = None):
+        self.db = db
+        if half_life_hours is None:
+            half_life_hours = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 72))
+        self.decay = math.log(2) / (half_life_hours * 3600)
+        self.top_n = top_n or int(os.getenv("TRENDING_TOP_N", 200))
+        if recompute_seconds is None:
+            recompute_seconds = float(os.getenv("TRENDING_RECOMPUTE_SECONDS", 900))
+        self.recompute_seconds = recompute_seconds
+
+        self._anchor = time.time()
+        self._scores: Dict[str, Dict[str, float]] = {ct: {} for ct in COLLECTION_MAP}
+        # Sorted ascending by (-score, item_id), at most top_n entries
+        self._top: Dict[str, List[Tuple[float, str]]] = {ct: [] for ct in COLLECTION_MAP}
+        self._docs: Dict[str, Dict[str, dict]] = {ct: {} for ct in COLLECTION_MAP}
+        # Catalog order by ratingCount/averageRating, used to fill short lists
+        self._evergreen: Dict[str, List[dict]] = {ct: [] for ct in COLLECTION_MAP}
+        # Weight of every (user, item) pair: sorted hashes from the last recompute, newer pairs in a dict
+        self._pair_keys = np.zeros(0, dtype=np.int64)
+        self._pair_weights = np.zeros(0, dtype=np.float64)
+        self._recent_pairs: Dict[int, float] = {}
+        self._last_recompute = 0.0
+        self._recomputing = False
+        self._lock = threading.RLock()
+        self._stats = {'recomputes': 0, 'recomputeSeconds': 0.0, 'updates': 0}
+
+    def _weight(self, rating: float, timestamp: float) -> float:
+        return rating * math.exp(self.decay * (timestamp - self._anchor))
+
+    @staticmethod
+    def _pair_key(user_id, content_type: str, item_id: str) -> int:
+        return hash((str(user_id), content_type, item_id))
+
+    def _pair_weight(self, key: int) -> float:
+        """Weight the pair currently contributes, 0 if it never rated the item"""
+        if key in self._recent_pairs:
+            return self._recent_pairs[key]
+        pos = np.searchsorted(self._pair_keys, key)
+        if pos < len(self._pair_keys) and self._pair_keys[pos] == key:
+            return float(self._pair_weights[pos])
+        return 0.0
+
+    def recompute(self):
+        """Rebuild every score from db.ratings and re-anchor at the current time"""
+        started = time.perf_counter()
+        anchor = time.time()
+        scores = {ct: {} for ct in COLLECTION_MAP}
+        pair_keys, pair_weights = [], []
+        for rating in self.db.ratings.find(
+            {}, {'_id': 0, 'userId': 1, 'contentType': 1, 'contentId': 1, 'rating': 1, 'createdAt': 1, 'updatedAt': 1}
+        ):
+            # Same rule as the incremental path: the latest rating counts at its latest change
+            changed = rating.get('updatedAt') or rating.get('createdAt')
+            content_type = rating.get('contentType')
+            if changed is None or content_type not in scores:
+                continue
+            if changed.tzinfo is None:
+                # pymongo returns naive UTC datetimes
+                changed = changed.replace(tzinfo=timezone.utc)
+            item_id = str(rating['contentId'])
+            weight = rating['rating'] * math.exp(self.decay * (changed.timestamp() - anchor))
+            scores[content_type][item_id] = scores[content_type].get(item_id, 0.0) + weight
+            pair_keys.append(self._pair_key(rating.get('userId'), content_type, item_id))
+            pair_weights.append(weight)
+        pair_keys = np.asarray(pair_keys, dtype=np.int64)
+        order = np.argsort(pair_keys, kind='stable')
+        pair_keys, pair_weights = pair_keys[order], np.asarray(pair_weights, dtype=np.float64)[order]
+
+        tops, docs, evergreen = {}, {}, {}
+        for content_type, collection in COLLECTION_MAP.items():
+            best = heapq.nlargest(self.top_n, scores[content_type].items(), key=lambda x: x[1])
+            tops[content_type] = sorted((-score, item_id) for item_id, score in best)
+            docs[content_type] = self._fetch_docs(content_type, [item_id for item_id, _ in best])
+            evergreen[content_type] = [
+                dict(item, _id=str(item['_id']))
+                for item in self.db[collection].find({}, CARD_FIELDS).sort([
+                    ('ratingCount', -1),
+                    ('averageRating', -1)
+                ]).limit(self.top_n)
+            ]
+
+        with self._lock:
+            self._anchor = anchor
+            self._scores, self._top, self._docs, self._evergreen = scores, tops, docs, evergreen
+            self._pair_keys, self._pair_weights, self._recent_pairs = pair_keys, pair_weights, {}
+            self._last_recompute = time.time()
+            self._stats['recomputes'] += 1
+            self._stats['recomputeSeconds'] = time.perf_counter() - started
+
+    def _fetch_docs(self, content_type: str, item_ids: List[str]) -> Dict[str, dict]:
+        if not item_ids:
+            return {}
+        from bson import ObjectId
+        object_ids = [ObjectId(i) if ObjectId.is_valid(i) else i for i in item_ids]
+        return {
+            str(item['_id']): dict(item, _id=str(item['_id']))
+            for item in self.db[COLLECTION_MAP[content_type]].find({'_id': {'$in': object_ids}}, CARD_FIELDS)
+        }
+
+    def record_ratings(self, ratings: List[tuple], timestamp: Optional[float] = None):
+        """Apply (userId, contentType, contentId, rating) events; a rating of None is a deletion"""
+        timestamp = timestamp or time.time()
+        with self._lock:
+            for user_id, content_type, content_id, rating in ratings:
+                if content_type not in self._scores:
+                    continue
+                item_id = str(content_id)
+                key = self._pair_key(user_id, content_type, item_id)
+                weight = self._weight(float(rating), timestamp) if rating is not None else 0.0
+                delta = weight - self._pair_weight(key)
+                self._recent_pairs[key] = weight
+                scores = self._scores[content_type]
+                old = scores.get(item_id)
+                new = max((old or 0.0) + delta, 0.0)
+                scores[item_id] = new
+                self._update_top(content_type, item_id, old, new)
+                self._stats['updates'] += 1
+
+    def _update_top(self, content_type: str, item_id: str, old: Optional[float], new: float):
+        top = self._top[content_type]
+        if old is not None:
+            pos = bisect.bisect_left(top, (-old, item_id))
+            if pos < len(top) and top[pos] == (-old, item_id):
+                del top[pos]
+        if new <= 0:
+            return
+        if len(top) < self.top_n or (-new, item_id) < top[-1]:
+            bisect.insort(top, (-new, item_id))
+            if len(top) > self.top_n:
+                top.pop()
+
+    def maybe_recompute(self):
+        """Start a background recompute when the last one is too old"""
+        if self._recomputing or time.time() - self._last_recompute < self.recompute_seconds:
+            return
+        self._recomputing = True
+
+        def run():
+            try:
+                self.recompute()
+            finally:
+                self._recomputing = False
+
+        threading.Thread(target=run, name='trending-recompute', daemon=True).start()
+
+    def top(self, content_type: str, limit: int) -> List[dict]:
+        """Best items by current decayed score, filled up with catalog favourites"""
+        if self._last_recompute == 0:
+            # Only before the startup warm-up has computed the scores
+            self.recompute()
+        self.maybe_recompute()
+
+        with self._lock:
+            now_factor = math.exp(self.decay * (time.time() - self._anchor))
+            entries = self._top[content_type][:limit]
+            docs = self._docs[content_type]
+            missing = [item_id for _, item_id in entries if item_id not in docs]
+        if missing:
+            # Items that entered the top list since the last recompute
+            fetched = self._fetch_docs(content_type, missing)
+            with self._lock:
+                docs.update(fetched)
+
+        items = []
+        seen = set()
+        for neg_score, item_id in entries:
+            doc = docs.get(item_id)
+            if doc is not None:
+                items.append(dict(doc, trendingScore=round(-neg_score / now_factor, 3)))
+                seen.add(item_id)
+        for doc in self._evergreen[content_type]:
+            if len(items) >= limit:
+                break
+            if doc['_id'] not in seen:
+                items.append(dict(doc, trendingScore=0.0))
+        return items
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            'lastRecompute': self._last_recompute,
+            'tracked': {ct: len(scores) for ct, scores in self._scores.items()},
+        }
@@ -0,0 +1,50 @@
+"""
+Worker Pools
+Keeps blocking work off the event loop: CPU-heavy model work runs in a bounded
+thread pool, short Mongo reads run in the default I/O threadpool
+"""
+
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from starlette.concurrency import run_in_threadpool
+
+from instrumentation import call_profiled, current_trace
+
+MODEL_WORKERS = int(os.getenv("ML_MODEL_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Model builds and scoring; bounded so they can't take every thread from I/O
+model_executor = ThreadPoolExecutor(max_workers=MODEL_WORKERS, thread_name_prefix="ml-model")
+
+
+async def run_model_work(fn, *args, **kwargs):
+    """Run CPU-bound scoring or model building in the model pool
+
+    The call runs in a copy of the caller's context so stage timings and Mongo
+    commands are attributed to the request, and is profiled when it asked for it.
+    """
+    loop = asyncio.get_running_loop()
+    call = partial(fn, *args, **kwargs)
+    trace = current_trace.get()
+    if trace is not None and trace.profile:
+        call = partial(call_profiled, trace, call)
+    return await loop.run_in_executor(model_executor, contextvars.copy_context().run, call)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking pymongo call in the I/O threadpool"""
+    return await run_in_threadpool(fn, *args, **kwargs)
+
+
+def mongo_client_options() -> dict:
+    """Connection pool settings for MongoClient, tunable from the environment"""
+    return {
+        'maxPoolSize': int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+        'minPoolSize': int(os.getenv("MONGO_MIN_POOL_SIZE", 10)),
+        'maxIdleTimeMS': int(os.getenv("MONGO_MAX_IDLE_MS", 60000)),
+        'serverSelectionTimeoutMS': int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        'waitQueueTimeoutMS': int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+    }
@@ -0,0 +1,207 @@
+"""
+ALS Offline Evaluation
+Time-based holdout and hyperparameter sweep for the model in recommendations.py
+
+Trains every (rank, regParam, maxIter) combination on the older ratings, scores
+the newest ones, and reports RMSE, precision@k, NDCG@k and training wall time.
+Runs in Spark local mode on synthetic ratings unless --mongo is given:
+
+    spark-submit evaluate_als.py --ranks 8 16 32 --reg-params 0.01 0.05 0.1 --max-iters 5 10
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import col, collect_list, percentile_approx
+from pyspark.ml.evaluation import RegressionEvaluator
+from pyspark.mllib.evaluation import RankingMetrics
+
+from recommendations import MONGODB_URI, MONGO_CONNECTOR_PACKAGE, train_als_model
+
+def create_spark_session(master="local[*]", mongo=False):
+    """Local Spark session; scheduler pools let grid points train concurrently
+
+    With mongo=True the session gets the same connector package and input uri
+    as recommendations.create_spark_session, so recohub.ratings can be read.
+    """
+    builder = SparkSession.builder \
+        .appName("RecoHubALSEvaluation") \
+        .config("spark.master", master) \
+        .config("spark.scheduler.mode", "FAIR") \
+        .config("spark.sql.shuffle.partitions", "8")
+    if mongo:
+        builder = builder \
+            .config("spark.mongodb.input.uri", MONGODB_URI + "recohub.ratings") \
+            .config("spark.jars.packages", MONGO_CONNECTOR_PACKAGE)
+    return builder.getOrCreate()
+
+def synthetic_ratings(spark, users=2000, items=1000, ratings=100000, rank=8, seed=0):
+    """Low-rank ratings with popularity skew and timestamps spread over 180 days"""
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 1, (users, rank))
+    item_factors = rng.normal(0, 1, (items, rank))
+    user_ids = rng.integers(0, users, ratings)
+    item_ids = np.minimum(rng.zipf(1.3, ratings) - 1, items - 1)
+    affinity = np.einsum("ij,ij->i", user_factors[user_ids], item_factors[item_ids]) / np.sqrt(rank)
+    values = np.clip(np.round(3 + 1.2 * affinity + rng.normal(0, 0.5, ratings)), 1, 5)
+    timestamps = rng.uniform(0, 180 * 86400, ratings)
+
+    rows = {}
+    for u, i, r, t in zip(user_ids.tolist(), item_ids.tolist(), values.tolist(), timestamps.tolist()):
+        rows[(u, i)] = (u, i, float(r), float(t))
+    return spark.createDataFrame(list(rows.values()), ["userId", "itemId", "rating", "timestamp"])
+
+def mongo_ratings(spark):
+    """Ratings from MongoDB mapped onto the persisted ALS indices"""
+    from recommendations import load_ratings_from_mongodb, build_id_mappings
+
+    ratings = load_ratings_from_mongodb(spark)
+    user_map, item_map, _, _ = build_id_mappings(spark, ratings)
+    return ratings \
+        .select(col("userId_str").alias("userId"), col("contentId_str").alias("contentId"), "rating",
+                col("updatedAt").cast("double").alias("timestamp")) \
+        .join(user_map, "userId") \
+        .join(item_map.select("itemIndex", "contentId"), "contentId") \
+        .select(col("userIndex").alias("userId"), col("itemIndex").alias("itemId"),
+                col("rating").cast("float"), "timestamp")
+
+def time_split(ratings_df, test_fraction=0.2):
+    """Everything before the (1 - test_fraction) time quantile trains, the rest tests"""
+    cutoff = ratings_df.agg(percentile_approx("timestamp", 1 - test_fraction).alias("cutoff")).first()["cutoff"]
+    train = ratings_df.where(col("timestamp") < cutoff).cache()
+    test = ratings_df.where(col("timestamp") >= cutoff).cache()
+    return train, test
+
+def ranking_metrics(model, train, test, k, relevant_rating):
+    """precision@k and NDCG@k over users with at least one relevant held-out item
+
+    Items the user already rated in the training window are never counted as
+    recommendations, so they are dropped from the top list before truncating to k.
+    """
+    relevant = test.where(col("rating") >= relevant_rating) \
+        .groupBy("userId").agg(collect_list("itemId").alias("relevant"))
+    seen = train.groupBy("userId").agg(collect_list("itemId").alias("seen"))
+    max_seen = seen.selectExpr("max(size(seen))").first()[0] or 0
+
+    recommended = model.recommendForUserSubset(relevant.select("userId"), k + max_seen) \
+        .join(relevant, "userId") \
+        .join(seen, "userId", "left")
+
+    def unseen_top_k(row):
+        seen_items = set(row["seen"] or [])
+        return [r["itemId"] for r in row["recommendations"] if r["itemId"] not in seen_items][:k], row["relevant"]
+
+    pairs = recommended.rdd.map(unseen_top_k)
+    if pairs.isEmpty():
+        return None, None
+    metrics = RankingMetrics(pairs)
+    return metrics.precisionAt(k), metrics.ndcgAt(k)
+
+def evaluate_config(train, test, rank, reg_param, max_iter, k, relevant_rating):
+    """Train one grid point and score it on the holdout"""
+    started = time.perf_counter()
+    model = train_als_model(train, rank=rank, max_iter=max_iter, reg_param=reg_param)
+    # ALS is lazy about its factors; materialise them so the timing covers training
+    model.userFactors.count()
+    train_seconds = time.perf_counter() - started
+
+    predictions = model.transform(test)
+    rmse = RegressionEvaluator(metricName="rmse", labelCol="rating", predictionCol="prediction") \
+        .evaluate(predictions)
+    precision, ndcg = ranking_metrics(model, train, test, k, relevant_rating)
+    return {
+        "rank": rank,
+        "regParam": reg_param,
+        "maxIter": max_iter,
+        "rmse": rmse,
+        f"precision@{k}": precision,
+        f"ndcg@{k}": ndcg,
+        "trainSeconds": round(train_seconds, 3),
+        "evalSeconds": round(time.perf_counter() - started - train_seconds, 3),
+    }
+
+def evaluate_in_pool(train, *args):
+    """evaluate_config with this thread's jobs in their own FAIR scheduler pool"""
+    train.sparkSession.sparkContext.setLocalProperty("spark.scheduler.pool", threading.current_thread().name)
+    return evaluate_config(train, *args)
+
+def run_grid(train, test, ranks, reg_params, max_iters, k=10, relevant_rating=4.0, parallelism=2):
+    """Evaluate the grid with up to `parallelism` Spark jobs in flight, one scheduler pool per thread"""
+    grid = list(product(ranks, reg_params, max_iters))
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="als-grid") as pool:
+        futures = [
+            pool.submit(evaluate_in_pool, train, test, rank, reg_param, max_iter, k, relevant_rating)
+            for rank, reg_param, max_iter in grid
+        ]
+        return [future.result() for future in futures]
+
+def cheapest_acceptable(results, k, max_rmse=None, min_ndcg=None):
+    """Fastest-training configuration that meets the quality thresholds"""
+    acceptable = [
+        r for r in results
+        if (max_rmse is None or r["rmse"] <= max_rmse)
+        and (min_ndcg is None or (r[f"ndcg@{k}"] or 0) >= min_ndcg)
+    ]
+    return min(acceptable, key=lambda r: r["trainSeconds"], default=None)
+
+def print_results(results, k):
+    print(f"{'rank':>5} {'reg':>7} {'iter':>5} {'rmse':>7} {'p@' + str(k):>7} {'ndcg@' + str(k):>8} {'train s':>8}")
+    for r in sorted(results, key=lambda r: (r["rmse"], r["trainSeconds"])):
+        precision = r[f"precision@{k}"]
+        ndcg = r[f"ndcg@{k}"]
+        print(f"{r['rank']:>5} {r['regParam']:>7} {r['maxIter']:>5} {r['rmse']:>7.4f} "
+              f"{precision if precision is None else round(precision, 4)!s:>7} "
+              f"{ndcg if ndcg is None else round(ndcg, 4)!s:>8} {r['trainSeconds']:>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", action="store_true", help="evaluate on recohub.ratings instead of synthetic data")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--ratings", type=int, default=100000)
+    parser.add_argument("--ranks", type=int, nargs="+", default=[8, 16])
+    parser.add_argument("--reg-params", type=float, nargs="+", default=[0.01, 0.1])
+    parser.add_argument("--max-iters", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--relevant-rating", type=float, default=4.0)
+    parser.add_argument("--parallelism", type=int, default=2, help="grid points trained concurrently")
+    parser.add_argument("--max-rmse", type=float)
+    parser.add_argument("--min-ndcg", type=float)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    spark = create_spark_session(mongo=args.mongo)
+    try:
+        if args.mongo:
+            ratings = mongo_ratings(spark)
+        else:
+            ratings = synthetic_ratings(spark, args.users, args.items, args.ratings)
+        train, test = time_split(ratings, args.test_fraction)
+        print(f"Train: {train.count()} ratings, test: {test.count()} ratings")
+
+        results = run_grid(train, test, args.ranks, args.reg_params, args.max_iters,
+                           args.k, args.relevant_rating, args.parallelism)
+        print_results(results, args.k)
+
+        best = cheapest_acceptable(results, args.k, args.max_rmse, args.min_ndcg)
+        if best:
+            print(f"\nCheapest acceptable: rank={best['rank']} regParam={best['regParam']} "
+                  f"maxIter={best['maxIter']} ({best['trainSeconds']} s)")
+        else:
+            print("\nNo configuration met the quality thresholds")
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"results": results, "best": best, "args": vars(args)}, f, indent=2)
+    finally:
+        spark.stop()
+
+if __name__ == "__main__":
+    main()
@@ -4,116 +4,347 @@ Demonstrates big data processing on MongoDB data
 """
 
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, count, avg, max as spark_max, min as spark_min
+from pyspark.sql.functions import col, count, avg, explode, sum as spark_sum
+from pyspark import StorageLevel
+from pyspark.sql.types import (
+    StructType, StructField, StringType, IntegerType, LongType, DoubleType, ArrayType, TimestampType
+)
+from contextlib import contextmanager
+from datetime import datetime
+import argparse
+import os
+import time
 import pymongo
 import json
 
-def create_spark_session():
-    """Create Spark session"""
-    spark = SparkSession.builder \
+from recommendations import MONGO_CONNECTOR_PACKAGE
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+PARQUET_DIR = os.getenv("RECOHUB_PARQUET_DIR", "data/parquet")
+REPORT_DIR = os.getenv("RECOHUB_REPORT_DIR", "data/report")
+
+# Explicit schemas: no inference pass over the data, and executors emit rows directly
+SCHEMAS = {
+    "movies": StructType([
+        StructField("_id", StringType(), False),
+        StructField("title", StringType()),
+        StructField("genres", ArrayType(StringType())),
+        StructField("releaseYear", IntegerType()),
+        StructField("duration", IntegerType()),
+        StructField("director", StringType()),
+        StructField("language", StringType()),
+        StructField("averageRating", DoubleType()),
+        StructField("ratingCount", LongType()),
+    ]),
+    "songs": StructType([
+        StructField("_id", StringType(), False),
+        StructField("title", StringType()),
+        StructField("artist", StringType()),
+        StructField("album", StringType()),
+        StructField("genres", ArrayType(StringType())),
+        StructField("releaseYear", IntegerType()),
+        StructField("popularity", DoubleType()),
+        StructField("averageRating", DoubleType()),
+        StructField("ratingCount", LongType()),
+    ]),
+    "books": StructType([
+        StructField("_id", StringType(), False),
+        StructField("title", StringType()),
+        StructField("author", StringType()),
+        StructField("genres", ArrayType(StringType())),
+        StructField("publishYear", IntegerType()),
+        StructField("pages", IntegerType()),
+        StructField("averageRating", DoubleType()),
+        StructField("ratingCount", LongType()),
+    ]),
+    "ratings": StructType([
+        StructField("_id", StringType(), False),
+        StructField("userId", StringType()),
+        StructField("contentType", StringType()),
+        StructField("contentId", StringType()),
+        StructField("rating", DoubleType()),
+        StructField("createdAt", TimestampType()),
+    ]),
+}
+
+OBJECT_ID_FIELDS = ("_id", "userId", "contentId")
+OBJECT_ID_STRUCT = StructType([StructField("oid", StringType())])
+
+def create_spark_session(connector=False):
+    """Create Spark session; with connector=True it also loads the Mongo Spark connector"""
+    builder = SparkSession.builder \
         .appName("RecoHubDataProcessing") \
-        .config("spark.master", "local[*]") \
-        .getOrCreate()
-    return spark
-
-def load_data_from_mongodb():
-    """Load data from MongoDB using pymongo (simpler than Spark connector)"""
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client.recohub
-    
-    # Load collections
-    movies = list(db.movies.find({}, {"_id": 0}))
-    songs = list(db.songs.find({}, {"_id": 0}))
-    books = list(db.books.find({}, {"_id": 0}))
-    ratings = list(db.ratings.find({}, {"_id": 0}))
+        .config("spark.master", os.getenv("SPARK_MASTER", "local[*]"))
+    if connector:
+        builder = builder \
+            .config("spark.mongodb.input.uri", MONGODB_URI + "recohub") \
+            .config("spark.jars.packages", MONGO_CONNECTOR_PACKAGE)
+    return builder.getOrCreate()
+
+def compute_id_ranges(collection, num_partitions):
+    """Split a collection into contiguous _id ranges of roughly equal size"""
+    buckets = list(collection.aggregate([
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": num_partitions}}
+    ], allowDiskUse=True))
+    # [lower, upper) bounds; the first and last range are open-ended
+    bounds = [None] + [bucket["_id"]["min"] for bucket in buckets[1:]] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def to_spark_value(value, data_type):
+    """Coerce a BSON value to the Python type Spark expects for a schema field"""
+    if value is None:
+        return None
+    if isinstance(data_type, StringType):
+        return str(value)
+    if isinstance(data_type, (IntegerType, LongType)):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if isinstance(data_type, DoubleType):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if isinstance(data_type, ArrayType):
+        return [str(v) for v in value] if isinstance(value, list) else None
+    return value
+
+def read_id_range(uri, collection_name, schema_json, id_range, batch_size):
+    """Executor-side reader: stream one _id range with a cursor, yielding schema rows"""
+    import pymongo
+    from pyspark.sql.types import StructType
+
+    schema = StructType.fromJson(json.loads(schema_json))
+    lower, upper = id_range
+    id_filter = {}
+    if lower is not None:
+        id_filter["$gte"] = lower
+    if upper is not None:
+        id_filter["$lt"] = upper
+    query = {"_id": id_filter} if id_filter else {}
+    projection = {field.name: 1 for field in schema.fields}
+
+    client = pymongo.MongoClient(uri)
+    try:
+        cursor = client.recohub[collection_name].find(query, projection).batch_size(batch_size)
+        for doc in cursor:
+            yield tuple(to_spark_value(doc.get(field.name), field.dataType) for field in schema.fields)
+    finally:
+        client.close()
+
+def read_collection_partitioned(spark, collection_name, num_partitions, batch_size=5000):
+    """Read a collection as num_partitions _id-range tasks; the driver only sees range bounds"""
+    client = pymongo.MongoClient(MONGODB_URI)
+    try:
+        ranges = compute_id_ranges(client.recohub[collection_name], num_partitions)
+    finally:
+        client.close()
+
+    schema = SCHEMAS[collection_name]
+    schema_json = schema.json()
+    uri = MONGODB_URI
+    rdd = spark.sparkContext.parallelize(ranges, len(ranges)).flatMap(
+        lambda id_range: read_id_range(uri, collection_name, schema_json, id_range, batch_size)
+    )
+    return spark.createDataFrame(rdd, schema)
+
+def read_collection_connector(spark, collection_name):
+    """Read a collection with the Mongo Spark connector and an explicit schema"""
+    schema = SCHEMAS[collection_name]
+    # The connector maps ObjectIds to struct<oid>; flatten them to the hex strings used elsewhere
+    source_schema = StructType([
+        StructField(f.name, OBJECT_ID_STRUCT) if f.name in OBJECT_ID_FIELDS else f
+        for f in schema.fields
+    ])
+    df = spark.read.format("mongo") \
+        .option("uri", MONGODB_URI) \
+        .option("database", "recohub") \
+        .option("collection", collection_name) \
+        .schema(source_schema) \
+        .load()
+    return df.select([
+        col(f"{f.name}.oid").alias(f.name) if f.name in OBJECT_ID_FIELDS else col(f.name)
+        for f in schema.fields
+    ])
+
+def ingest_to_parquet(spark, reader="ranges", num_partitions=16, parquet_dir=PARQUET_DIR):
+    """Land every collection as Parquet so later runs scan columnar files"""
+    for collection_name in SCHEMAS:
+        print(f"📥 Ingesting {collection_name} ({reader} reader)...")
+        if reader == "connector":
+            df = read_collection_connector(spark, collection_name)
+        else:
+            df = read_collection_partitioned(spark, collection_name, num_partitions)
+        df.write.mode("overwrite").parquet(os.path.join(parquet_dir, collection_name))
+
+def load_data(spark, parquet_dir=PARQUET_DIR):
+    """Open the Parquet datasets written by ingest_to_parquet"""
+    return tuple(
+        spark.read.schema(SCHEMAS[name]).parquet(os.path.join(parquet_dir, name))
+        for name in ("movies", "songs", "books", "ratings")
+    )
+
+class StageTimer:
+    """Wall-clock seconds per named stage"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 3)
+
+# (dataset, sort column for the top list, columns shown in the top list)
+CATALOG_REPORTS = [
+    ("movies", "averageRating", ["title", "averageRating", "ratingCount"]),
+    ("songs", "popularity", ["title", "artist", "popularity"]),
+    ("books", "averageRating", ["title", "author", "averageRating"]),
+]
+
+def catalog_report(df, sort_column, top_columns):
+    """Summary, top items and per-genre averages for one catalog, one aggregation each"""
+    summary = df.agg(
+        count("*").alias("total"),
+        avg("averageRating").alias("avgRating"),
+        spark_sum("ratingCount").alias("totalRatings"),
+    ).first().asDict()
+    if not summary["total"]:
+        return {"summary": summary, "top": [], "genres": []}
     
-    # Convert ObjectId to string for JSON serialization
-    def convert_ids(docs):
-        for doc in docs:
-            if 'userId' in doc:
-                doc['userId'] = str(doc['userId'])
-            if 'contentId' in doc:
-                doc['contentId'] = str(doc['contentId'])
-        return docs
+    top = [row.asDict() for row in df.orderBy(col(sort_column).desc_nulls_last()).select(*top_columns).limit(5).collect()]
+    genres = [
+        row.asDict()
+        for row in df.select(explode("genres").alias("genre"), "averageRating")
+            .groupBy("genre")
+            .agg(count("*").alias("count"), avg("averageRating").alias("avgRating"))
+            .orderBy(col("count").desc())
+            .collect()
+    ]
+    return {"summary": summary, "top": top, "genres": genres}
+
+def ratings_report(df):
+    """Distribution and per-type averages from a single (contentType, rating) aggregation"""
+    cells = df.where(col("rating").isNotNull()).groupBy("contentType", "rating").agg(count("*").alias("count")).collect()
     
-    ratings = convert_ids(ratings)
+    distribution, by_type = {}, {}
+    for row in cells:
+        distribution[row["rating"]] = distribution.get(row["rating"], 0) + row["count"]
+        total, weighted = by_type.get(row["contentType"], (0, 0.0))
+        by_type[row["contentType"]] = (total + row["count"], weighted + row["rating"] * row["count"])
     
-    return movies, songs, books, ratings
+    return {
+        "total": sum(distribution.values()),
+        "distribution": [{"rating": r, "count": distribution[r]} for r in sorted(distribution)],
+        "byContentType": [
+            {"contentType": ct, "count": total, "avgRating": weighted / total}
+            for ct, (total, weighted) in sorted(by_type.items())
+        ],
+    }
 
-def process_with_spark(spark, movies, songs, books, ratings):
-    """Process data using Spark"""
+def print_report(report):
+    """Console summary of the analytics report"""
     print("\n" + "="*50)
     print("Processing Data with Apache Spark")
     print("="*50 + "\n")
     
-    # Create DataFrames from Python lists
-    if movies:
-        movies_df = spark.createDataFrame(movies)
-        print("📽️  MOVIES ANALYSIS")
+    headings = {"movies": "📽️  MOVIES ANALYSIS", "songs": "🎵 SONGS ANALYSIS", "books": "📚 BOOKS ANALYSIS"}
+    for name, heading in headings.items():
+        section = report[name]
+        print(heading)
         print("-" * 50)
-        print(f"Total Movies: {movies_df.count()}")
-        
-        if movies_df.count() > 0:
-            print("\nAverage Rating by Genre:")
-            # Flatten genres and calculate average rating
-            movies_df.select("genres", "averageRating").show(truncate=False)
-            
-            print("\nTop Rated Movies:")
-            movies_df.orderBy(col("averageRating").desc()).select("title", "averageRating", "ratingCount").show(5)
+        print(f"Total {name.capitalize()}: {section['summary']['total']}")
+        for genre in section["genres"][:10]:
+            print(f"  {genre['genre']:<20} {genre['count']:>8}  avg {genre['avgRating'] or 0:.2f}")
+        print("Top 5:")
+        for item in section["top"]:
+            print("  " + ", ".join(f"{k}={v}" for k, v in item.items()))
+        print()
     
-    if songs:
-        songs_df = spark.createDataFrame(songs)
-        print("\n🎵 SONGS ANALYSIS")
-        print("-" * 50)
-        print(f"Total Songs: {songs_df.count()}")
-        
-        if songs_df.count() > 0:
-            print("\nTop Popular Songs:")
-            songs_df.orderBy(col("popularity").desc()).select("title", "artist", "popularity").show(5)
+    ratings = report["ratings"]
+    print("⭐ RATINGS ANALYSIS")
+    print("-" * 50)
+    print(f"Total Ratings: {ratings['total']}")
+    for bucket in ratings["distribution"]:
+        print(f"  rating {bucket['rating']}: {bucket['count']}")
+    for row in ratings["byContentType"]:
+        print(f"  {row['contentType']:<8} avg {row['avgRating']:.2f} ({row['count']} ratings)")
     
-    if books:
-        books_df = spark.createDataFrame(books)
-        print("\n📚 BOOKS ANALYSIS")
-        print("-" * 50)
-        print(f"Total Books: {books_df.count()}")
-        
-        if books_df.count() > 0:
-            print("\nTop Rated Books:")
-            books_df.orderBy(col("averageRating").desc()).select("title", "author", "averageRating").show(5)
-    
-    if ratings:
-        ratings_df = spark.createDataFrame(ratings)
-        print("\n⭐ RATINGS ANALYSIS")
-        print("-" * 50)
-        print(f"Total Ratings: {ratings_df.count()}")
-        
-        if ratings_df.count() > 0:
-            print("\nRating Distribution:")
-            ratings_df.groupBy("rating").agg(count("*").alias("count")).orderBy("rating").show()
-            
-            print("\nAverage Rating by Content Type:")
-            ratings_df.groupBy("contentType").agg(avg("rating").alias("avg_rating")).show()
+    print("\nStage timings (s):")
+    for name, seconds in report["timings"].items():
+        print(f"  {name:<20} {seconds}")
     
     print("\n" + "="*50)
     print("✅ Spark Processing Complete!")
     print("="*50 + "\n")
 
+def process_with_spark(spark, movies_df, songs_df, books_df, ratings_df, output_dir=REPORT_DIR, timer=None):
+    """Build the analytics report over persisted DataFrames and write it as JSON"""
+    timer = timer or StageTimer()
+    datasets = {"movies": movies_df, "songs": songs_df, "books": books_df, "ratings": ratings_df}
+    
+    # Each dataset is scanned from Parquet once; the follow-up queries read the cached copy
+    with timer.stage("cache"):
+        for df in datasets.values():
+            df.persist(StorageLevel.MEMORY_AND_DISK)
+    
+    report = {}
+    try:
+        for name, sort_column, top_columns in CATALOG_REPORTS:
+            with timer.stage(name):
+                report[name] = catalog_report(datasets[name], sort_column, top_columns)
+        with timer.stage("ratings"):
+            report["ratings"] = ratings_report(ratings_df)
+    finally:
+        for df in datasets.values():
+            df.unpersist()
+    
+    report["generatedAt"] = datetime.utcnow().isoformat() + "Z"
+    report["timings"] = timer.timings
+    with timer.stage("write"):
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "report.json"), "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        for name, _, _ in CATALOG_REPORTS:
+            if report[name]["genres"]:
+                spark.createDataFrame(report[name]["genres"]).write.mode("overwrite") \
+                    .parquet(os.path.join(output_dir, f"{name}_genres"))
+    
+    print_report(report)
+    return report
+
 def main():
     """Main execution"""
+    parser = argparse.ArgumentParser(description="RecoHub Spark data processing")
+    parser.add_argument("--skip-ingest", action="store_true",
+                        help="reuse the Parquet files from a previous run")
+    parser.add_argument("--reader", choices=["ranges", "connector"], default="ranges",
+                        help="_id-range pymongo reader or the Mongo Spark connector")
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--parquet-dir", default=PARQUET_DIR)
+    parser.add_argument("--report-dir", default=REPORT_DIR)
+    args = parser.parse_args()
+    
     print("🚀 Starting RecoHub Big Data Processing")
     
     # Create Spark session
-    spark = create_spark_session()
+    spark = create_spark_session(connector=args.reader == "connector" and not args.skip_ingest)
+    timer = StageTimer()
     
     try:
-        # Load data from MongoDB
-        print("📥 Loading data from MongoDB...")
-        movies, songs, books, ratings = load_data_from_mongodb()
+        # Stream MongoDB into Parquet on the executors
+        if not args.skip_ingest:
+            with timer.stage("ingest"):
+                ingest_to_parquet(spark, args.reader, args.partitions, args.parquet_dir)
         
-        print(f"Loaded: {len(movies)} movies, {len(songs)} songs, {len(books)} books, {len(ratings)} ratings")
+        movies_df, songs_df, books_df, ratings_df = load_data(spark, args.parquet_dir)
         
         # Process with Spark
-        process_with_spark(spark, movies, songs, books, ratings)
+        process_with_spark(spark, movies_df, songs_df, books_df, ratings_df, args.report_dir, timer)
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -125,4 +356,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -5,53 +5,154 @@ Processes large-scale ratings data for collaborative filtering
 
 from pyspark.sql import SparkSession
 from pyspark.ml.recommendation import ALS
-from pyspark.ml.feature import StringIndexer
-from pyspark.sql.functions import col, explode
+from pyspark.sql.functions import col, explode, collect_list, struct, current_timestamp, sort_array, \
+    max as spark_max, length
+from pyspark.sql.types import StructType, StructField, StringType, IntegerType, FloatType, ArrayType
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import shutil
+import numpy as np
 import pymongo
 
+MONGODB_URI = "mongodb://localhost:27017/"
+MONGO_CONNECTOR_PACKAGE = "org.mongodb.spark:mongo-spark-connector_2.12:3.0.1"
+
+# Number of items kept per user; served per content type by ml-api
+NUM_RECOMMENDATIONS = 50
+
+# ALS hyperparameters; spark/evaluate_als.py sweeps them on a time-based holdout
+RANK = int(os.getenv("ALS_RANK", 10))
+MAX_ITER = int(os.getenv("ALS_MAX_ITER", 10))
+REG_PARAM = float(os.getenv("ALS_REG_PARAM", 0.01))
+
+# Saved factors per published version: <ALS_MODEL_DIR>/v<version>/{userFactors,itemFactors}
+ALS_MODEL_DIR = os.getenv("ALS_MODEL_DIR", "data/als")
+
+# Factor export for ml-api (ALS_FACTORS_DIR there): <ALS_EXPORT_DIR>/v<version>/*.npy plus a CURRENT file
+ALS_EXPORT_DIR = os.getenv("ALS_EXPORT_DIR", "data/als_export")
+
+# Pointer document naming the live recommendations collection (read by ml-api)
+STATE_COLLECTION = "als_state"
+RECOMMENDATIONS_PREFIX = "recommendations_v"
+# Published versions kept alive so in-flight readers of the previous one never see it vanish
+KEEP_VERSIONS = 2
+
+# Incremental runs fall back to a full retrain when this share of users changed
+MAX_INCREMENTAL_FRACTION = float(os.getenv("ALS_MAX_INCREMENTAL_FRACTION", 0.3))
+# Above this many changed users, their histories are read with a full scan instead of an $in match
+MAX_IN_MATCH_USERS = 10000
+
+USER_MAP_SCHEMA = StructType([
+    StructField("userIndex", IntegerType()),
+    StructField("userId", StringType()),
+])
+ITEM_MAP_SCHEMA = StructType([
+    StructField("itemIndex", IntegerType()),
+    StructField("contentId", StringType()),
+    StructField("contentType", StringType()),
+])
+FACTORS_SCHEMA = StructType([
+    StructField("id", IntegerType()),
+    StructField("features", ArrayType(FloatType())),
+])
+RECOMMENDATIONS_SCHEMA = StructType([
+    StructField("userId", IntegerType()),
+    StructField("recommendations", ArrayType(StructType([
+        StructField("itemId", IntegerType()),
+        StructField("rating", FloatType()),
+    ]))),
+])
+
 def create_spark_session():
     """Create Spark session with MongoDB connector"""
     spark = SparkSession.builder \
         .appName("RecoHubRecommendations") \
-        .config("spark.mongodb.input.uri", "mongodb://localhost:27017/recohub.ratings") \
-        .config("spark.mongodb.output.uri", "mongodb://localhost:27017/recohub.recommendations") \
-        .config("spark.jars.packages", "org.mongodb.spark:mongo-spark-connector_2.12:3.0.1") \
+        .config("spark.mongodb.input.uri", MONGODB_URI + "recohub.ratings") \
+        .config("spark.mongodb.output.uri", MONGODB_URI + "recohub.recommendations") \
+        .config("spark.jars.packages", MONGO_CONNECTOR_PACKAGE) \
         .getOrCreate()
     return spark
 
-def load_ratings_from_mongodb(spark):
-    """Load ratings from MongoDB"""
-    ratings = spark.read.format("mongo").load()
+def id_as_string(df, name):
+    """ObjectId columns arrive as struct<oid>; return the hex string either way"""
+    if isinstance(df.schema[name].dataType, StructType):
+        return col(f"{name}.oid")
+    return col(name).cast("string")
+
+def load_ratings_from_mongodb(spark, pipeline=None):
+    """Load ratings from MongoDB, optionally filtered server-side by an aggregation pipeline"""
+    reader = spark.read.format("mongo")
+    if pipeline:
+        reader = reader.option("pipeline", json.dumps(pipeline))
+    ratings = reader.load()
     
     # Convert ObjectId to string for indexing
-    ratings = ratings.withColumn("userId_str", col("userId").cast("string")) \
-                    .withColumn("contentId_str", col("contentId").cast("string"))
+    ratings = ratings.withColumn("userId_str", id_as_string(ratings, "userId")) \
+                    .withColumn("contentId_str", id_as_string(ratings, "contentId"))
     
     return ratings
 
-def prepare_ratings_for_als(ratings_df):
-    """Prepare ratings for ALS algorithm"""
-    # Index userId and contentId
-    user_indexer = StringIndexer(inputCol="userId_str", outputCol="userId_indexed")
-    content_indexer = StringIndexer(inputCol="contentId_str", outputCol="contentId_indexed")
-    
-    indexed = user_indexer.fit(ratings_df).transform(ratings_df)
-    indexed = content_indexer.fit(indexed).transform(indexed)
-    
-    # Select required columns for ALS
-    als_data = indexed.select(
-        col("userId_indexed").alias("userId"),
-        col("contentId_indexed").alias("itemId"),
-        col("rating").alias("rating")
+def load_id_map(spark, collection, schema):
+    """Read a persisted index -> id table (empty on the first run)"""
+    return spark.read.format("mongo") \
+        .option("database", "recohub") \
+        .option("collection", collection) \
+        .schema(schema) \
+        .load() \
+        .select(*schema.fieldNames())
+
+def extend_id_map(spark, id_map, ids_df, index_col, schema):
+    """Give ids not yet in id_map the next free indices; existing ids keep theirs
+
+    Returns (full map, new entries only).
+    """
+    offset = id_map.agg(spark_max(index_col)).first()[0]
+    offset = 0 if offset is None else offset + 1
+    id_col = ids_df.columns[0]
+    # Sorted so a recomputed partition hands out exactly the same indices
+    new_ids = ids_df.join(id_map.select(id_col), id_col, "left_anti").orderBy(id_col)
+    new_entries = spark.createDataFrame(
+        new_ids.rdd.zipWithIndex().map(lambda pair: (pair[1] + offset,) + tuple(pair[0])),
+        schema
+    ).cache()
+    return id_map.unionByName(new_entries), new_entries
+
+def build_id_mappings(spark, ratings_df):
+    """Stable index -> Mongo id tables: previously seen users and items keep their index
+
+    contentType travels with the item so ml-api can serve per content type.
+    """
+    user_ids = ratings_df.select(col("userId_str").alias("userId")).distinct()
+    item_ids = ratings_df.select(col("contentId_str").alias("contentId"), "contentType") \
+        .dropDuplicates(["contentId"])
+    user_map, new_users = extend_id_map(
+        spark, load_id_map(spark, "als_user_index", USER_MAP_SCHEMA), user_ids, "userIndex", USER_MAP_SCHEMA
     )
-    
-    return als_data, user_indexer, content_indexer
+    item_map, new_items = extend_id_map(
+        spark, load_id_map(spark, "als_item_index", ITEM_MAP_SCHEMA), item_ids, "itemIndex", ITEM_MAP_SCHEMA
+    )
+    return user_map.cache(), item_map.cache(), new_users, new_items
+
+def prepare_ratings_for_als(ratings_df, user_map, item_map):
+    """Map ratings onto the stable user and item indices used by ALS"""
+    return ratings_df \
+        .select(col("userId_str").alias("userId"), col("contentId_str").alias("contentId"), "rating") \
+        .join(user_map, "userId") \
+        .join(item_map.select("itemIndex", "contentId"), "contentId") \
+        .select(
+            col("userIndex").alias("userId"),
+            col("itemIndex").alias("itemId"),
+            col("rating").cast("float").alias("rating")
+        )
 
-def train_als_model(ratings_df):
+def train_als_model(ratings_df, rank=RANK, max_iter=MAX_ITER, reg_param=REG_PARAM):
     """Train ALS collaborative filtering model"""
     als = ALS(
-        maxIter=10,
-        regParam=0.01,
+        rank=rank,
+        maxIter=max_iter,
+        regParam=reg_param,
         userCol="userId",
         itemCol="itemId",
         ratingCol="rating",
@@ -62,45 +163,370 @@ def train_als_model(ratings_df):
     model = als.fit(ratings_df)
     return model
 
-def generate_recommendations(model, num_recommendations=10):
+def generate_recommendations(model, num_recommendations=NUM_RECOMMENDATIONS):
     """Generate recommendations for all users"""
     recommendations = model.recommendForAllUsers(num_recommendations)
     return recommendations
 
-def save_recommendations_to_mongodb(spark, recommendations_df):
-    """Save recommendations to MongoDB"""
-    recommendations_df.write \
+def map_recommendations_to_ids(recommendations_df, als_data, user_map, item_map):
+    """Turn ALS index output into one document per Mongo userId
+
+    Items the user already rated are dropped, and every item keeps its
+    contentType so the API can filter without another lookup.
+    """
+    exploded = recommendations_df.select(
+        col("userId").alias("userIndex"),
+        explode("recommendations").alias("rec")
+    ).select(
+        "userIndex",
+        col("rec.itemId").alias("itemIndex"),
+        col("rec.rating").alias("score")
+    )
+    rated = als_data.select(col("userId").alias("userIndex"), col("itemId").alias("itemIndex"))
+    exploded = exploded.join(rated, ["userIndex", "itemIndex"], "left_anti")
+    
+    return exploded \
+        .join(user_map, "userIndex") \
+        .join(item_map, "itemIndex") \
+        .groupBy("userId") \
+        .agg(sort_array(collect_list(struct(
+            col("score"), col("contentId"), col("contentType")
+        )), asc=False).alias("items")) \
+        .withColumn("generatedAt", current_timestamp())
+
+def save_to_mongodb(df, collection, mode="overwrite"):
+    """Write a DataFrame to a recohub collection"""
+    df.write \
         .format("mongo") \
-        .mode("overwrite") \
+        .mode(mode) \
         .option("database", "recohub") \
-        .option("collection", "recommendations") \
+        .option("collection", collection) \
         .save()
-    print("Recommendations saved to MongoDB")
 
-def main():
-    """Main execution function"""
-    print("Initializing Spark session...")
-    spark = create_spark_session()
+# ---------------------------------------------------------------------------
+# Versioned publishing
+# ---------------------------------------------------------------------------
+
+def read_state(db):
+    """Current pointer document, or None before the first publish"""
+    return db[STATE_COLLECTION].find_one({"_id": "current"})
+
+def latest_update(db):
+    """Newest ratings.updatedAt, read before loading so later writes are picked up next run"""
+    latest = db.ratings.find_one({}, {"updatedAt": 1}, sort=[("updatedAt", -1)])
+    return latest.get("updatedAt") if latest else None
+
+def rating_count_at(db, watermark):
+    """Ratings last changed at or before the watermark, stored with it to detect deletions"""
+    return db.ratings.count_documents({"updatedAt": {"$lte": watermark}}) if watermark else 0
+
+def deleted_since(db, state):
+    """Whether ratings that existed at the stored watermark have been deleted since
+
+    Updates and inserts only ever add ratings past the watermark, so the ratings
+    created at or before it must still number the stored ratingCount.
+    """
+    if state.get("ratingCount") is None:
+        return False
+    created_since = db.ratings.count_documents({
+        "updatedAt": {"$gt": state["watermark"]}, "createdAt": {"$gt": state["watermark"]}
+    })
+    return db.ratings.estimated_document_count() - created_since < state["ratingCount"]
+
+def prune_versions(directory, version):
+    """Remove v<N> directories that fall outside KEEP_VERSIONS"""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith("v") and name[1:].isdigit() and int(name[1:]) <= version - KEEP_VERSIONS:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def factors_path(version, side):
+    return os.path.join(ALS_MODEL_DIR, f"v{version}", side)
+
+def save_factors(user_factors, item_factors, version):
+    """Persist (id, features) factor tables so the next run can warm-start from them
+
+    The next run only reads this version, so older ones are pruned like the exports.
+    """
+    user_factors.select("id", "features").write.mode("overwrite").parquet(factors_path(version, "userFactors"))
+    item_factors.select("id", "features").write.mode("overwrite").parquet(factors_path(version, "itemFactors"))
+    prune_versions(ALS_MODEL_DIR, version)
+
+def load_factors(spark, version):
+    return (
+        spark.read.schema(FACTORS_SCHEMA).parquet(factors_path(version, "userFactors")),
+        spark.read.schema(FACTORS_SCHEMA).parquet(factors_path(version, "itemFactors")),
+    )
+
+def export_factors(user_factors, item_factors, user_map, item_map, version, rank, reg_param=REG_PARAM):
+    """Write factors and their id maps as .npy files that ml-api memory-maps
+
+    Item rows are ordered by content type so each type is one contiguous slice;
+    user rows are streamed to disk without collecting them on the driver.
+    CURRENT is replaced last, so ml-api only ever sees complete exports.
+    """
+    version_dir = f"v{version}"
+    path = os.path.join(ALS_EXPORT_DIR, version_dir)
+    os.makedirs(path, exist_ok=True)
+    
+    items = item_factors.join(item_map, item_factors.id == item_map.itemIndex) \
+        .orderBy("contentType", "itemIndex") \
+        .select("contentType", "contentId", "features") \
+        .collect()
+    np.save(os.path.join(path, "item_factors.npy"),
+            np.asarray([row["features"] for row in items], dtype=np.float32).reshape(len(items), rank))
+    # dtype=str sizes the fixed-width unicode column to the longest id
+    np.save(os.path.join(path, "item_ids.npy"), np.asarray([row["contentId"] for row in items], dtype=str))
+    type_offsets = {}
+    for row_number, row in enumerate(items):
+        start, _ = type_offsets.get(row["contentType"], (row_number, row_number))
+        type_offsets[row["contentType"]] = (start, row_number + 1)
+    
+    users = user_factors.join(user_map, user_factors.id == user_map.userIndex).select("userId", "features")
+    user_count = users.count()
+    # User ids are free strings: size the column to the longest one so none is truncated
+    id_length = max(users.agg(spark_max(length("userId"))).first()[0] or 1, 1)
+    user_matrix = np.lib.format.open_memmap(
+        os.path.join(path, "user_factors.npy"), mode="w+", dtype=np.float32, shape=(user_count, rank)
+    )
+    user_ids = np.lib.format.open_memmap(
+        os.path.join(path, "user_ids.npy"), mode="w+", dtype=f"<U{id_length}", shape=(user_count,)
+    )
+    for row_number, row in enumerate(users.toLocalIterator()):
+        user_matrix[row_number] = row["features"]
+        user_ids[row_number] = row["userId"]
+    user_matrix.flush()
+    user_ids.flush()
+    
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump({
+            "version": version,
+            "rank": rank,
+            "regParam": reg_param,
+            "generatedAt": datetime.now(timezone.utc).timestamp(),
+            "items": len(items),
+            "users": user_count,
+            "typeOffsets": type_offsets,
+        }, f)
+    current_tmp = os.path.join(ALS_EXPORT_DIR, "CURRENT.tmp")
+    with open(current_tmp, "w") as f:
+        f.write(version_dir)
+    os.replace(current_tmp, os.path.join(ALS_EXPORT_DIR, "CURRENT"))
+    
+    # Processes that still map an older export keep their open files after removal
+    prune_versions(ALS_EXPORT_DIR, version)
+    print(f"Exported factors to {path}")
+
+def publish_recommendations(db, recommendations_df, version, watermark, rating_count, mode, rank):
+    """Write recommendations_v<version>, index it, then swap the pointer in one update
+
+    Readers follow als_state.current.collection, so they move from one complete
+    version to the next without ever seeing a partially written collection.
+    """
+    collection = f"{RECOMMENDATIONS_PREFIX}{version}"
+    save_to_mongodb(recommendations_df, collection)
+    db[collection].create_index("userId")
+    
+    db[STATE_COLLECTION].replace_one({"_id": "current"}, {
+        "_id": "current",
+        "version": version,
+        "collection": collection,
+        "watermark": watermark,
+        "ratingCount": rating_count,
+        "mode": mode,
+        "rank": rank,
+        "publishedAt": datetime.now(timezone.utc),
+    }, upsert=True)
+    
+    for name in db.list_collection_names():
+        if name.startswith(RECOMMENDATIONS_PREFIX):
+            old_version = name[len(RECOMMENDATIONS_PREFIX):]
+            if old_version.isdigit() and int(old_version) <= version - KEEP_VERSIONS:
+                db.drop_collection(name)
+    print(f"Published {collection}")
+
+# ---------------------------------------------------------------------------
+# Incremental update: fold-in against the previous factors
+# ---------------------------------------------------------------------------
+
+def solve_fold_in(pairs, reg_param, rank):
+    """Least-squares factor for one row given fixed factors of the other side
+
+    Same objective as Spark's explicit ALS step: (F^T F + reg * n * I) x = F^T r.
+    """
+    pairs = [(features, rating) for features, rating in pairs if features is not None]
+    if not pairs:
+        return None
+    factors = np.asarray([features for features, _ in pairs], dtype=np.float64)
+    ratings = np.asarray([rating for _, rating in pairs], dtype=np.float64)
+    gram = factors.T @ factors + reg_param * len(pairs) * np.eye(rank)
+    return [float(x) for x in np.linalg.solve(gram, factors.T @ ratings)]
+
+def fold_in(spark, als_data, fixed_factors, key_col, other_col, rank, reg_param=REG_PARAM):
+    """Compute factors for every key_col value from its ratings and the other side's factors"""
+    grouped = als_data \
+        .join(fixed_factors.select(col("id").alias(other_col), "features"), other_col, "left") \
+        .groupBy(key_col) \
+        .agg(collect_list(struct("features", "rating")).alias("pairs"))
+    solved = grouped.rdd.map(lambda row: (
+        row[key_col],
+        solve_fold_in([(p["features"], p["rating"]) for p in row["pairs"]], reg_param, rank)
+    )).filter(lambda pair: pair[1] is not None)
+    return spark.createDataFrame(solved, FACTORS_SCHEMA)
+
+def score_users(spark, user_factors, als_data, item_factors, num_recommendations=NUM_RECOMMENDATIONS):
+    """Top items per user from a broadcast item factor matrix, in recommendForAllUsers' layout"""
+    rows = item_factors.collect()
+    size = max((row["id"] for row in rows), default=-1) + 1
+    rank = len(rows[0]["features"]) if rows else 0
+    matrix = np.zeros((size, rank), dtype=np.float32)
+    known = np.zeros(size, dtype=bool)
+    for row in rows:
+        matrix[row["id"]] = row["features"]
+        known[row["id"]] = True
+    matrix_b = spark.sparkContext.broadcast(matrix)
+    known_b = spark.sparkContext.broadcast(known)
+    
+    rated = als_data.groupBy("userId").agg(collect_list("itemId").alias("rated"))
+    users = user_factors.select(col("id").alias("userId"), "features").join(rated, "userId", "left")
+    
+    def top_items(row):
+        scores = matrix_b.value @ np.asarray(row["features"], dtype=np.float32)
+        scores[~known_b.value] = -np.inf
+        if row["rated"]:
+            scores[[i for i in row["rated"] if i < len(scores)]] = -np.inf
+        k = min(num_recommendations, int(np.isfinite(scores).sum()))
+        if k == 0:
+            return (row["userId"], [])
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return (row["userId"], [(int(i), float(scores[i])) for i in best])
     
+    return spark.createDataFrame(users.rdd.map(top_items), RECOMMENDATIONS_SCHEMA)
+
+def run_incremental(spark, db, state, delta, watermark, rating_count, total_users):
+    """Fold new ratings into the previous version; returns False if a full retrain is needed
+
+    Only ratings changed after the watermark are read, so deleted ratings are
+    invisible here: main() runs a full retrain instead when any were deleted.
+    """
+    changed_users = [row["userId_str"] for row in delta.select("userId_str").distinct().collect()]
+    if not changed_users:
+        print("No new ratings since the watermark; nothing to publish")
+        return True
+    if total_users and len(changed_users) > MAX_INCREMENTAL_FRACTION * total_users:
+        print(f"{len(changed_users)} of {total_users} users changed; running a full retrain instead")
+        return False
+    
+    # Full rating histories of the changed users: updated ratings replace old values
+    if len(changed_users) <= MAX_IN_MATCH_USERS:
+        history = load_ratings_from_mongodb(spark, [
+            {"$match": {"userId": {"$in": [{"$oid": user_id} for user_id in changed_users]}}}
+        ])
+    else:
+        history = load_ratings_from_mongodb(spark)
+    changed_df = spark.createDataFrame([(u,) for u in changed_users], ["userId_str"])
+    history = history.join(changed_df, "userId_str", "left_semi").cache()
+    
+    user_map, item_map, new_users, new_items = build_id_mappings(spark, history)
+    als_data = prepare_ratings_for_als(history, user_map, item_map).cache()
+    
+    previous_users, previous_items = load_factors(spark, state["version"])
+    rank = state["rank"]
+    
+    # New items first (from raters that already have factors), then the changed users
+    new_item_ratings = als_data.join(new_items.select(col("itemIndex").alias("itemId")), "itemId", "left_semi")
+    new_item_factors = fold_in(spark, new_item_ratings, previous_users, "itemId", "userId", rank)
+    item_factors = previous_items.unionByName(new_item_factors).cache()
+    changed_user_factors = fold_in(spark, als_data, item_factors, "userId", "itemId", rank).cache()
+    user_factors = previous_users \
+        .join(changed_user_factors.select("id"), "id", "left_anti") \
+        .unionByName(changed_user_factors)
+    
+    changed_recs = map_recommendations_to_ids(
+        score_users(spark, changed_user_factors, als_data, item_factors), als_data, user_map, item_map
+    )
+    # Users without new ratings keep their previous recommendations
+    previous_recs = spark.read.format("mongo") \
+        .option("database", "recohub") \
+        .option("collection", state["collection"]) \
+        .schema(changed_recs.schema) \
+        .load()
+    recommendations = previous_recs \
+        .join(changed_recs.select("userId"), "userId", "left_anti") \
+        .unionByName(changed_recs)
+    
+    version = state["version"] + 1
+    save_factors(user_factors, item_factors, version)
+    export_factors(spark.read.schema(FACTORS_SCHEMA).parquet(factors_path(version, "userFactors")),
+                   item_factors, user_map, item_map, version, rank)
+    save_to_mongodb(new_users, "als_user_index", mode="append")
+    save_to_mongodb(new_items, "als_item_index", mode="append")
+    publish_recommendations(db, recommendations, version, watermark, rating_count, "incremental", rank)
+    print(f"Folded in {len(changed_users)} users and {new_items.count()} new items")
+    return True
+
+def run_full(spark, db, state):
+    """Retrain ALS on every rating and publish a new version"""
     print("Loading ratings from MongoDB...")
-    ratings = load_ratings_from_mongodb(spark)
+    watermark = latest_update(db)
+    rating_count = rating_count_at(db, watermark)
+    ratings = load_ratings_from_mongodb(spark).cache()
     print(f"Loaded {ratings.count()} ratings")
     
     print("Preparing data for ALS...")
-    als_data, user_indexer, content_indexer = prepare_ratings_for_als(ratings)
+    user_map, item_map, new_users, new_items = build_id_mappings(spark, ratings)
+    als_data = prepare_ratings_for_als(ratings, user_map, item_map).cache()
     
     print("Training ALS model...")
     model = train_als_model(als_data)
     
     print("Generating recommendations...")
-    recommendations = generate_recommendations(model, num_recommendations=10)
+    recommendations = generate_recommendations(model)
+    recommendations = map_recommendations_to_ids(recommendations, als_data, user_map, item_map)
     
     print("Saving recommendations to MongoDB...")
-    save_recommendations_to_mongodb(spark, recommendations)
+    version = (state["version"] if state else 0) + 1
+    save_factors(model.userFactors, model.itemFactors, version)
+    export_factors(model.userFactors, model.itemFactors, user_map, item_map, version, model.rank)
+    save_to_mongodb(new_users, "als_user_index", mode="append")
+    save_to_mongodb(new_items, "als_item_index", mode="append")
+    publish_recommendations(db, recommendations, version, watermark, rating_count, "full", model.rank)
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="RecoHub ALS recommendations")
+    parser.add_argument("--full", action="store_true",
+                        help="retrain from all ratings instead of folding in ratings newer than the watermark")
+    args = parser.parse_args()
     
-    print("Processing complete!")
-    spark.stop()
+    print("Initializing Spark session...")
+    spark = create_spark_session()
+    client = pymongo.MongoClient(MONGODB_URI)
+    db = client.recohub
+    
+    try:
+        state = read_state(db)
+        done = False
+        if state and state.get("watermark") and not args.full:
+            if deleted_since(db, state):
+                print("Ratings were deleted since the last run; running a full retrain instead")
+            else:
+                print(f"Incremental update from version {state['version']} (watermark {state['watermark']})...")
+                watermark = latest_update(db)
+                rating_count = rating_count_at(db, watermark)
+                delta = load_ratings_from_mongodb(spark, [
+                    {"$match": {"updatedAt": {"$gt": {"$date": state["watermark"].isoformat() + "Z"}}}}
+                ]).cache()
+                done = run_incremental(spark, db, state, delta, watermark, rating_count,
+                                       db.als_user_index.estimated_document_count())
+        if not done:
+            run_full(spark, db, state)
+        print("Processing complete!")
+    finally:
+        client.close()
+        spark.stop()
 
 if __name__ == "__main__":
     main()
-